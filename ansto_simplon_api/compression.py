@@ -0,0 +1,233 @@
+import struct
+import time
+from typing import Literal
+
+import numpy.typing as npt
+
+# NOTE: Functions in this module are run by the worker processes of the
+# compression pool, so this module should only import what is needed to
+# compress a frame. Compression libraries are imported on first use to keep
+# the startup of the app fast
+
+# Default block size of bitshuffle [bytes], i.e. the block size used by
+# bitshuffle when block_size=0
+BSLZ4_DEFAULT_BLOCK_NBYTES = 8192
+
+# HDF5 filter id of bitshuffle, and the bitshuffle option for lz4 compression
+BITSHUFFLE_FILTER_ID = 32008
+BITSHUFFLE_LZ4 = 2
+
+
+def compress_frame(
+    frame: npt.NDArray,
+    compression: Literal["bslz4", "lz4", "none"],
+    block_size: int = 0,
+) -> bytes:
+    """
+    Compresses a single frame. The compressed blocks are returned without the
+    bytes-header of the Dectris stream (see `compression_header`)
+
+    Parameters
+    ----------
+    frame : npt.NDArray
+        A 2D array containing an uncompressed frame
+    compression : Literal["bslz4", "lz4", "none"]
+        Compression type
+    block_size : int, optional
+        Bitshuffle block size [number of elements] of bslz4 compressed frames.
+        Must be a multiple of 8. 0 uses the default block size of bitshuffle
+        (8192 bytes). lz4 compressed frames are made of a single block
+
+    Returns
+    -------
+    bytes
+        The compressed frame. If compression="none", the raw bytes of the frame
+
+    Raises
+    ------
+    NotImplementedError
+        If the compression algorithm is not bslz4, lz4 or none
+    ValueError
+        If the block size is not a multiple of 8
+    """
+    if compression.lower() == "bslz4":
+        import bitshuffle
+
+        if block_size % 8:
+            raise ValueError(
+                f"The bitshuffle block size must be a multiple of 8, not {block_size}"
+            )
+        return bitshuffle.compress_lz4(frame, block_size).tobytes()
+    elif compression.lower() == "lz4":
+        import lz4.block
+
+        data = frame.tobytes()
+        block = lz4.block.compress(data, store_size=False)
+        # As in the HDF5 LZ4 filter, blocks which do not compress are stored
+        # uncompressed
+        if len(block) >= len(data):
+            block = data
+        return struct.pack(">I", len(block)) + block
+    elif compression.lower() == "none":
+        return frame.tobytes()
+    raise NotImplementedError(
+        f"The allowed compression types are bslz4, lz4 and none, not {compression}"
+    )
+
+
+def compression_header(
+    compression: Literal["bslz4", "lz4"],
+    number_of_bytes: int,
+    element_size: int,
+    block_size: int = 0,
+) -> bytes:
+    """
+    Creates the bytes-header of a compressed frame, i.e. the number of bytes of
+    the uncompressed frame (int64) followed by the block size in bytes (int32),
+    both big-endian, as written by the HDF5 bitshuffle and LZ4 filters
+
+    Parameters
+    ----------
+    compression : Literal["bslz4", "lz4"]
+        Compression type
+    number_of_bytes : int
+        Number of bytes of the uncompressed frame
+    element_size : int
+        Number of bytes per pixel
+    block_size : int, optional
+        Bitshuffle block size [number of elements] used to compress the frame
+        (see `compress_frame`)
+
+    Returns
+    -------
+    bytes
+        The bytes-header
+    """
+    if compression.lower() == "lz4":
+        block_nbytes = number_of_bytes
+    elif block_size:
+        block_nbytes = block_size * element_size
+    else:
+        block_nbytes = BSLZ4_DEFAULT_BLOCK_NBYTES
+    return struct.pack(">qi", number_of_bytes, block_nbytes)
+
+
+def decompress_frame(
+    data: bytes,
+    compression: Literal["bslz4", "lz4", "none"],
+    dtype: npt.DTypeLike,
+    shape: tuple[int, int],
+) -> npt.NDArray:
+    """
+    Decompresses a single frame, i.e. the data of an image message
+
+    Parameters
+    ----------
+    data : bytes
+        The compressed frame. bslz4 and lz4 compressed frames start with the
+        bytes-header of the Dectris stream (see `compression_header`)
+    compression : Literal["bslz4", "lz4", "none"]
+        Compression type
+    dtype : npt.DTypeLike
+        Data type of the frame
+    shape : tuple[int, int]
+        Shape of the frame
+
+    Returns
+    -------
+    npt.NDArray
+        The uncompressed frame
+
+    Raises
+    ------
+    NotImplementedError
+        If the compression algorithm is not bslz4, lz4 or none
+    """
+    import numpy as np
+
+    dtype = np.dtype(dtype)
+    if compression.lower() in ("bslz4", "lz4"):
+        number_of_bytes, block_nbytes = struct.unpack_from(">qi", data)
+    if compression.lower() == "bslz4":
+        import bitshuffle
+
+        return bitshuffle.decompress_lz4(
+            np.frombuffer(data, dtype=np.uint8, offset=12),
+            shape,
+            dtype,
+            block_nbytes // dtype.itemsize,
+        )
+    elif compression.lower() == "lz4":
+        import lz4.block
+
+        frame = bytearray()
+        offset = 12
+        while len(frame) < number_of_bytes:
+            (compressed_nbytes,) = struct.unpack_from(">I", data, offset)
+            offset += 4
+            block = data[offset : offset + compressed_nbytes]
+            offset += compressed_nbytes
+            expected_nbytes = min(block_nbytes, number_of_bytes - len(frame))
+            if compressed_nbytes == expected_nbytes:
+                frame += block
+            else:
+                frame += lz4.block.decompress(block, uncompressed_size=expected_nbytes)
+        return np.frombuffer(frame, dtype=dtype).reshape(shape)
+    elif compression.lower() == "none":
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+    raise NotImplementedError(
+        f"The allowed compression types are bslz4, lz4 and none, not {compression}"
+    )
+
+
+def benchmark_codec(
+    frames: list[npt.NDArray],
+    compression: Literal["bslz4", "lz4", "none"],
+    block_size: int = 0,
+) -> dict:
+    """
+    Measures the compression ratio and the compression and decompression
+    throughput of a codec on the given frames
+
+    Parameters
+    ----------
+    frames : list[npt.NDArray]
+        The uncompressed frames
+    compression : Literal["bslz4", "lz4", "none"]
+        Compression type
+    block_size : int, optional
+        Bitshuffle block size [number of elements] (see `compress_frame`)
+
+    Returns
+    -------
+    dict
+        The compression ratio and the throughputs [MB/s of uncompressed data]
+    """
+    uncompressed_nbytes = sum(frame.nbytes for frame in frames)
+
+    t = time.perf_counter()
+    compressed_frames = [
+        compress_frame(frame, compression, block_size) for frame in frames
+    ]
+    compress_duration = time.perf_counter() - t
+    if compression.lower() != "none":
+        compressed_frames = [
+            compression_header(compression, frame.nbytes, frame.itemsize, block_size)
+            + compressed
+            for frame, compressed in zip(frames, compressed_frames)
+        ]
+
+    t = time.perf_counter()
+    for frame, compressed in zip(frames, compressed_frames):
+        decompress_frame(compressed, compression, frame.dtype, frame.shape)
+    decompress_duration = time.perf_counter() - t
+
+    return {
+        "compression": compression,
+        "block_size": block_size if compression.lower() == "bslz4" else None,
+        "number_of_frames": len(frames),
+        "compression_ratio": uncompressed_nbytes
+        / sum(len(compressed) for compressed in compressed_frames),
+        "compress_throughput": uncompressed_nbytes / compress_duration / 1e6,
+        "decompress_throughput": uncompressed_nbytes / decompress_duration / 1e6,
+    }
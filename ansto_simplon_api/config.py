@@ -1,7 +1,7 @@
 from functools import lru_cache
 from os.path import dirname as os_dirname, join as os_joinpath, realpath as os_realpath
 from pathlib import Path
-from typing import Annotated, Self
+from typing import Annotated, Literal, Self
 
 from pydantic import Field, FilePath, GetPydanticSchema, SecretStr
 from pydantic_settings import (
@@ -51,6 +51,38 @@ class ZMQStreamSettings(BaseSettings):
         title="ZMQ Address",
         default="tcp://*:5555",
     )
+    ZMQ_ADDRESSES: list[str] = Field(
+        title="ZMQ Addresses",
+        default=[],
+    )
+    ZMQ_IO_THREADS: int = Field(
+        title="ZMQ I/O Threads",
+        default=1,
+    )
+    ZMQ_DISTRIBUTION: Literal["round_robin", "image_id"] = Field(
+        title="ZMQ Distribution",
+        default="round_robin",
+    )
+    # High-water mark of each PUSH socket [messages]
+    ZMQ_SNDHWM: int = Field(
+        title="ZMQ Send High-Water Mark",
+        default=1000,
+    )
+    # Kernel send buffer size of each PUSH socket [bytes]. -1 uses the OS default
+    ZMQ_SNDBUF: int = Field(
+        title="ZMQ Send Buffer",
+        default=-1,
+    )
+    # Time pending messages are kept once a socket is closed [ms]. -1 keeps
+    # them until they are sent
+    ZMQ_LINGER: int = Field(
+        title="ZMQ Linger",
+        default=-1,
+    )
+    ZMQ_OVERFLOW_POLICY: Literal["block", "drop_newest", "drop_oldest"] = Field(
+        title="ZMQ Overflow Policy",
+        default="block",
+    )
     HDF5_MASTER_FILE: Annotated[
         str,
         GetPydanticSchema(lambda _, _h: _h.generate_schema(FilePath)),
@@ -64,10 +96,93 @@ class ZMQStreamSettings(BaseSettings):
         title="Delay Between Frames",
         default=0.01,
     )
+    PACE_WITH_FRAME_TIME: bool = Field(
+        title="Pace With Frame Time",
+        default=False,
+    )
+    PACING_POLICY: Literal["catch_up", "skip"] = Field(
+        title="Pacing Policy",
+        default="catch_up",
+    )
+    PACING_SPIN_THRESHOLD: float = Field(
+        title="Pacing Spin Threshold",
+        default=0.002,
+    )
     NUMBER_OF_DATA_FILES: int = Field(
         title="Number of Data Files",
         default=1,
     )
+    COMPRESSION_WORKERS: int = Field(
+        title="Compression Workers",
+        default=1,
+    )
+    # Bitshuffle block size [number of elements] of bslz4 compressed frames.
+    # Must be a multiple of 8. 0 uses the default block size of bitshuffle
+    # (8192 bytes)
+    BSLZ4_BLOCK_SIZE: int = Field(
+        title="Bslz4 Block Size",
+        default=0,
+        ge=0,
+        multiple_of=8,
+    )
+    DIRECT_CHUNK_READ: bool = Field(
+        title="Direct Chunk Read",
+        default=True,
+    )
+    FRAME_SOURCE: Literal["memory", "streaming"] = Field(
+        title="Frame Source",
+        default="memory",
+    )
+    STREAMING_PREFETCH_SIZE: int = Field(
+        title="Streaming Prefetch Size",
+        default=64,
+    )
+    DISK_CACHE_DIR: Path | None = Field(
+        title="Disk Cache Directory",
+        default=None,
+    )
+    DISK_CACHE_MAX_BYTES: int = Field(
+        title="Disk Cache Max Bytes",
+        default=50_000_000_000,
+    )
+    # Maximum size of the datasets kept in memory by the frame library. The
+    # active dataset is always kept, so 0 keeps only the active dataset
+    FRAME_CACHE_MAX_BYTES: int = Field(
+        title="Frame Cache Max Bytes",
+        default=0,
+    )
+    # Directory of the HDF5 files written by the filewriter. The filewriter
+    # cannot be enabled if it is not set
+    FILEWRITER_DIR: Path | None = Field(
+        title="Filewriter Directory",
+        default=None,
+    )
+    # Maximum number of images waiting to be written by the filewriter. Images
+    # are dropped from the files when the queue is full, so that the stream is
+    # never slowed down
+    FILEWRITER_QUEUE_SIZE: int = Field(
+        title="Filewriter Queue Size",
+        default=64,
+        gt=0,
+    )
+    SYNTHETIC_DETECTOR: Literal["1M", "4M", "9M", "16M", "32M"] | None = Field(
+        title="Synthetic Detector",
+        default=None,
+    )
+    SYNTHETIC_DTYPE: Literal["uint16", "uint32"] = Field(
+        title="Synthetic Data Type",
+        default="uint32",
+    )
+    SYNTHETIC_NUMBER_OF_FRAMES: int = Field(
+        title="Synthetic Number of Frames",
+        default=10,
+    )
+    # Maximum time [s] a detector configuration request waits for the master
+    # file to be read at startup
+    WARM_UP_METADATA_TIMEOUT: float = Field(
+        title="Warm-up Metadata Timeout",
+        default=30.0,
+    )
 
 
 class Settings(APISettings, ZMQStreamSettings):
@@ -0,0 +1,636 @@
+import logging
+import queue
+import struct
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+import numpy as np
+import numpy.typing as npt
+
+from .compression import decompress_frame
+
+if TYPE_CHECKING:
+    # h5py and hdf5plugin are imported when a series is written, to keep the
+    # startup of the app fast
+    import h5py
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s: %(message)s",
+    datefmt="%d-%m-%Y %H:%M:%S",
+)
+
+# (compression, dtype, shape, data) of the frame of an image message, where data
+# is the compressed frame including its bytes-header (see `compression_header`),
+# or the raw bytes of the frame if compression="none"
+FrameData = tuple[str, np.dtype, tuple[int, int], bytes]
+
+# Interval (in seconds) at which the writer thread checks if its series has
+# ended while its queue is empty
+_QUEUE_POLL_INTERVAL = 0.1
+
+
+def _data_group_name(channel: str) -> str:
+    """
+    Name of the group of a channel in the datafiles and the master file. The
+    threshold_1 frames are stored in /entry/data as by the detector, the frames
+    of the other channels in /entry/<channel>, so that the master file is
+    still loaded and streamed as a single-channel series by `Parse`
+    """
+    return "data" if channel == "threshold_1" else channel
+
+
+def write_master_file(
+    path: Path,
+    start_message: dict,
+    detector_configuration: dict,
+    compression: Literal["bslz4", "lz4", "none"],
+    data_files: list[str],
+    number_of_images: int,
+    channels: list[str],
+) -> None:
+    """
+    Writes a NeXus master file, i.e. the metadata of a series and external
+    links to its datafiles (/entry/data/data_000001, ...). The fields are laid
+    out as in the master files of the detector, so that the master file can
+    be loaded by `Parse` and streamed by the simulator. The frames of the
+    channels other than threshold_1 are linked from /entry/<channel>
+
+    Parameters
+    ----------
+    path : Path
+        Path of the master file
+    start_message : dict
+        The start message of the series
+    detector_configuration : dict
+        The detector configuration of the series (see DetectorConfiguration)
+    compression : Literal["bslz4", "lz4", "none"]
+        Compression of the frames stored in the datafiles
+    data_files : list[str]
+        Names of the datafiles, relative to the directory of the master file
+    number_of_images : int
+        Number of images of the series
+    channels : list[str]
+        Channels stored in the datafiles, e.g. ["threshold_1", "threshold_2"]
+
+    Returns
+    -------
+    None
+    """
+    import h5py
+
+    omega = start_message["goniometer"].get("omega", {"start": 0.0, "increment": 0.0})
+    with h5py.File(path, "w") as master_file:
+        entry = master_file.create_group("entry")
+        entry.attrs["NX_class"] = "NXentry"
+        for channel in channels:
+            group_name = _data_group_name(channel)
+            data = entry.create_group(group_name)
+            data.attrs["NX_class"] = "NXdata"
+            for ii, data_file in enumerate(data_files):
+                data[f"data_{ii + 1:06d}"] = h5py.ExternalLink(
+                    data_file, f"/entry/{group_name}/data"
+                )
+
+        instrument = entry.create_group("instrument")
+        instrument.attrs["NX_class"] = "NXinstrument"
+        beam = instrument.create_group("beam")
+        beam.attrs["NX_class"] = "NXbeam"
+        beam["incident_wavelength"] = start_message["incident_wavelength"]
+
+        detector = instrument.create_group("detector")
+        detector.attrs["NX_class"] = "NXdetector"
+        detector["beam_center_x"] = start_message["beam_center_x"]
+        detector["beam_center_y"] = start_message["beam_center_y"]
+        detector["count_time"] = start_message["count_time"]
+        detector["frame_time"] = start_message["frame_time"]
+        detector["description"] = start_message["detector_description"]
+        detector["detector_number"] = start_message["detector_serial_number"]
+        detector["sensor_material"] = start_message["sensor_material"]
+        detector["sensor_thickness"] = start_message["sensor_thickness"]
+        detector["x_pixel_size"] = start_message["pixel_size_x"]
+        detector["y_pixel_size"] = start_message["pixel_size_y"]
+        detector["threshold_energy"] = start_message["threshold_energy"]["threshold_1"]
+        if start_message["saturation_value"] is not None:
+            detector["saturation_value"] = start_message["saturation_value"]
+        detector["countrate_correction_applied"] = int(
+            start_message["countrate_correction_enabled"]
+        )
+        detector["flatfield_correction_applied"] = int(
+            start_message["flatfield_enabled"]
+        )
+        detector["pixel_mask_applied"] = int(start_message["pixel_mask_enabled"])
+        detector["virtual_pixel_correction_applied"] = int(
+            start_message["virtual_pixel_interpolation_enabled"]
+        )
+        detector["bit_depth_image"] = detector_configuration["detector_bit_depth_image"]
+        detector["bit_depth_readout"] = detector_configuration[
+            "detector_bit_depth_readout"
+        ]
+        detector["detector_readout_time"] = detector_configuration[
+            "detector_readout_time"
+        ]
+        detector["geometry/translation/distances"] = start_message[
+            "detector_translation"
+        ]
+
+        detector_specific = detector.create_group("detectorSpecific")
+        detector_specific["x_pixels_in_detector"] = start_message["image_size_x"]
+        detector_specific["y_pixels_in_detector"] = start_message["image_size_y"]
+        detector_specific["data_collection_date"] = str(start_message["arm_date"])
+        detector_specific["photon_energy"] = start_message["incident_energy"]
+        detector_specific["nimages"] = number_of_images
+        detector_specific["ntrigger"] = 1
+        detector_specific["compression"] = compression
+        detector_specific["countrate_correction_count_cutoff"] = detector_configuration[
+            "detector_countrate_correction_cutoff"
+        ]
+        detector_specific["software_version"] = detector_configuration[
+            "software_version"
+        ]
+        detector_specific["eiger_fw_version"] = detector_configuration[
+            "eiger_fw_version"
+        ]
+
+        sample = entry.create_group("sample")
+        sample.attrs["NX_class"] = "NXsample"
+        goniometer = sample.create_group("goniometer")
+        goniometer["omega"] = omega["start"] + omega["increment"] * np.arange(
+            number_of_images
+        )
+        goniometer["omega_range_average"] = omega["increment"]
+
+
+class FileWriter:
+    """
+    Writes the images of a series to HDF5 datafiles and a NeXus master file,
+    as done by the filewriter of the detector. The compressed frames sent
+    through the ZeroMQ stream are written with `write_direct_chunk`, i.e.
+    without decompressing and recompressing them.
+
+    Images are handed over to a background thread through a bounded queue
+    (see `write`), so writing files never slows down the stream: if the disk
+    cannot keep up, images are dropped from the files and counted in
+    `frames_dropped`. Every channel of the images is written, see
+    `write_master_file`.
+    """
+
+    def __init__(
+        self,
+        read_channels: Callable[[memoryview], dict[str, FrameData]],
+        directory: Path | None,
+        queue_size: int = 64,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        read_channels : Callable[[memoryview], dict[str, FrameData]]
+            Function which reads the compression, data type, shape and data of
+            the frame of each channel from the CBOR-encoded payload of an
+            image message
+        directory : Path | None
+            Directory the files are written to. If None, the filewriter cannot
+            be enabled
+        queue_size : int, optional
+            Maximum number of images waiting to be written
+
+        Returns
+        -------
+        None
+        """
+        self.read_channels = read_channels
+        self.directory = directory
+        self.queue_size = queue_size
+        self.mode: Literal["enabled", "disabled"] = "disabled"
+        self.compression_enabled = True
+        self.nimages_per_file = 1000
+        self.image_nr_start = 1
+        self.name_pattern = "series_$id"
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error: str | None = None
+        # Queue of the series being written, None if no series is written
+        self._queue: queue.Queue[memoryview] | None = None
+        # Set when the series being written has ended
+        self._series_ended: threading.Event | None = None
+        # Incremented by every series. Only the writer thread of the last
+        # series updates frames_written and error, while the threads of the
+        # previous series finish writing their files in the background
+        self._generation = 0
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def state(self) -> Literal["disabled", "ready", "acquire", "error"]:
+        """State of the filewriter"""
+        if self.error is not None:
+            return "error"
+        if self._threads and self._threads[-1].is_alive():
+            return "acquire"
+        return "ready" if self.mode == "enabled" else "disabled"
+
+    def set_mode(self, mode: Literal["enabled", "disabled"]) -> None:
+        """
+        Enables or disables the filewriter. Takes effect the next time the
+        detector is armed
+
+        Parameters
+        ----------
+        mode : Literal["enabled", "disabled"]
+            The mode
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the filewriter is enabled without a directory
+        """
+        if mode == "enabled" and self.directory is None:
+            raise ValueError(
+                "The filewriter directory is not set (see AS_FILEWRITER_DIR)"
+            )
+        self.mode = mode
+
+    def set_nimages_per_file(self, nimages_per_file: int) -> None:
+        """
+        Sets the maximum number of images per datafile
+
+        Parameters
+        ----------
+        nimages_per_file : int
+            Maximum number of images per datafile
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If nimages_per_file is not positive
+        """
+        if nimages_per_file < 1:
+            raise ValueError(
+                f"nimages_per_file must be at least 1, not {nimages_per_file}"
+            )
+        self.nimages_per_file = nimages_per_file
+
+    def set_name_pattern(self, name_pattern: str) -> None:
+        """
+        Sets the name pattern of the files, where $id is replaced by the series
+        id
+
+        Parameters
+        ----------
+        name_pattern : str
+            The name pattern, e.g. "series_$id"
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the name pattern is empty or is not a file name
+        """
+        if not name_pattern or Path(name_pattern).name != name_pattern:
+            raise ValueError(f"Invalid name pattern: {name_pattern!r}")
+        self.name_pattern = name_pattern
+
+    def list_files(self) -> list[str]:
+        """
+        Lists the files written by the filewriter
+
+        Returns
+        -------
+        list[str]
+            Names of the HDF5 files in the filewriter directory
+        """
+        if self.directory is None or not self.directory.is_dir():
+            return []
+        return sorted(path.name for path in self.directory.glob("*.h5"))
+
+    def start_series(
+        self, series_id: int, start_message: dict, detector_configuration: dict
+    ) -> None:
+        """
+        Starts writing a series on a background thread, if the filewriter is
+        enabled. The filewriter settings are captured when the series starts.
+        Never waits for the files of the previous series, which are finished
+        in the background (see `wait`)
+
+        Parameters
+        ----------
+        series_id : int
+            Series id, replaces $id in the name pattern
+        start_message : dict
+            The start message of the series
+        detector_configuration : dict
+            The detector configuration of the series
+
+        Returns
+        -------
+        None
+        """
+        self.end_series()
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        self._generation += 1
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error = None
+        if self.mode != "enabled" or self.directory is None:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        prefix = self.name_pattern.replace("$id", str(series_id))
+        logging.info(f"Writing series {series_id} to {self.directory / prefix}_*.h5")
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._series_ended = threading.Event()
+        thread = threading.Thread(
+            target=self._write_series,
+            args=(
+                self._generation,
+                self._queue,
+                self._series_ended,
+                prefix,
+                start_message,
+                detector_configuration,
+                self.compression_enabled,
+                self.nimages_per_file,
+                self.image_nr_start,
+            ),
+            name="filewriter",
+            daemon=True,
+        )
+        self._threads.append(thread)
+        thread.start()
+
+    def write(self, payload: memoryview) -> None:
+        """
+        Queues an image to be written. Never blocks: the image is dropped if
+        the queue is full. No-op if no series is being written. The images
+        are stored in the order they are queued
+
+        Parameters
+        ----------
+        payload : memoryview
+            The CBOR-encoded payload of the image message. Only a reference to
+            the payload is queued, so it must not be modified once it is sent
+
+        Returns
+        -------
+        None
+        """
+        series_queue = self._queue
+        if series_queue is None:
+            return
+        try:
+            series_queue.put_nowait(payload)
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def end_series(self) -> None:
+        """
+        Ends the series being written. Never blocks: the queued images and the
+        master file are written in the background (see `wait`)
+
+        Returns
+        -------
+        None
+        """
+        series_ended, self._series_ended = self._series_ended, None
+        self._queue = None
+        if series_ended is not None:
+            series_ended.set()
+
+    def wait(self) -> None:
+        """
+        Waits until the files of all the ended series have been written
+
+        Returns
+        -------
+        None
+        """
+        for thread in self._threads:
+            thread.join()
+
+    def _write_series(
+        self,
+        generation: int,
+        series_queue: queue.Queue,
+        series_ended: threading.Event,
+        prefix: str,
+        start_message: dict,
+        detector_configuration: dict,
+        compression_enabled: bool,
+        nimages_per_file: int,
+        image_nr_start: int,
+    ) -> None:
+        """
+        Writes the queued images to datafiles of nimages_per_file images each,
+        and the master file once the series has ended. Runs on the filewriter
+        thread
+
+        Parameters
+        ----------
+        generation : int
+            Generation of the series (see `start_series`)
+        series_queue : queue.Queue
+            The queue of the payloads of the series
+        series_ended : threading.Event
+            Set when the series has ended. The series is finished once its
+            queue is empty
+        prefix : str
+            Prefix of the file names
+        start_message : dict
+            The start message of the series
+        detector_configuration : dict
+            The detector configuration of the series
+        compression_enabled : bool
+            If True, the compressed frames are written as they are streamed.
+            Otherwise, the frames are decompressed and written uncompressed
+        nimages_per_file : int
+            Maximum number of images per datafile
+        image_nr_start : int
+            Image number of the first image, stored in the image_nr_low and
+            image_nr_high attributes of the datasets
+
+        Returns
+        -------
+        None
+        """
+        import h5py
+        import hdf5plugin  # noqa
+
+        def is_current_series() -> bool:
+            return generation == self._generation
+
+        def close_data_file() -> None:
+            # image_nr_high is only known once the datafile is complete
+            for dataset in datasets.values():
+                dataset.attrs["image_nr_high"] = (
+                    dataset.attrs["image_nr_low"] + dataset.shape[0] - 1
+                )
+            data_file.close()
+
+        data_files: list[str] = []
+        data_file: h5py.File | None = None
+        datasets: dict[str, h5py.Dataset] = {}
+        file_compression = "none"
+        # Images dropped by `write` are not counted, so the images are stored
+        # contiguously in the order they are received
+        number_of_images = 0
+        try:
+            while True:
+                try:
+                    payload = series_queue.get(timeout=_QUEUE_POLL_INTERVAL)
+                except queue.Empty:
+                    if series_ended.is_set():
+                        break
+                    continue
+                channels = self._read_frames(payload, compression_enabled)
+                file_index, position = divmod(number_of_images, nimages_per_file)
+                if position == 0:
+                    if data_file is not None:
+                        close_data_file()
+                    name = f"{prefix}_data_{file_index + 1:06d}.h5"
+                    data_file = h5py.File(self.directory / name, "w")
+                    entry = data_file.create_group("entry")
+                    entry.attrs["NX_class"] = "NXentry"
+                    datasets = {}
+                    for channel, (compression, dtype, shape, data) in channels.items():
+                        datasets[channel] = self._create_dataset(
+                            entry.create_group(_data_group_name(channel)),
+                            compression,
+                            dtype,
+                            shape,
+                            data,
+                            nimages_per_file,
+                        )
+                        datasets[channel].attrs["image_nr_low"] = (
+                            image_nr_start + file_index * nimages_per_file
+                        )
+                    data_files.append(name)
+                    file_compression = channels["threshold_1"][0]
+                for channel, dataset in datasets.items():
+                    dataset.resize(position + 1, axis=0)
+                    dataset.id.write_direct_chunk(
+                        (position, 0, 0), channels[channel][3]
+                    )
+                number_of_images += 1
+                if is_current_series():
+                    self.frames_written += 1
+            if data_file is not None:
+                close_data_file()
+                data_file = None
+            write_master_file(
+                self.directory / f"{prefix}_master.h5",
+                start_message,
+                detector_configuration,
+                file_compression,
+                data_files,
+                number_of_images,
+                list(datasets),
+            )
+            logging.info(
+                f"Wrote {number_of_images} images of {prefix} to "
+                f"{len(data_files)} datafiles"
+            )
+        except Exception as ex:
+            logging.exception(f"Failed to write {prefix}")
+            if is_current_series():
+                self.error = str(ex)
+            if data_file is not None:
+                data_file.close()
+            # The images queued until the series ends are dropped by `write`
+
+    def _read_frames(
+        self, payload: memoryview, compression_enabled: bool
+    ) -> dict[str, FrameData]:
+        """
+        Reads the frame of each channel of an image, decompressed if
+        compression is disabled
+
+        Parameters
+        ----------
+        payload : memoryview
+            The CBOR-encoded payload of the image message
+        compression_enabled : bool
+            If False, the frames are decompressed
+
+        Returns
+        -------
+        dict[str, FrameData]
+            The frame of each channel, as written to the datafiles
+        """
+        channels = {}
+        for channel, frame in self.read_channels(payload).items():
+            compression, dtype, shape, data = frame
+            if not compression_enabled and compression != "none":
+                data = decompress_frame(data, compression, dtype, shape).tobytes()
+                compression = "none"
+            channels[channel] = compression, dtype, shape, data
+        return channels
+
+    @staticmethod
+    def _create_dataset(
+        data_group: "h5py.Group",
+        compression: str,
+        dtype: npt.DTypeLike,
+        shape: tuple[int, int],
+        data: bytes,
+        nimages_per_file: int,
+    ) -> "h5py.Dataset":
+        """
+        Creates the dataset of a channel in a datafile, chunked by frame and
+        with the HDF5 filter matching the compression of the frames, so that
+        the compressed frames can be written with `write_direct_chunk`
+
+        Parameters
+        ----------
+        data_group : h5py.Group
+            The NXdata group of the channel in the datafile
+        compression : str
+            Compression of the frames
+        dtype : npt.DTypeLike
+            Data type of the frames
+        shape : tuple[int, int]
+            Shape of the frames
+        data : bytes
+            The first frame, used to read the block size of compressed frames
+        nimages_per_file : int
+            Maximum number of images of the datafile
+
+        Returns
+        -------
+        h5py.Dataset
+            The data dataset of the group
+        """
+        import hdf5plugin
+
+        if compression == "bslz4":
+            # The bytes-header of the frames is the header of the HDF5
+            # bitshuffle filter (number of bytes and block size in bytes)
+            _, block_nbytes = struct.unpack_from(">qi", data)
+            filter_options = hdf5plugin.Bitshuffle(
+                nelems=block_nbytes // np.dtype(dtype).itemsize, cname="lz4"
+            )
+        elif compression == "lz4":
+            filter_options = hdf5plugin.LZ4()
+        else:
+            filter_options = {}
+        data_group.attrs["NX_class"] = "NXdata"
+        return data_group.create_dataset(
+            "data",
+            shape=(0, *shape),
+            maxshape=(nimages_per_file, *shape),
+            chunks=(1, *shape),
+            dtype=dtype,
+            **filter_options,
+        )
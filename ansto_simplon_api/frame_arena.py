@@ -0,0 +1,365 @@
+import sys
+import threading
+
+import numpy as np
+import numpy.typing as npt
+import zmq
+
+# Number of bytes reserved in front of every payload for the per-frame
+# header fields of an image message
+IMAGE_HEADER_SLOT_SIZE = 512
+# Initial capacity of the buffer of a FrameArenaBuilder [bytes]
+_INITIAL_BUILDER_CAPACITY = 2**20
+# Interval at which waits for libzmq to release a frame check whether they
+# were cancelled [seconds]
+_TRACKER_POLL_INTERVAL = 0.1
+
+
+class FrameArena:
+    """
+    Contiguous buffer of pre-encoded image messages used to send frames through
+    a ZeroMQ socket without copying them.
+
+    Every frame occupies a slot made of a fixed-size header region followed by
+    the CBOR-encoded payload of the image message. The per-frame header is
+    written right-aligned into the header region, so that the header and the
+    payload form a single contiguous message which is sent as a memoryview of
+    the arena. Since libzmq reads the memory asynchronously, a slot is only
+    rewritten once the previous send of the same slot has completed.
+    """
+
+    def __init__(
+        self,
+        buffer: npt.NDArray[np.uint8],
+        payload_offsets: npt.NDArray[np.int64],
+        payload_lengths: npt.NDArray[np.int64],
+        header_slot_size: int = IMAGE_HEADER_SLOT_SIZE,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        buffer : npt.NDArray[np.uint8]
+            A writable buffer containing the frame slots
+        payload_offsets : npt.NDArray[np.int64]
+            Offset of the payload of each frame within the buffer
+        payload_lengths : npt.NDArray[np.int64]
+            Length of the payload of each frame
+        header_slot_size : int, optional
+            Number of bytes reserved for the header of each image message
+
+        Returns
+        -------
+        None
+        """
+        self.buffer = buffer
+        self.payload_offsets = payload_offsets
+        self.payload_lengths = payload_lengths
+        self.header_slot_size = header_slot_size
+
+        self._view = memoryview(self.buffer)
+        self._trackers: list[zmq.MessageTracker | None] = [None] * len(payload_offsets)
+
+    @classmethod
+    def from_payloads(
+        cls, payloads: list[bytes], header_slot_size: int = IMAGE_HEADER_SLOT_SIZE
+    ) -> "FrameArena":
+        """
+        Creates a frame arena from a list of CBOR-encoded image message payloads
+
+        Parameters
+        ----------
+        payloads : list[bytes]
+            CBOR-encoded image message payloads
+        header_slot_size : int, optional
+            Number of bytes reserved for the header of each image message
+
+        Returns
+        -------
+        FrameArena
+            A frame arena containing the payloads
+        """
+        builder = FrameArenaBuilder(
+            header_slot_size,
+            capacity=sum(len(payload) + header_slot_size for payload in payloads),
+        )
+        for payload in payloads:
+            builder.append(payload)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self._trackers)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arena in bytes"""
+        return self.buffer.nbytes
+
+    @property
+    def footprint(self) -> int:
+        """Memory used by the arena, its index and the send trackers [bytes]"""
+        return (
+            self.buffer.nbytes
+            + self.payload_offsets.nbytes
+            + self.payload_lengths.nbytes
+            + sys.getsizeof(self._trackers)
+        )
+
+    def payload(self, index: int) -> memoryview:
+        """
+        Gets the CBOR-encoded payload of the frame `index`, without copying it
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+
+        Returns
+        -------
+        memoryview
+            A read-only view of the payload
+        """
+        payload_offset = int(self.payload_offsets[index])
+        end = payload_offset + int(self.payload_lengths[index])
+        return self._view[payload_offset:end].toreadonly()
+
+    def write_message(
+        self,
+        index: int,
+        header: bytes,
+        cancel_event: threading.Event | None = None,
+    ) -> memoryview | None:
+        """
+        Writes the header of an image message in front of the payload of the
+        frame `index`. If a previous send of the same frame is still in
+        progress, we wait until libzmq has released the slot
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+        header : bytes
+            CBOR-encoded image message header
+        cancel_event : threading.Event | None, optional
+            If set while we wait for libzmq to release the slot, e.g. because
+            the receiver stopped reading, we stop waiting
+
+        Returns
+        -------
+        memoryview | None
+            A view of the encoded image message (header + payload), or None if
+            the wait was cancelled
+
+        Raises
+        ------
+        ValueError
+            If the header does not fit in the header slot
+        """
+        if len(header) > self.header_slot_size:
+            raise ValueError(
+                f"Image message header ({len(header)} bytes) exceeds the header "
+                f"slot size ({self.header_slot_size} bytes)"
+            )
+        if not self._wait_for_tracker(self._trackers[index], cancel_event):
+            return None
+
+        payload_offset = int(self.payload_offsets[index])
+        start = payload_offset - len(header)
+        end = payload_offset + int(self.payload_lengths[index])
+        self.buffer[start:payload_offset] = np.frombuffer(header, dtype=np.uint8)
+        return self._view[start:end]
+
+    def is_in_flight(self, index: int) -> bool:
+        """
+        Checks whether libzmq still holds the last send of the frame `index`,
+        i.e. whether `write_message` would wait for it
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+
+        Returns
+        -------
+        bool
+            True if the last send of the frame is still in progress
+        """
+        tracker = self._trackers[index]
+        return tracker is not None and not tracker.done
+
+    def copy_message(self, index: int, header: bytes) -> bytearray:
+        """
+        Creates a copy of the image message of the frame `index`, without
+        writing the header in the frame arena. Used when the frame cannot be
+        sent without copying it because a previous send of the same frame is
+        still in progress (see `is_in_flight`)
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+        header : bytes
+            CBOR-encoded image message header
+
+        Returns
+        -------
+        bytearray
+            The encoded image message (header + payload)
+        """
+        payload = self.payload(index)
+        message = bytearray(len(header) + payload.nbytes)
+        message[: len(header)] = header
+        message[len(header) :] = payload
+        return message
+
+    def set_tracker(self, index: int, tracker: zmq.MessageTracker | None) -> None:
+        """
+        Registers the tracker of the last send of the frame `index`
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+        tracker : zmq.MessageTracker | None
+            Tracker returned by zmq.Socket.send(..., copy=False, track=True)
+
+        Returns
+        -------
+        None
+        """
+        self._trackers[index] = tracker
+
+    def wait(self, cancel_event: threading.Event | None = None) -> bool:
+        """
+        Waits until libzmq has released every frame of the arena
+
+        Parameters
+        ----------
+        cancel_event : threading.Event | None, optional
+            If set while we wait, we stop waiting
+
+        Returns
+        -------
+        bool
+            False if the wait was cancelled
+        """
+        return all(
+            self._wait_for_tracker(tracker, cancel_event) for tracker in self._trackers
+        )
+
+    @staticmethod
+    def _wait_for_tracker(
+        tracker: zmq.MessageTracker | None, cancel_event: threading.Event | None
+    ) -> bool:
+        """
+        Waits until libzmq has released a message. The wait is done in short
+        steps, so that it can be cancelled when the receiver never reads the
+        message
+
+        Parameters
+        ----------
+        tracker : zmq.MessageTracker | None
+            Tracker of the send of the message
+        cancel_event : threading.Event | None
+            If set while we wait, we stop waiting. If None, we wait until the
+            message is released
+
+        Returns
+        -------
+        bool
+            False if the wait was cancelled
+        """
+        if tracker is None:
+            return True
+        while not tracker.done:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            try:
+                tracker.wait(_TRACKER_POLL_INTERVAL)
+            except zmq.NotDone:
+                continue
+        return True
+
+
+class FrameArenaBuilder:
+    """
+    Builds a frame arena by appending payloads as they are encoded, so that the
+    encoded frames of a dataset are never held as separate bytes objects. The
+    buffer and the index grow geometrically and are trimmed by `build`.
+    """
+
+    def __init__(
+        self,
+        header_slot_size: int = IMAGE_HEADER_SLOT_SIZE,
+        capacity: int = _INITIAL_BUILDER_CAPACITY,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        header_slot_size : int, optional
+            Number of bytes reserved for the header of each image message
+        capacity : int, optional
+            Initial size of the buffer [bytes]
+
+        Returns
+        -------
+        None
+        """
+        self.header_slot_size = header_slot_size
+        self._buffer = np.empty(max(capacity, 1), dtype=np.uint8)
+        self._offsets = np.empty(64, dtype=np.int64)
+        self._lengths = np.empty(64, dtype=np.int64)
+        self._size = 0
+        self._number_of_frames = 0
+
+    def __len__(self) -> int:
+        return self._number_of_frames
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the frame slots appended so far [bytes]"""
+        return self._size
+
+    def append(self, payload: bytes) -> None:
+        """
+        Appends the CBOR-encoded payload of an image message
+
+        Parameters
+        ----------
+        payload : bytes
+            CBOR-encoded image message payload
+
+        Returns
+        -------
+        None
+        """
+        payload_offset = self._size + self.header_slot_size
+        end = payload_offset + len(payload)
+        if end > len(self._buffer):
+            self._buffer.resize(max(end, 2 * len(self._buffer)), refcheck=False)
+        if self._number_of_frames == len(self._offsets):
+            self._offsets.resize(2 * len(self._offsets), refcheck=False)
+            self._lengths.resize(2 * len(self._lengths), refcheck=False)
+
+        self._buffer[payload_offset:end] = np.frombuffer(payload, dtype=np.uint8)
+        self._offsets[self._number_of_frames] = payload_offset
+        self._lengths[self._number_of_frames] = len(payload)
+        self._size = end
+        self._number_of_frames += 1
+
+    def build(self) -> FrameArena:
+        """
+        Creates the frame arena. The builder must not be used afterwards
+
+        Returns
+        -------
+        FrameArena
+            A frame arena containing the appended payloads
+        """
+        # Trim the unused capacity. resize uses realloc, which usually shrinks
+        # the buffer in place but may move (and copy) it
+        self._buffer.resize(self._size, refcheck=False)
+        self._offsets.resize(self._number_of_frames, refcheck=False)
+        self._lengths.resize(self._number_of_frames, refcheck=False)
+        return FrameArena(
+            self._buffer, self._offsets, self._lengths, self.header_slot_size
+        )
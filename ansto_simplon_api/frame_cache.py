@@ -0,0 +1,314 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .frame_arena import FrameArena
+
+# Bump the version whenever the encoding of the cached frames changes, so that
+# stale cache files are not reused
+CACHE_FORMAT_VERSION = 1
+CACHE_FILE_SUFFIX = ".frames"
+# Every cache file ends with a trailer containing: magic number, size of the
+# frame data, number of frames, header slot size and size of the metadata
+_TRAILER = struct.Struct("<8sQQQQ")
+_MAGIC = b"ASFRAMES"
+
+
+class FrameCache:
+    """
+    Persistent on-disk cache of encoded frames.
+
+    Each cached dataset is stored in a single flat file containing the frame
+    arena (see `FrameArena`), followed by an index of the payload offsets and
+    lengths, a JSON metadata block and a fixed-size trailer. Cached datasets are
+    reopened with mmap, so that loading a dataset which is already cached only
+    maps the file into memory, and the pages are shared with the OS page cache.
+    Files are evicted in least-recently-used order when the total size of the
+    cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int) -> None:
+        """
+        Parameters
+        ----------
+        cache_dir : str | Path
+            Directory where cached datasets are stored
+        max_bytes : int
+            Maximum total size of the cache [bytes]
+
+        Returns
+        -------
+        None
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(
+        hdf5_file_path: str | Path,
+        data_file_paths: list[str | Path],
+        compression: str,
+        number_of_data_files: int,
+        block_size: int = 0,
+        direct_chunk_read: bool = True,
+    ) -> str:
+        """
+        Creates the cache key of a dataset. The key changes whenever the master
+        file or one of its datafiles is modified, or when the frames are loaded
+        with a different compression, bitshuffle block size, datafile selection
+        or direct chunk read setting
+
+        Parameters
+        ----------
+        hdf5_file_path : str | Path
+            Path of the hdf5 master file
+        data_file_paths : list[str | Path]
+            Paths of the datafiles which are loaded
+        compression : str
+            Compression type
+        number_of_data_files : int
+            Number of datafiles which are loaded
+        block_size : int, optional
+            Bitshuffle block size [number of elements] of bslz4 compressed
+            frames
+        direct_chunk_read : bool, optional
+            Whether bslz4 chunks are read without recompressing them, in which
+            case the frames keep the block size of the datafiles
+
+        Returns
+        -------
+        str
+            The cache key
+        """
+        files = []
+        for path in [hdf5_file_path, *data_file_paths]:
+            stat = os.stat(path)
+            files.append([os.path.realpath(path), stat.st_mtime_ns, stat.st_size])
+        description = json.dumps(
+            {
+                "version": CACHE_FORMAT_VERSION,
+                "files": files,
+                "compression": compression,
+                "number_of_data_files": number_of_data_files,
+                "block_size": block_size,
+                "direct_chunk_read": direct_chunk_read,
+            }
+        )
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{CACHE_FILE_SUFFIX}"
+
+    def load(self, key: str) -> FrameArena | None:
+        """
+        Loads a cached dataset
+
+        Parameters
+        ----------
+        key : str
+            Cache key (see `key`)
+
+        Returns
+        -------
+        FrameArena | None
+            A frame arena backed by a memory-mapped cache file, or None if the
+            dataset is not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                # ACCESS_COPY: frame headers are written into the arena without
+                # modifying the cache file
+                mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        try:
+            magic, data_nbytes, number_of_frames, header_slot_size, _ = (
+                _TRAILER.unpack_from(mapped_file, len(mapped_file) - _TRAILER.size)
+            )
+            if magic != _MAGIC:
+                raise ValueError(f"Invalid cache file: {path}")
+        except (struct.error, ValueError):
+            logging.warning(f"Removing corrupted frame cache file: {path}")
+            mapped_file.close()
+            path.unlink(missing_ok=True)
+            return None
+
+        buffer = np.frombuffer(mapped_file, dtype=np.uint8, count=data_nbytes)
+        index = np.frombuffer(
+            mapped_file, dtype=np.int64, count=2 * number_of_frames, offset=data_nbytes
+        )
+        # Update the modification time used for the LRU eviction
+        os.utime(path)
+        logging.info(f"Loaded {number_of_frames} frames from the frame cache: {path}")
+        return FrameArena(
+            buffer,
+            index[:number_of_frames],
+            index[number_of_frames:],
+            header_slot_size,
+        )
+
+    def store(self, key: str, frames: FrameArena, metadata: dict) -> None:
+        """
+        Stores a dataset in the cache, and evicts the least recently used
+        datasets if the cache exceeds its maximum size
+
+        Parameters
+        ----------
+        key : str
+            Cache key (see `key`)
+        frames : FrameArena
+            The encoded frames
+        metadata : dict
+            JSON-serialisable metadata describing the dataset, reported by
+            `entries`
+
+        Returns
+        -------
+        None
+        """
+        encoded_metadata = json.dumps(metadata).encode()
+        file_size = (
+            frames.nbytes
+            + frames.payload_offsets.nbytes
+            + frames.payload_lengths.nbytes
+            + len(encoded_metadata)
+            + _TRAILER.size
+        )
+        if file_size > self.max_bytes:
+            logging.warning(
+                f"The dataset ({file_size / 1e6:.1f} MB) exceeds the maximum size "
+                f"of the frame cache ({self.max_bytes / 1e6:.1f} MB) and is not "
+                "cached"
+            )
+            return
+        self._evict(self.max_bytes - file_size)
+
+        # Write to a temporary file first so that a partially written file is
+        # never loaded. The temporary file is removed if the write fails (e.g.
+        # the disk is full), since it is not counted in the size of the cache
+        f = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False)
+        try:
+            with f:
+                # Only the payloads are written, the header slots are written
+                # as zeros: they hold the headers of the last images sent, or
+                # uninitialised bytes, so that identical datasets give
+                # identical cache files
+                view = memoryview(frames.buffer)
+                end = 0
+                for offset, length in zip(
+                    frames.payload_offsets.tolist(), frames.payload_lengths.tolist()
+                ):
+                    f.write(bytes(offset - end))
+                    f.write(view[offset : offset + length])
+                    end = offset + length
+                f.write(bytes(frames.nbytes - end))
+                f.write(frames.payload_offsets.astype(np.int64).tobytes())
+                f.write(frames.payload_lengths.astype(np.int64).tobytes())
+                f.write(encoded_metadata)
+                f.write(
+                    _TRAILER.pack(
+                        _MAGIC,
+                        frames.nbytes,
+                        len(frames),
+                        frames.header_slot_size,
+                        len(encoded_metadata),
+                    )
+                )
+            os.replace(f.name, self._path(key))
+        except BaseException:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+        logging.info(f"Stored {len(frames)} frames in the frame cache")
+
+    def _evict(self, max_bytes: int) -> None:
+        """
+        Removes the least recently used cache files until the total size of the
+        cache is below `max_bytes`
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the remaining cache files [bytes]
+
+        Returns
+        -------
+        None
+        """
+        paths = sorted(
+            self.cache_dir.glob(f"*{CACHE_FILE_SUFFIX}"),
+            key=lambda path: path.stat().st_mtime,
+        )
+        total_size = sum(path.stat().st_size for path in paths)
+        for path in paths:
+            if total_size <= max_bytes:
+                break
+            total_size -= path.stat().st_size
+            logging.info(f"Evicting frame cache file: {path}")
+            path.unlink(missing_ok=True)
+
+    def entries(self) -> list[dict]:
+        """
+        Lists the cached datasets, most recently used first. Truncated or
+        corrupted cache files are skipped (they are removed by `load`)
+
+        Returns
+        -------
+        list[dict]
+            The key, size, last access time and metadata of each cached dataset
+        """
+        entries = []
+        for path in self.cache_dir.glob(f"*{CACHE_FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+                with open(path, "rb") as f:
+                    f.seek(-_TRAILER.size, os.SEEK_END)
+                    magic, _, _, _, metadata_nbytes = _TRAILER.unpack(
+                        f.read(_TRAILER.size)
+                    )
+                    if magic != _MAGIC:
+                        raise ValueError(f"Invalid cache file: {path}")
+                    f.seek(-_TRAILER.size - metadata_nbytes, os.SEEK_END)
+                    metadata = json.loads(f.read(metadata_nbytes))
+            except (struct.error, ValueError, OSError):
+                logging.warning(f"Skipping corrupted frame cache file: {path}")
+                continue
+            entries.append(
+                {
+                    "key": path.name.removesuffix(CACHE_FILE_SUFFIX),
+                    "size_bytes": stat.st_size,
+                    "last_used": stat.st_mtime,
+                    **metadata,
+                }
+            )
+        return sorted(entries, key=lambda entry: entry["last_used"], reverse=True)
+
+    @property
+    def size(self) -> int:
+        """Total size of the cache [bytes]"""
+        return sum(
+            path.stat().st_size for path in self.cache_dir.glob(f"*{CACHE_FILE_SUFFIX}")
+        )
+
+    def clear(self) -> int:
+        """
+        Removes every cached dataset
+
+        Returns
+        -------
+        int
+            Number of removed datasets
+        """
+        paths = list(self.cache_dir.glob(f"*{CACHE_FILE_SUFFIX}"))
+        for path in paths:
+            path.unlink(missing_ok=True)
+        return len(paths)
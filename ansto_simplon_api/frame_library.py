@@ -0,0 +1,415 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .frame_arena import FrameArena
+from .frame_source import StreamingFrameSource
+
+# (roi_mode, compression, image_dtype, channels) of the frames of a dataset, e.g.
+# ("disabled", "bslz4", "uint32", ("threshold_1",))
+FrameVariant = tuple[str, str, str, tuple[str, ...]]
+
+
+@dataclass
+class PreparedDataset:
+    """
+    A dataset ready to be streamed: the encoded frames and the messages and
+    detector configuration read from its master file (or generated with it)
+    """
+
+    name: str
+    frames: FrameArena | StreamingFrameSource
+    start_message: dict
+    image_message: dict
+    end_message: dict
+    # Detector configuration fields read from the master file
+    detector_configuration: dict
+    number_of_frames_per_trigger: int
+    compression: str
+    uncompressed_nbytes: int
+    hdf5_file_path: str | Path | None = None
+    # Modification time of the master file, so that a modified master file is
+    # not served from the library
+    master_file_mtime_ns: int | None = None
+    number_of_data_files: int | None = None
+    synthetic_detector: str | None = None
+    synthetic_dtype: str | None = None
+    # Frames cropped to a ROI, converted to another data type, re-encoded with
+    # another compression and/or with more threshold channels, keyed by
+    # (roi_mode, compression, image_dtype, channels). Created on demand, see
+    # ZmqStream._prepare_frames. Variants which are neither selected nor
+    # requested are evicted when the library exceeds its maximum size
+    variants: dict[FrameVariant, FrameArena] = field(default_factory=dict)
+    # Variant of the streamed frames, and variant matching the detector
+    # configuration, which may still be being created
+    selected_variant: FrameVariant | None = None
+    requested_variant: FrameVariant | None = None
+    last_used: float = field(default_factory=time.time)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the encoded frames and their index [bytes]. Streamed
+        frames are not held in memory"""
+        nbytes = 0
+        if isinstance(self.frames, FrameArena):
+            nbytes += self.frames.footprint
+        for frames in self.variants.values():
+            if frames is not self.frames:
+                nbytes += frames.footprint
+        return nbytes
+
+    def describe(self) -> dict:
+        """
+        Describes the dataset
+
+        Returns
+        -------
+        dict
+            The name, source, size and last access time of the dataset
+        """
+        return {
+            "name": self.name,
+            "hdf5_file_path": self.hdf5_file_path,
+            "number_of_data_files": self.number_of_data_files,
+            "synthetic_detector": self.synthetic_detector,
+            "synthetic_dtype": self.synthetic_dtype,
+            "compression": self.compression,
+            "number_of_frames": len(self.frames),
+            "size_bytes": self.nbytes,
+            "last_used": self.last_used,
+        }
+
+
+class FrameLibrary:
+    """
+    In-memory library of prepared datasets, so that switching between datasets
+    which have already been loaded does not read and compress them again.
+
+    One dataset is active, i.e. streamed on trigger. The other datasets are
+    kept while the total size of the library is below `max_bytes`, and are
+    evicted in least-recently-used order. Variants of the frames (see
+    `PreparedDataset.variants`) count towards `max_bytes` and are evicted
+    before whole datasets. The active dataset and its streamed frames are never
+    evicted, so with `max_bytes=0` only the active dataset and its streamed
+    frames are kept. Datasets streamed from the datafiles (see
+    `StreamingFrameSource`) hold no frames in memory and are dropped as soon as
+    another dataset is activated.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the datasets kept in memory [bytes]
+
+        Returns
+        -------
+        None
+        """
+        self.max_bytes = max_bytes
+        self.active: str | None = None
+        # Least recently used first
+        self._datasets: OrderedDict[str, PreparedDataset] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._datasets
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+    @property
+    def size(self) -> int:
+        """Total size of the datasets [bytes]"""
+        return sum(dataset.nbytes for dataset in self._datasets.values())
+
+    @property
+    def active_dataset(self) -> PreparedDataset | None:
+        """The active dataset, if any"""
+        return self._datasets.get(self.active)
+
+    @property
+    def number_of_frames(self) -> int:
+        """Total number of frames of the datasets"""
+        return sum(len(dataset.frames) for dataset in self._datasets.values())
+
+    def find(self, **source) -> PreparedDataset | None:
+        """
+        Finds a dataset prepared from the given source, e.g.
+        find(hdf5_file_path=..., compression=..., number_of_data_files=...)
+
+        Parameters
+        ----------
+        **source
+            Values of the PreparedDataset fields which describe the source of
+            the dataset
+
+        Returns
+        -------
+        PreparedDataset | None
+            The most recently used matching dataset, or None
+        """
+        with self._lock:
+            for dataset in reversed(self._datasets.values()):
+                if all(getattr(dataset, key) == val for key, val in source.items()):
+                    return dataset
+        return None
+
+    def add(self, dataset: PreparedDataset, activate: bool) -> None:
+        """
+        Adds a dataset to the library, replacing any dataset with the same name,
+        and evicts the least recently used datasets if the library exceeds its
+        maximum size
+
+        Parameters
+        ----------
+        dataset : PreparedDataset
+            The dataset
+        activate : bool
+            Whether the dataset becomes the active dataset
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the dataset is not activated and exceeds the maximum size of the
+            library, or if it replaces the active dataset without activating
+            it
+        """
+        with self._lock:
+            if not activate:
+                if dataset.name == self.active:
+                    raise ValueError(
+                        f"Dataset {dataset.name} is active and can only be replaced "
+                        "by loading it as the active dataset"
+                    )
+                if dataset.nbytes > self.max_bytes:
+                    raise ValueError(
+                        f"The dataset ({dataset.nbytes / 1e6:.1f} MB) exceeds the "
+                        "maximum size of the frame library "
+                        f"({self.max_bytes / 1e6:.1f} MB). Increase "
+                        "AS_FRAME_CACHE_MAX_BYTES"
+                    )
+            self._remove(dataset.name)
+            self._datasets[dataset.name] = dataset
+            if activate:
+                self._activate(dataset.name)
+            self._evict()
+
+    def add_variant(
+        self, dataset: PreparedDataset, variant: FrameVariant, frames: FrameArena
+    ) -> None:
+        """
+        Adds a variant of the frames of a dataset, and evicts variants and
+        datasets if the library exceeds its maximum size
+
+        Parameters
+        ----------
+        dataset : PreparedDataset
+            The dataset
+        variant : FrameVariant
+            ROI mode, compression, data type and channels of the frames
+        frames : FrameArena
+            The frames
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            dataset.variants[variant] = frames
+            self._evict()
+
+    def select_variant(self, dataset: PreparedDataset, variant: FrameVariant) -> None:
+        """
+        Sets the variant of the streamed frames of a dataset. The variant
+        streamed before can then be evicted
+
+        Parameters
+        ----------
+        dataset : PreparedDataset
+            The dataset
+        variant : FrameVariant
+            ROI mode, compression, data type and channels of the streamed
+            frames
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if dataset.selected_variant == variant:
+                return
+            dataset.selected_variant = variant
+            self._evict()
+
+    def activate(self, name: str) -> PreparedDataset:
+        """
+        Makes a dataset the active dataset
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset
+
+        Returns
+        -------
+        PreparedDataset
+            The dataset
+
+        Raises
+        ------
+        KeyError
+            If the dataset is not in the library
+        """
+        with self._lock:
+            if name not in self._datasets:
+                raise KeyError(f"Dataset {name} is not in the frame library")
+            self._activate(name)
+            self._evict()
+            return self._datasets[name]
+
+    def _activate(self, name: str) -> None:
+        previous = self._datasets.get(self.active)
+        if (
+            previous is not None
+            and previous.name != name
+            and isinstance(previous.frames, StreamingFrameSource)
+        ):
+            self._remove(previous.name)
+        self.active = name
+        self._datasets[name].last_used = time.time()
+        self._datasets.move_to_end(name)
+
+    def remove(self, name: str) -> None:
+        """
+        Removes a dataset from the library
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        KeyError
+            If the dataset is not in the library
+        ValueError
+            If the dataset is active
+        """
+        with self._lock:
+            if name not in self._datasets:
+                raise KeyError(f"Dataset {name} is not in the frame library")
+            if name == self.active:
+                raise ValueError(f"Dataset {name} is active and cannot be removed")
+            self._remove(name)
+
+    def _remove(self, name: str) -> None:
+        dataset = self._datasets.pop(name, None)
+        if dataset is None:
+            return
+        if isinstance(dataset.frames, StreamingFrameSource):
+            dataset.frames.stop()
+        if name == self.active:
+            self.active = None
+
+    def _evict(self) -> None:
+        """
+        Frees memory until the total size of the library is below `max_bytes`,
+        by removing in turn:
+
+        - the variants of the active dataset which are neither selected nor
+          requested
+        - the variants of the inactive datasets, least recently used first
+        - the least recently used inactive datasets
+
+        Returns
+        -------
+        None
+        """
+        size = self.size
+        active_dataset = self.active_dataset
+        if active_dataset is not None:
+            size = self._evict_variants(
+                active_dataset,
+                size,
+                keep=(
+                    active_dataset.selected_variant,
+                    active_dataset.requested_variant,
+                ),
+            )
+        for name, dataset in list(self._datasets.items()):
+            if name != self.active:
+                size = self._evict_variants(dataset, size)
+        for name in list(self._datasets):
+            if size <= self.max_bytes:
+                break
+            if name == self.active:
+                continue
+            size -= self._datasets[name].nbytes
+            logging.info(f"Evicting dataset {name} from the frame library")
+            self._remove(name)
+
+    def _evict_variants(
+        self,
+        dataset: PreparedDataset,
+        size: int,
+        keep: tuple[FrameVariant | None, ...] = (),
+    ) -> int:
+        """
+        Removes the variants of a dataset, oldest first, until the total size
+        of the library is below `max_bytes`
+
+        Parameters
+        ----------
+        dataset : PreparedDataset
+            The dataset
+        size : int
+            Total size of the library [bytes]
+        keep : tuple[FrameVariant | None, ...], optional
+            Variants which are not removed
+
+        Returns
+        -------
+        int
+            Total size of the library once the variants are removed [bytes]
+        """
+        for variant in list(dataset.variants):
+            if size <= self.max_bytes:
+                break
+            if variant in keep:
+                continue
+            frames = dataset.variants.pop(variant)
+            if frames is not dataset.frames:
+                size -= frames.footprint
+            logging.info(
+                f"Evicting frames {variant} of dataset {dataset.name} from the "
+                "frame library"
+            )
+        return size
+
+    def entries(self) -> list[dict]:
+        """
+        Lists the datasets, most recently used first
+
+        Returns
+        -------
+        list[dict]
+            The description of each dataset (see `PreparedDataset.describe`)
+        """
+        with self._lock:
+            return [
+                {**dataset.describe(), "active": dataset.name == self.active}
+                for dataset in reversed(self._datasets.values())
+            ]
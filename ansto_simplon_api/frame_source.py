@@ -0,0 +1,511 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+import numpy as np
+import numpy.typing as npt
+import zmq
+
+from .compression import compress_frame
+from .frame_arena import IMAGE_HEADER_SLOT_SIZE
+
+if TYPE_CHECKING:
+    import h5py
+
+# Sentinel put in the pipeline queues when a stage has finished
+_END_OF_SERIES = None
+
+
+@dataclass
+class StreamingStatistics:
+    """Statistics of the last series sent from a StreamingFrameSource"""
+
+    number_of_frames: int = 0
+    # Number of frames which were not ready when they had to be sent
+    number_of_stalls: int = 0
+    # Total time the sender waited for frames [seconds]
+    wait_time: float = 0.0
+
+    @property
+    def kept_up(self) -> bool:
+        """Whether every frame was ready by the time it had to be sent"""
+        return self.number_of_stalls == 0
+
+
+class StreamingFrameSource:
+    """
+    Frame source which reads and compresses frames on demand while they are
+    being sent, so that datasets larger than the available memory can be
+    streamed.
+
+    Frames are read from all datafiles of a master file by a reader thread,
+    compressed and encoded by a pool of compressor threads, and handed to the
+    sender through queues. Frames are numbered by the reader and put back in
+    order before they are sent, and at most `prefetch_size` frames are read
+    ahead of the sender. Frames are prefetched as soon as a series is
+    prepared (see `prefetch`), e.g. when the detector is armed.
+    """
+
+    def __init__(
+        self,
+        hdf5_file_path: str | Path,
+        compression: Literal["bslz4", "lz4", "none"],
+        encode_payload: Callable[[bytes, bool], bytes],
+        prefetch_size: int = 64,
+        block_size: int = 0,
+        direct_chunk_read: bool = True,
+        is_bslz4_chunked: Callable[["h5py.Dataset"], bool] = lambda _: False,
+        number_of_compressors: int = 1,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        hdf5_file_path : str | Path
+            Path of the hdf5 master file
+        compression : Literal["bslz4", "lz4", "none"]
+            Compression type
+        encode_payload : Callable[[bytes, bool], bytes]
+            Function which encodes a compressed image into the payload of an
+            image message. The second argument specifies whether the
+            compressed image includes the bslz4 bytes-header
+        prefetch_size : int, optional
+            Maximum number of frames read ahead of the sender
+        block_size : int, optional
+            Bitshuffle block size [number of elements] of bslz4 compressed
+            frames (see `compress_frame`)
+        direct_chunk_read : bool, optional
+            If True, datafiles stored as bslz4 chunks are read with
+            read_direct_chunk and not recompressed
+        is_bslz4_chunked : Callable[[h5py.Dataset], bool], optional
+            Function which checks whether a dataset is stored as bslz4 chunks
+        number_of_compressors : int, optional
+            Number of compressor threads. bitshuffle and lz4 release the GIL
+            while compressing, so frames are compressed in parallel
+
+        Returns
+        -------
+        None
+        """
+        self.hdf5_file_path = hdf5_file_path
+        # Compression types are case-insensitive, e.g. "BSLZ4"
+        self.compression = compression.lower()
+        self.encode_payload = encode_payload
+        self.prefetch_size = prefetch_size
+        self.block_size = block_size
+        self.direct_chunk_read = direct_chunk_read
+        self.is_bslz4_chunked = is_bslz4_chunked
+        self.number_of_compressors = max(number_of_compressors, 1)
+        self.header_slot_size = IMAGE_HEADER_SLOT_SIZE
+
+        import h5py
+
+        with h5py.File(self.hdf5_file_path, mode="r") as hdf5_file:
+            raw_data_group = hdf5_file["/entry/data"]
+            self._data_file_keys = list(raw_data_group.keys())
+            frames_per_data_file = [
+                raw_data_group[key].shape[0] for key in self._data_file_keys
+            ]
+        self._data_file_offsets = np.cumsum([0] + frames_per_data_file)
+
+        self.statistics = StreamingStatistics()
+        self._series: tuple[int, int] | None = None
+        self._next_index = 0
+        self._remaining_frames = 0
+        # Sequence number of the next frame of the series to be sent
+        self._next_sequence = 0
+        # Encoded messages received out of order, by sequence number
+        self._pending_messages: dict[int, bytearray] = {}
+        # Limits the number of frames read ahead of the sender
+        self._prefetch_slots = threading.Semaphore(prefetch_size)
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._read_queue: queue.Queue = queue.Queue(maxsize=prefetch_size)
+        self._send_queue: queue.Queue = queue.Queue(maxsize=prefetch_size)
+
+    def __len__(self) -> int:
+        return int(self._data_file_offsets[-1])
+
+    @property
+    def number_of_data_files(self) -> int:
+        """Number of datafiles frames are read from"""
+        return len(self._data_file_keys)
+
+    def prefetch(self, first_index: int, number_of_frames: int) -> None:
+        """
+        Starts reading and compressing the frames of a series in the
+        background. If the same series is already being prefetched, this is a
+        no-op
+
+        Parameters
+        ----------
+        first_index : int
+            Index of the first frame of the series
+        number_of_frames : int
+            Number of frames in the series. Frames are read cyclically if
+            the series is longer than the dataset
+
+        Returns
+        -------
+        None
+        """
+        if self._series == (first_index, number_of_frames):
+            return
+        self.stop()
+
+        self._series = (first_index, number_of_frames)
+        self._next_index = first_index
+        self._remaining_frames = number_of_frames
+        self._next_sequence = 0
+        self._pending_messages = {}
+        self._prefetch_slots = threading.Semaphore(self.prefetch_size)
+        self.statistics = StreamingStatistics(number_of_frames=number_of_frames)
+        self._stop_event = threading.Event()
+        self._read_queue = queue.Queue(maxsize=self.prefetch_size)
+        self._send_queue = queue.Queue(maxsize=self.prefetch_size)
+        self._threads = [
+            threading.Thread(
+                target=self._read_frames,
+                args=(first_index, number_of_frames),
+                name="frame-reader",
+                daemon=True,
+            )
+        ]
+        self._threads += [
+            threading.Thread(
+                target=self._compress_frames,
+                name=f"frame-compressor-{ii}",
+                daemon=True,
+            )
+            for ii in range(self.number_of_compressors)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the reader and compressor threads and discards prefetched frames
+
+        Returns
+        -------
+        None
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._series = None
+
+    def write_message(
+        self,
+        index: int,
+        header: bytes,
+        cancel_event: threading.Event | None = None,
+    ) -> memoryview | None:
+        """
+        Gets the next frame of the series and writes the header of the image
+        message in front of its payload
+
+        Parameters
+        ----------
+        index : int
+            Frame index. Frames have to be requested in order
+        header : bytes
+            CBOR-encoded image message header
+        cancel_event : threading.Event | None, optional
+            If set while we wait for the frame, we stop waiting
+
+        Returns
+        -------
+        memoryview | None
+            A view of the encoded image message (header + payload), or None if
+            the wait was cancelled
+
+        Raises
+        ------
+        ValueError
+            If the frame is not the next frame of the series, or if the header
+            does not fit in the header slot
+        RuntimeError
+            If no series is being prefetched, or if the reader or compressor
+            thread failed
+        """
+        if self._series is None:
+            raise RuntimeError("No series is being prefetched, call prefetch first")
+        if index != self._next_index % len(self):
+            raise ValueError(
+                f"Frames have to be requested in order: expected frame "
+                f"{self._next_index % len(self)}, not {index}"
+            )
+        if len(header) > self.header_slot_size:
+            raise ValueError(
+                f"Image message header ({len(header)} bytes) exceeds the header "
+                f"slot size ({self.header_slot_size} bytes)"
+            )
+
+        message = self._next_message(cancel_event)
+        if message is None:
+            return None
+        if isinstance(message, Exception):
+            self._series = None
+            raise RuntimeError("The streaming frame source failed") from message
+        self._prefetch_slots.release()
+        self._next_sequence += 1
+        self._next_index += 1
+        self._remaining_frames -= 1
+        if self._remaining_frames == 0:
+            # The reader and compressor threads finish on their own
+            self._series = None
+
+        start = self.header_slot_size - len(header)
+        message[start : self.header_slot_size] = header
+        return memoryview(message)[start:]
+
+    def _next_message(
+        self, cancel_event: threading.Event | None
+    ) -> bytearray | Exception | None:
+        """
+        Gets the encoded message of the next frame from the send queue. The
+        compressor threads finish frames out of order, so messages of later
+        frames are kept until they are due
+
+        Parameters
+        ----------
+        cancel_event : threading.Event | None
+            If set while we wait for the frame, we stop waiting
+
+        Returns
+        -------
+        bytearray | Exception | None
+            The message, the exception raised by the reader or a compressor
+            thread, or None if the wait was cancelled
+        """
+        t: float | None = None
+        while self._next_sequence not in self._pending_messages:
+            try:
+                item = self._send_queue.get_nowait()
+            except queue.Empty:
+                if t is None:
+                    self.statistics.number_of_stalls += 1
+                    t = time.perf_counter()
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                try:
+                    item = self._send_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            if isinstance(item, Exception):
+                return item
+            sequence, message = item
+            self._pending_messages[sequence] = message
+        if t is not None:
+            self.statistics.wait_time += time.perf_counter() - t
+        return self._pending_messages.pop(self._next_sequence)
+
+    def is_in_flight(self, index: int) -> bool:
+        """
+        Messages of a streaming frame source are never reused, so a message can
+        always be written without waiting for a previous send
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+
+        Returns
+        -------
+        bool
+            False
+        """
+        return False
+
+    def set_tracker(self, index: int, tracker: zmq.MessageTracker | None) -> None:
+        """
+        Messages of a streaming frame source are never reused, so there is
+        nothing to track
+
+        Parameters
+        ----------
+        index : int
+            Frame index
+        tracker : zmq.MessageTracker | None
+            Tracker returned by zmq.Socket.send(..., copy=False, track=True)
+
+        Returns
+        -------
+        None
+        """
+
+    def wait(self, cancel_event: threading.Event | None = None) -> bool:
+        """
+        Messages of a streaming frame source are never reused, so there is
+        nothing to wait for
+
+        Parameters
+        ----------
+        cancel_event : threading.Event | None, optional
+            Not used
+
+        Returns
+        -------
+        bool
+            True
+        """
+        return True
+
+    def _put(self, q: queue.Queue, item: object) -> bool:
+        """
+        Puts an item in a bounded queue, unless the pipeline is stopped
+
+        Parameters
+        ----------
+        q : queue.Queue
+            The queue
+        item : object
+            The item
+
+        Returns
+        -------
+        bool
+            False if the pipeline was stopped before the item could be queued
+        """
+        while not self._stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> object:
+        """
+        Gets an item from a queue, unless the pipeline is stopped
+
+        Parameters
+        ----------
+        q : queue.Queue
+            The queue
+
+        Returns
+        -------
+        object
+            The item, or _END_OF_SERIES if the pipeline was stopped
+        """
+        while not self._stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END_OF_SERIES
+
+    def _acquire_prefetch_slot(self) -> bool:
+        """
+        Waits until a frame can be read without exceeding `prefetch_size`
+        frames ahead of the sender, unless the pipeline is stopped
+
+        Returns
+        -------
+        bool
+            False if the pipeline was stopped
+        """
+        while not self._stop_event.is_set():
+            if self._prefetch_slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def _read_frames(self, first_index: int, number_of_frames: int) -> None:
+        """
+        Reads frames from the datafiles and puts them in the read queue with
+        their sequence number in the series. Datasets stored as bslz4 chunks
+        are read without decompressing them
+
+        Parameters
+        ----------
+        first_index : int
+            Index of the first frame
+        number_of_frames : int
+            Number of frames to read
+
+        Returns
+        -------
+        None
+        """
+        import h5py
+        import hdf5plugin  # noqa
+
+        try:
+            with h5py.File(self.hdf5_file_path, mode="r") as hdf5_file:
+                raw_data_group = hdf5_file["/entry/data"]
+                datasets: list[h5py.Dataset] = [
+                    raw_data_group[key] for key in self._data_file_keys
+                ]
+                direct_chunk_read = [
+                    self.direct_chunk_read
+                    and self.compression == "bslz4"
+                    and self.is_bslz4_chunked(dataset)
+                    for dataset in datasets
+                ]
+                for sequence in range(number_of_frames):
+                    if not self._acquire_prefetch_slot():
+                        return
+                    index = (first_index + sequence) % len(self)
+                    jj = int(
+                        np.searchsorted(self._data_file_offsets, index, side="right")
+                        - 1
+                    )
+                    local_index = index - int(self._data_file_offsets[jj])
+
+                    frame: bytes | npt.NDArray
+                    if direct_chunk_read[jj]:
+                        filter_mask, frame = datasets[jj].id.read_direct_chunk(
+                            (local_index, 0, 0)
+                        )
+                        if filter_mask:
+                            frame = datasets[jj][local_index]
+                    else:
+                        frame = datasets[jj][local_index]
+                    if not self._put(self._read_queue, (sequence, frame)):
+                        return
+        except Exception as ex:
+            logging.exception("The streaming frame source failed to read frames")
+            self._put(self._send_queue, ex)
+        # One sentinel for each compressor thread
+        for _ in range(self.number_of_compressors):
+            self._put(self._read_queue, _END_OF_SERIES)
+
+    def _compress_frames(self) -> None:
+        """
+        Compresses and encodes frames from the read queue, and puts the
+        encoded image messages in the send queue with their sequence number.
+        Every message has `header_slot_size` free bytes in front of the
+        payload where the header of the image message is written by
+        `write_message`. Runs on each compressor thread
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            item = self._get(self._read_queue)
+            if item is _END_OF_SERIES:
+                return
+            sequence, frame = item
+            try:
+                if isinstance(frame, bytes):
+                    payload = self.encode_payload(frame, True)
+                else:
+                    payload = self.encode_payload(
+                        compress_frame(frame, self.compression, self.block_size), False
+                    )
+            except Exception as ex:
+                logging.exception("The streaming frame source failed to encode frames")
+                self._put(self._send_queue, ex)
+                return
+            message = bytearray(self.header_slot_size + len(payload))
+            message[self.header_slot_size :] = payload
+            if not self._put(self._send_queue, (sequence, message)):
+                return
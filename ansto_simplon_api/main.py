@@ -1,7 +1,10 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.exception_handlers import http_exception_handler
 from fastapi.logger import logger
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from . import __version__
@@ -9,8 +12,11 @@ from .config import get_settings
 from .routes.ansto_endpoints.ansto_endpoints import router as ansto_endpoints
 from .routes.detector.command import router as command
 from .routes.detector.config import router as detector_config
+from .routes.filewriter.filewriter import router as filewriter
+from .routes.monitor.monitor import router as monitor
 from .routes.status.status import router as status
 from .routes.stream.config import router as stream_config
+from .simulate_zmq_stream import zmq_stream
 
 config = get_settings()
 
@@ -20,7 +26,22 @@ with open(config.README, "r") as _file:
     _description = _file.read()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts loading the frames in the background, so that the API is served
+    immediately. Until the frames are loaded the detector state is
+    "initialize", and arming the detector is refused. On shutdown, waits until
+    the filewriter has finished writing the files of the last series
+    """
+    zmq_stream.start_warm_up()
+    yield
+    zmq_stream.filewriter.end_series()
+    zmq_stream.filewriter.wait()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title=config.API_APP_NAME,
     description=_description,
     version=__version__,
@@ -42,10 +63,18 @@ async def favicon():
     return FileResponse(config.API_FAVICON)
 
 
+@app.get("/metrics", tags=["Metrics"])
+def metrics():
+    """Prometheus metrics of the simulated detector stream"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 app.include_router(command)
 app.include_router(stream_config)
 app.include_router(detector_config)
 app.include_router(status)
+app.include_router(monitor)
+app.include_router(filewriter)
 app.include_router(ansto_endpoints)
 
 
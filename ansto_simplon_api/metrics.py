@@ -0,0 +1,106 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Per-frame latencies are in the microsecond to millisecond range, far below
+# the default buckets of prometheus_client
+_FRAME_LATENCY_BUCKETS = (
+    1e-6,
+    2.5e-6,
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+_LOAD_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+FRAMES_SENT = Counter("simplon_frames_sent", "Number of image messages sent")
+BYTES_SENT = Counter("simplon_bytes_sent", "Number of bytes of image messages sent")
+SERIES_STREAMED = Counter(
+    "simplon_series_streamed", "Number of series streamed (including cancelled ones)"
+)
+
+FRAME_ENCODE_SECONDS = Histogram(
+    "simplon_frame_encode_seconds",
+    "Time spent preparing an image message: encoding the per-frame header and "
+    "getting the frame from the frame arena or streaming frame source",
+    buckets=_FRAME_LATENCY_BUCKETS,
+)
+FRAME_SEND_SECONDS = Histogram(
+    "simplon_frame_send_seconds",
+    "Time spent in zmq send for an image message, including the time blocked on "
+    "the high-water mark",
+    buckets=_FRAME_LATENCY_BUCKETS,
+)
+ZMQ_BLOCKED_SECONDS = Counter(
+    "simplon_zmq_blocked_seconds",
+    "Time spent blocked on the ZMQ high-water mark, i.e. waiting for the "
+    "receiver to consume messages",
+)
+FRAMES_DROPPED = Counter(
+    "simplon_frames_dropped",
+    "Number of image messages dropped by the ZMQ overflow policy because the "
+    "receiver could not keep up",
+)
+CONTROL_MESSAGES_DROPPED = Counter(
+    "simplon_control_messages_dropped",
+    "Number of start and end messages which were not sent to a receiver because "
+    "it was not reading (see ZMQ_LINGER)",
+    labelnames=["type"],
+)
+ZMQ_BLOCKED_SENDS = Counter(
+    "simplon_zmq_blocked_sends",
+    "Number of image messages which could not be queued immediately because the "
+    "ZMQ high-water mark was reached",
+)
+ARM_TO_FIRST_FRAME_SECONDS = Histogram(
+    "simplon_arm_to_first_frame_seconds",
+    "Time between sending the start message (arm) and sending the first image "
+    "message of a series",
+    buckets=_LOAD_DURATION_BUCKETS,
+)
+
+FRAME_CACHE_BYTES = Gauge(
+    "simplon_frame_cache_bytes",
+    "Size of the encoded frames of the frame library, cached in memory (or "
+    "memory-mapped)",
+)
+FRAME_CACHE_FRAMES = Gauge(
+    "simplon_frame_cache_frames",
+    "Number of unique frames of the frame library cached in memory",
+)
+FRAME_CACHE_COMPRESSION_RATIO = Gauge(
+    "simplon_frame_cache_compression_ratio",
+    "Uncompressed size of the active dataset divided by the size of its encoded "
+    "frames",
+)
+FRAME_LIBRARY_DATASETS = Gauge(
+    "simplon_frame_library_datasets", "Number of datasets in the frame library"
+)
+DISK_FRAME_CACHE_BYTES = Gauge(
+    "simplon_disk_frame_cache_bytes", "Size of the persistent on-disk frame cache"
+)
+
+DATASET_LOAD_SECONDS = Histogram(
+    "simplon_dataset_load_seconds",
+    "Time spent loading a dataset in create_list_of_compressed_frames",
+    labelnames=["source"],
+    buckets=_LOAD_DURATION_BUCKETS,
+)
+DATA_FILE_LOAD_SECONDS = Histogram(
+    "simplon_data_file_load_seconds",
+    "Time spent reading and compressing a single datafile",
+    labelnames=["method"],
+    buckets=_LOAD_DURATION_BUCKETS,
+)
@@ -0,0 +1,220 @@
+import struct
+import threading
+from collections.abc import Callable
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+
+# TIFF tags written by `encode_tiff`, see the TIFF 6.0 specification
+_TIFF_IMAGE_WIDTH = 256
+_TIFF_IMAGE_LENGTH = 257
+_TIFF_BITS_PER_SAMPLE = 258
+_TIFF_COMPRESSION = 259
+_TIFF_PHOTOMETRIC_INTERPRETATION = 262
+_TIFF_STRIP_OFFSETS = 273
+_TIFF_SAMPLES_PER_PIXEL = 277
+_TIFF_ROWS_PER_STRIP = 278
+_TIFF_STRIP_BYTE_COUNTS = 279
+_TIFF_SAMPLE_FORMAT = 339
+# Field type of the TIFF tags (LONG, i.e. uint32)
+_TIFF_LONG = 4
+
+
+def encode_tiff(image: npt.NDArray) -> bytes:
+    """
+    Encodes a 2D unsigned integer image as an uncompressed, single-strip,
+    little-endian grayscale TIFF
+
+    Parameters
+    ----------
+    image : npt.NDArray
+        The image
+
+    Returns
+    -------
+    bytes
+        The TIFF file
+    """
+    height, width = image.shape
+    data = np.ascontiguousarray(image, dtype=image.dtype.newbyteorder("<"))
+    tags = [
+        (_TIFF_IMAGE_WIDTH, width),
+        (_TIFF_IMAGE_LENGTH, height),
+        (_TIFF_BITS_PER_SAMPLE, image.dtype.itemsize * 8),
+        (_TIFF_COMPRESSION, 1),
+        # BlackIsZero
+        (_TIFF_PHOTOMETRIC_INTERPRETATION, 1),
+        (_TIFF_STRIP_OFFSETS, 0),
+        (_TIFF_SAMPLES_PER_PIXEL, 1),
+        (_TIFF_ROWS_PER_STRIP, height),
+        (_TIFF_STRIP_BYTE_COUNTS, data.nbytes),
+        # Unsigned integer
+        (_TIFF_SAMPLE_FORMAT, 1),
+    ]
+    # Header (8 bytes), then the IFD: number of entries, 12 bytes per entry
+    # and the offset of the next IFD (0: last IFD), then the image data
+    data_offset = 8 + 2 + 12 * len(tags) + 4
+    ifd = struct.pack("<H", len(tags))
+    for tag, value in tags:
+        if tag == _TIFF_STRIP_OFFSETS:
+            value = data_offset
+        ifd += struct.pack("<HHII", tag, _TIFF_LONG, 1, value)
+    ifd += struct.pack("<I", 0)
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + data.tobytes()
+
+
+def bin_image(image: npt.NDArray, binning: int) -> npt.NDArray:
+    """
+    Bins an image by summing blocks of binning x binning pixels. The sums are
+    saturated at the largest value of the data type of the image, so that
+    blocks containing masked pixels remain masked. Rows and columns which do
+    not fill a block are cropped
+
+    Parameters
+    ----------
+    image : npt.NDArray
+        A 2D unsigned integer image
+    binning : int
+        Size of the blocks [pixels]
+
+    Returns
+    -------
+    npt.NDArray
+        The binned image, with the data type of the image
+    """
+    if binning <= 1:
+        return image
+    height = image.shape[0] // binning * binning
+    width = image.shape[1] // binning * binning
+    blocks = image[:height, :width].reshape(
+        height // binning, binning, width // binning, binning
+    )
+    sums = blocks.sum(axis=(1, 3), dtype=np.uint64)
+    binned = np.empty(sums.shape, dtype=image.dtype)
+    np.minimum(sums, np.iinfo(image.dtype).max, out=binned, casting="unsafe")
+    return binned
+
+
+class FrameMonitor:
+    """
+    Keeps the most recent image of the detector for the monitor API, i.e.
+    the preview polled by GUIs. The stream hands over the encoded image (see
+    `update`), and the image is decoded when it is first requested. Decoded and rendered images are cached per image, so that many
+    clients polling the same image do not decode it again.
+    """
+
+    def __init__(self, decode: Callable[[memoryview], npt.NDArray]) -> None:
+        """
+        Parameters
+        ----------
+        decode : Callable[[memoryview], npt.NDArray]
+            Function which decodes the CBOR-encoded payload of an image message
+            into the uncompressed frame
+
+        Returns
+        -------
+        None
+        """
+        self.decode = decode
+        self.mode: Literal["enabled", "disabled"] = "enabled"
+        # (series_id, image_id, payload) of the most recent image
+        self._latest: tuple[int, int, bytes] | None = None
+        self._lock = threading.Lock()
+        # (series_id, image_id) of the cached images, the decoded frame and the
+        # rendered images keyed by (format, binning, downsampling)
+        self._cached_image: tuple[int, int] | None = None
+        self._decoded: npt.NDArray | None = None
+        self._rendered: dict[tuple[str, int, int], tuple[tuple[int, int], bytes]] = {}
+
+    def update(self, series_id: int, image_id: int, payload: memoryview) -> None:
+        """
+        Sets the most recent image. Called for every image of a series, so the
+        image is only decoded when it is requested. The payload is copied,
+        since a reference to it would keep the whole frame arena it belongs
+        to in memory, e.g. after another dataset is loaded
+
+        Parameters
+        ----------
+        series_id : int
+            Series id of the image
+        image_id : int
+            Image id of the image
+        payload : memoryview
+            The CBOR-encoded payload of the image message
+
+        Returns
+        -------
+        None
+        """
+        if self.mode == "enabled":
+            self._latest = (series_id, image_id, bytes(payload))
+
+    def get_image(self) -> tuple[int, int, npt.NDArray] | None:
+        """
+        Gets the most recent image, decoding it if it has not been decoded yet
+
+        Returns
+        -------
+        tuple[int, int, npt.NDArray] | None
+            The series id, image id and uncompressed frame, or None if no
+            image has been streamed yet
+        """
+        latest = self._latest
+        if latest is None:
+            return None
+        series_id, image_id, payload = latest
+        with self._lock:
+            if self._cached_image != (series_id, image_id):
+                self._decoded = self.decode(memoryview(payload))
+                self._rendered = {}
+                self._cached_image = (series_id, image_id)
+            return series_id, image_id, self._decoded
+
+    def render(
+        self,
+        format: Literal["tiff", "raw"],
+        binning: int = 1,
+        downsampling: int = 1,
+    ) -> tuple[int, int, npt.DTypeLike, tuple[int, int], bytes] | None:
+        """
+        Renders the most recent image as a TIFF file or as raw bytes, after
+        binning (see `bin_image`) and downsampling it, i.e. keeping every
+        downsampling-th pixel of every downsampling-th row
+
+        Parameters
+        ----------
+        format : Literal["tiff", "raw"]
+            Format of the image
+        binning : int, optional
+            Size of the blocks of pixels which are summed [pixels]
+        downsampling : int, optional
+            Downsampling factor, applied after binning
+
+        Returns
+        -------
+        tuple[int, int, npt.DTypeLike, tuple[int, int], bytes] | None
+            The series id, image id, data type and shape of the rendered
+            image, and its encoding. None if no image has been streamed yet
+        """
+        latest = self.get_image()
+        if latest is None:
+            return None
+        series_id, image_id, frame = latest
+        key = (format, binning, downsampling)
+        with self._lock:
+            rendered = (
+                self._rendered.get(key)
+                if self._cached_image == (series_id, image_id)
+                else None
+            )
+        if rendered is None:
+            image = bin_image(frame, binning)[::downsampling, ::downsampling]
+            if format == "tiff":
+                rendered = image.shape, encode_tiff(image)
+            else:
+                rendered = image.shape, np.ascontiguousarray(image).tobytes()
+            with self._lock:
+                if self._cached_image == (series_id, image_id):
+                    self._rendered[key] = rendered
+        return series_id, image_id, frame.dtype, *rendered
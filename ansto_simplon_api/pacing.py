@@ -0,0 +1,166 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Literal
+
+import numpy as np
+
+
+@dataclass
+class PacingStatistics:
+    """Achieved frame rate and jitter of the last series"""
+
+    number_of_frames: int = 0
+    target_frame_rate: float | None = None
+    achieved_frame_rate: float | None = None
+    # Jitter, i.e. time between the deadline of a frame and the time the
+    # frame was released [seconds]. Zero if pacing is disabled
+    mean_jitter: float = 0.0
+    std_jitter: float = 0.0
+    p99_jitter: float = 0.0
+    max_jitter: float = 0.0
+    # Number of frames released more than one period after their deadline.
+    # Zero if pacing is disabled
+    late_frames: int = 0
+    # Number of deadlines dropped by the "skip" policy
+    skipped_deadlines: int = 0
+
+
+class FramePacer:
+    """
+    Paces frames against absolute deadlines. The deadline of frame n is
+    start + (n + 1) * period on the monotonic clock, so the time spent encoding
+    and sending frames does not accumulate into a drift.
+
+    To reach sub-millisecond periods, the pacer sleeps until `spin_threshold`
+    seconds before a deadline and busy-waits for the remaining time. When the
+    sender falls behind, the "catch_up" policy releases the late frames
+    immediately until the schedule is met again, while the "skip" policy drops
+    the missed deadlines and re-anchors the schedule on the next deadline.
+    """
+
+    def __init__(
+        self,
+        period: float,
+        policy: Literal["catch_up", "skip"] = "catch_up",
+        spin_threshold: float = 0.002,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        period : float
+            Time between frames [seconds]. If period <= 0, frames are released
+            as fast as possible
+        policy : Literal["catch_up", "skip"], optional
+            Policy applied when frames are released after their deadline
+        spin_threshold : float, optional
+            Time before a deadline from which the pacer busy-waits instead of
+            sleeping [seconds]
+
+        Returns
+        -------
+        None
+        """
+        self.period = max(period, 0.0)
+        self.policy = policy
+        self.spin_threshold = spin_threshold
+
+        self._start_time = 0.0
+        self._last_release_time = 0.0
+        self._next_deadline = 0.0
+        self._number_of_frames = 0
+        self._skipped_deadlines = 0
+        self._jitter = np.zeros(0)
+
+    def start(self, number_of_frames: int) -> None:
+        """
+        Starts the schedule of a series. The first frame is due one period
+        from now
+
+        Parameters
+        ----------
+        number_of_frames : int
+            Number of frames in the series, used to preallocate the jitter
+            statistics
+
+        Returns
+        -------
+        None
+        """
+        # Without pacing there are no deadlines, so there is no jitter
+        self._jitter = np.zeros(number_of_frames if self.period > 0 else 0)
+        self._number_of_frames = 0
+        self._skipped_deadlines = 0
+        self._start_time = time.perf_counter()
+        self._last_release_time = self._start_time
+        self._next_deadline = self._start_time + self.period
+
+    def wait(self, cancel_event: threading.Event | None = None) -> bool:
+        """
+        Waits until the deadline of the next frame
+
+        Parameters
+        ----------
+        cancel_event : threading.Event | None, optional
+            Event which interrupts the wait when it is set
+
+        Returns
+        -------
+        bool
+            False if the wait was interrupted by `cancel_event`
+        """
+        deadline = self._next_deadline
+        sleep_time = deadline - time.perf_counter() - self.spin_threshold
+        if sleep_time > 0:
+            if cancel_event is not None:
+                if cancel_event.wait(sleep_time):
+                    return False
+            else:
+                time.sleep(sleep_time)
+        while time.perf_counter() < deadline:
+            pass
+
+        now = time.perf_counter()
+        self._last_release_time = now
+        if self._number_of_frames < len(self._jitter):
+            self._jitter[self._number_of_frames] = now - deadline
+        self._number_of_frames += 1
+
+        self._next_deadline = deadline + self.period
+        if self.policy == "skip" and self.period > 0 and now > self._next_deadline:
+            missed_deadlines = math.ceil((now - self._next_deadline) / self.period)
+            self._next_deadline += missed_deadlines * self.period
+            self._skipped_deadlines += missed_deadlines
+        return True
+
+    def statistics(self) -> PacingStatistics:
+        """
+        Computes the achieved frame rate and jitter statistics of the frames
+        released since `start`
+
+        Returns
+        -------
+        PacingStatistics
+            The pacing statistics
+        """
+        elapsed_time = self._last_release_time - self._start_time
+        target_frame_rate = 1 / self.period if self.period > 0 else None
+        if self._number_of_frames == 0:
+            return PacingStatistics(target_frame_rate=target_frame_rate)
+        statistics = PacingStatistics(
+            number_of_frames=self._number_of_frames,
+            target_frame_rate=target_frame_rate,
+            achieved_frame_rate=(
+                self._number_of_frames / elapsed_time if elapsed_time > 0 else None
+            ),
+            skipped_deadlines=self._skipped_deadlines,
+        )
+        jitter = self._jitter[: min(self._number_of_frames, len(self._jitter))]
+        if len(jitter) > 0:
+            statistics.mean_jitter = float(jitter.mean())
+            statistics.std_jitter = float(jitter.std())
+            statistics.p99_jitter = float(np.percentile(jitter, 99))
+            statistics.max_jitter = float(jitter.max())
+            statistics.late_frames = int(np.count_nonzero(jitter > self.period))
+        return statistics
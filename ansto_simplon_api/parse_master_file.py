@@ -1,8 +1,11 @@
 import logging
+from typing import TYPE_CHECKING
 
-import h5py
 import numpy as np
 
+if TYPE_CHECKING:
+    import h5py
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s: %(message)s",
@@ -10,13 +13,52 @@ logging.basicConfig(
 )
 
 
+# Leaf names of the datasets read by `Parse.header`
+START_MESSAGE_KEYS = (
+    "beam_center_x",
+    "beam_center_y",
+    "count_time",
+    "countrate_correction_applied",
+    "data_collection_date",
+    "description",
+    "detector_number",
+    "flatfield_correction_applied",
+    "frame_time",
+    "incident_wavelength",
+    "photon_energy",
+    "pixel_mask_applied",
+    "sensor_material",
+    "sensor_thickness",
+    "threshold_energy",
+    "virtual_pixel_correction_applied",
+    "x_pixel_size",
+    "x_pixels_in_detector",
+    "y_pixel_size",
+    "y_pixels_in_detector",
+)
+
+# Paths of the datasets used for leaf names which are shared by several
+# datasets of a NeXus master file, e.g. the wavelength is also stored under
+# /entry/sample/beam
+CANONICAL_PATHS = {
+    "incident_wavelength": "entry/instrument/beam/incident_wavelength",
+    "omega_range_average": "entry/sample/goniometer/omega_range_average",
+}
+
+
 class Parse:
     """
     Class for reading in a HDF5 Master file and generating a
     Dectris Stream2 set of messages (start, image, end).
+
+    Datasets are looked up by their leaf name (e.g. "count_time") in an index
+    built with a single traversal of the Master file. Leaf names shared by
+    several datasets resolve to their canonical path (see CANONICAL_PATHS) or,
+    if they have none, are reported as ambiguous once and resolve to the first
+    dataset in traversal order.
     """
 
-    def __init__(self, hdf5_file: h5py.File) -> None:
+    def __init__(self, hdf5_file: "h5py.File") -> None:
         """
         Parameters
         ----------
@@ -27,38 +69,83 @@ class Parse:
         -------
         None
         """
+        import h5py
+
         self.hf = hdf5_file
-        self.entries = self.list_entries(self.hf)
+        self.index: dict[str, list[str]] = {}
+        # The low-level visit reports the type of each object without opening
+        # it, which is much faster than h5py.Group.visititems
+        h5py.h5o.visit(self.hf.id, self._add_entry, info=True)
+        self.ambiguous_keys = {
+            key: paths for key, paths in self.index.items() if len(paths) > 1
+        }
+        self._values: dict[str, str | int | float] = {}
+        self._reported_ambiguous_keys: set[str] = set()
 
-    @staticmethod
-    def list_entries(hdf5_file: h5py.File) -> list[str]:
+    def _add_entry(self, name: bytes, info: "h5py.h5o.ObjInfo") -> None:
         """
-        Generates a list of all entries in the hdf5 Master file.
+        Adds an entry of the Master file to the leaf name index if it is a
+        dataset. Called by h5py.h5o.visit
 
         Parameters
         ----------
-        hdf5-file : h5py.File object
-            A hdf5 Master file read in via h5py.File()
+        name : bytes
+            Path of the entry
+        info : h5py.h5o.ObjInfo
+            Object info of the entry
+
+        Returns
+        -------
+        None
+        """
+        import h5py
+
+        if info.type == h5py.h5o.TYPE_DATASET:
+            path = name.decode()
+            self.index.setdefault(path.rsplit("/", 1)[-1], []).append(path)
+
+    def find(self, look_for: str) -> str:
+        """
+        Finds the path of the dataset with the given leaf name. If several
+        datasets share the leaf name, its canonical path (see CANONICAL_PATHS)
+        is used. Otherwise a warning listing them is logged the first time the
+        key is looked up, and the first one is used
+
+        Parameters
+        ----------
+        look_for : str
+            The leaf name of the dataset, e.g. "count_time"
 
         Returns
         -------
-        entries : list[str]
+        path : str
+            The path of the dataset
+
+        Raises
+        ------
+        KeyError
+            If no dataset has this leaf name
         """
-        entries = []
-        hdf5_file.visit(entries.append)
-        return entries
+        paths = self.index.get(look_for)
+        if not paths:
+            raise KeyError(f"Key {look_for} not found in the HDF5 file entries.")
+        if len(paths) > 1:
+            if CANONICAL_PATHS.get(look_for) in paths:
+                return CANONICAL_PATHS[look_for]
+            if look_for in self._reported_ambiguous_keys:
+                return paths[0]
+            self._reported_ambiguous_keys.add(look_for)
+            logging.warning(
+                f"Key {look_for} is ambiguous, it matches {len(paths)} datasets: "
+                f"{', '.join(paths)}. Using {paths[0]}"
+            )
+        return paths[0]
 
     def parse(self, look_for: str) -> str | int | float:
         """
         Looks up and returns entry from Master file. Treats the
-        Master file like a key:value store with unique keys.
-
-        TODO:
-        This method assumes that each key is unique which might
-        not hold true. Seems to work for the input Master files
-        used so far. If this becomes a problem, the whole thing
-        should be redone with direct reference to the hdf5
-        fields and data.
+        Master file like a key:value store, where the keys are the leaf
+        names of the datasets (see `find`). Values are read once and cached.
 
         Parameters
         ----------
@@ -69,19 +156,50 @@ class Parse:
         -------
         item : str or int or float
             The value stored under the key.
+
+        Raises
+        ------
+        KeyError
+            If the key is not found in the Master file
+        """
+        if look_for not in self._values:
+            item = np.array(self.hf[self.find(look_for)]).item()
+            try:
+                # Decode if string
+                item = item.decode()
+            except AttributeError:
+                # Leave as is if float or int
+                pass
+            self._values[look_for] = item
+        return self._values[look_for]
+
+    def parse_many(self, keys: tuple[str, ...]) -> dict[str, str | int | float]:
         """
-        for entry in self.entries:
-            sublist = entry.split("/")
-            # Find exact entry
-            if look_for in sublist:
-                item = np.array(self.hf.get(entry)).item()
-                try:
-                    # Decode if string
-                    return item.decode()
-                except AttributeError:
-                    # Leave as is if float or int
-                    return item
-        raise KeyError(f"Key {look_for} not found in the HDF5 file entries.")
+        Looks up several keys at once (see `parse`). Every key is resolved
+        before any dataset is read, so that all missing keys are reported
+        together
+
+        Parameters
+        ----------
+        keys : tuple[str, ...]
+            The keys to look up in the Master file
+
+        Returns
+        -------
+        values : dict[str, str | int | float]
+            The value stored under each key
+
+        Raises
+        ------
+        KeyError
+            If any of the keys is not found in the Master file
+        """
+        missing_keys = [key for key in keys if key not in self.index]
+        if missing_keys:
+            raise KeyError(
+                f"Keys {', '.join(missing_keys)} not found in the HDF5 file entries."
+            )
+        return {key: self.parse(key) for key in keys}
 
     def header(self) -> tuple[dict, dict, dict]:
         """
@@ -138,25 +256,26 @@ class Parse:
                 "Setting start value to 0.0"
             )
 
+        values = self.parse_many(START_MESSAGE_KEYS)
         start_message = {
             "type": "start",
-            "arm_date": self.parse("data_collection_date"),
-            "beam_center_x": self.parse("beam_center_x"),
-            "beam_center_y": self.parse("beam_center_y"),
+            "arm_date": values["data_collection_date"],
+            "beam_center_x": values["beam_center_x"],
+            "beam_center_y": values["beam_center_y"],
             "channels": ["1"],
-            "count_time": self.parse("count_time"),
+            "count_time": values["count_time"],
             "countrate_correction_enabled": bool(
-                self.parse("countrate_correction_applied")
+                values["countrate_correction_applied"]
             ),
             "countrate_correction_lookup_table": None,
-            "detector_description": self.parse("description"),
-            "detector_serial_number": self.parse("detector_number"),
+            "detector_description": values["description"],
+            "detector_serial_number": values["detector_number"],
             "detector_translation": np.array(
                 self.hf["/entry/instrument/detector/geometry/translation/distances"]
             ).tolist(),
             "flatfield": None,
-            "flatfield_enabled": bool(self.parse("flatfield_correction_applied")),
-            "frame_time": self.parse("frame_time"),
+            "flatfield_enabled": bool(values["flatfield_correction_applied"]),
+            "frame_time": values["frame_time"],
             "goniometer": {
                 "omega": {
                     "increment": omega_range_average,
@@ -168,10 +287,10 @@ class Parse:
                     "start": 0.0,
                 },
             },
-            "image_size_x": self.parse("x_pixels_in_detector"),
-            "image_size_y": self.parse("y_pixels_in_detector"),
-            "incident_energy": self.parse("photon_energy"),
-            "incident_wavelength": self.parse("incident_wavelength"),
+            "image_size_x": values["x_pixels_in_detector"],
+            "image_size_y": values["y_pixels_in_detector"],
+            "incident_energy": values["photon_energy"],
+            "incident_wavelength": values["incident_wavelength"],
             "number_of_images": int(
                 np.array(
                     self.hf["/entry/instrument/detector/detectorSpecific/ntrigger"]
@@ -183,25 +302,39 @@ class Parse:
                 ).tolist()
             ),
             "pixel_mask": None,
-            "pixel_mask_enabled": bool(self.parse("pixel_mask_applied")),
-            "pixel_size_x": self.parse("x_pixel_size"),
-            "pixel_size_y": self.parse("y_pixel_size"),
+            "pixel_mask_enabled": bool(values["pixel_mask_applied"]),
+            "pixel_size_x": values["x_pixel_size"],
+            "pixel_size_y": values["y_pixel_size"],
             "saturation_value": saturation_value,
-            "sensor_material": self.parse("sensor_material"),
-            "sensor_thickness": self.parse("sensor_thickness"),
+            "sensor_material": values["sensor_material"],
+            "sensor_thickness": values["sensor_thickness"],
             "series_id": None,  # int
             "series_unique_id": None,  # str
             "threshold_energy": {
-                "threshold_1": self.parse("threshold_energy"),
-                "threshold_2": self.parse("threshold_energy") * 3,
+                "threshold_1": values["threshold_energy"],
+                "threshold_2": values["threshold_energy"] * 3,
             },
             "user_data": {"pi": float(np.pi)},
             "virtual_pixel_interpolation_enabled": bool(
-                self.parse("virtual_pixel_correction_applied")
+                values["virtual_pixel_correction_applied"]
             ),
         }
 
-        image_message = {
+        return start_message, self.image_message(), self.end_message()
+
+    @staticmethod
+    def image_message() -> dict:
+        """
+        Generates the Dectris stream2 image message structure. The
+        fields marked "FIX" are filled in for every frame by
+        simulate_zmq_stream.py
+
+        Returns
+        -------
+        image_message : dict
+            The image message structure
+        """
+        return {
             "type": "image",
             "series_id": "FIX",
             "series_unique_id": "FIX",
@@ -223,9 +356,18 @@ class Parse:
             ],
         }
 
-        end_message = {
+    @staticmethod
+    def end_message() -> dict:
+        """
+        Generates the Dectris stream2 end message structure.
+
+        Returns
+        -------
+        end_message : dict
+            The end message structure
+        """
+        return {
             "type": "end",
             "series_id": "FIX",
             "series_unique_id": "FIX",
         }
-        return start_message, image_message, end_message
@@ -1,10 +1,23 @@
+from dataclasses import asdict
 from typing import Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from fastapi.exceptions import HTTPException
 from starlette import status
 
-from ...schemas.ansto_endpoints import LoadHDF5File
+from ...schemas.ansto_endpoints import (
+    CodecBenchmark,
+    FrameCacheStatus,
+    FrameLibraryEntry,
+    FrameLibraryStatus,
+    FramePacing,
+    LoadHDF5File,
+    OverflowPolicy,
+    PacingStatistics,
+    ReencodeProgress,
+    StreamProgress,
+    SyntheticFrames,
+)
 from ...schemas.configuration import SimplonRequestFloat
 from ...schemas.status import detector_state
 from ...simulate_zmq_stream import zmq_stream
@@ -14,11 +27,22 @@ router = APIRouter(prefix="/ansto_endpoints", tags=["ANSTO Endpoints"])
 
 @router.put("/hdf5_master_file")
 async def set_master_file(hdf5_model: LoadHDF5File):
+    if zmq_stream.is_streaming:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot load a master file while a series is being streamed",
+        )
+    if zmq_stream.is_warming_up:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot load a master file while the frames are being loaded at startup",
+        )
     try:
         zmq_stream.create_list_of_compressed_frames(
             hdf5_file_path=hdf5_model.hdf5_file_path,
             compression=hdf5_model.compression,
             number_of_datafiles=hdf5_model.number_of_datafiles,
+            reuse=True,
         )
     except IndexError as ex:
         raise HTTPException(
@@ -37,6 +61,11 @@ async def set_master_file(hdf5_model: LoadHDF5File):
 
 @router.get("/hdf5_master_file")
 async def get_master_file() -> LoadHDF5File:
+    if zmq_stream.hdf5_file_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No master file is loaded, frames are generated synthetically",
+        )
     return LoadHDF5File(
         hdf5_file_path=zmq_stream.hdf5_file_path,
         number_of_datafiles=zmq_stream.number_of_data_files,
@@ -44,6 +73,206 @@ async def get_master_file() -> LoadHDF5File:
     )
 
 
+@router.put("/synthetic_frames")
+async def set_synthetic_frames(synthetic_frames: SyntheticFrames) -> SyntheticFrames:
+    if zmq_stream.is_streaming:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot generate frames while a series is being streamed",
+        )
+    if zmq_stream.is_warming_up:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot generate frames while the frames are being loaded at startup",
+        )
+    try:
+        zmq_stream.create_synthetic_frames(
+            detector_size=synthetic_frames.detector_size,
+            dtype=synthetic_frames.dtype,
+            number_of_frames=synthetic_frames.number_of_frames,
+            compression=synthetic_frames.compression,
+            reuse=True,
+        )
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)
+        ) from ex
+    zmq_stream.frame_id = 0
+    zmq_stream.image_number = 0
+    return synthetic_frames
+
+
+@router.get("/synthetic_frames")
+async def get_synthetic_frames() -> SyntheticFrames:
+    if zmq_stream.synthetic_detector is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Frames are loaded from a master file",
+        )
+    return SyntheticFrames(
+        detector_size=zmq_stream.synthetic_detector,
+        dtype=zmq_stream.synthetic_dtype,
+        number_of_frames=len(zmq_stream.frames),
+        compression=zmq_stream.compression,
+    )
+
+
+@router.get("/frame_cache")
+async def get_frame_cache() -> FrameCacheStatus:
+    frame_cache = zmq_stream.frame_cache
+    if frame_cache is None:
+        return FrameCacheStatus(enabled=False)
+    return FrameCacheStatus(
+        enabled=True,
+        cache_dir=frame_cache.cache_dir,
+        size_bytes=frame_cache.size,
+        max_bytes=frame_cache.max_bytes,
+        entries=frame_cache.entries(),
+    )
+
+
+@router.delete("/frame_cache")
+async def clear_frame_cache():
+    if zmq_stream.frame_cache is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The frame cache is disabled. Set AS_DISK_CACHE_DIR to enable it",
+        )
+    return {"value": zmq_stream.frame_cache.clear()}
+
+
+def _get_frame_library_entry(name: str) -> FrameLibraryEntry:
+    for entry in zmq_stream.frame_library.entries():
+        if entry["name"] == name:
+            return FrameLibraryEntry(**entry)
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Dataset {name} is not in the frame library",
+    )
+
+
+@router.get("/frame_library")
+async def get_frame_library() -> FrameLibraryStatus:
+    frame_library = zmq_stream.frame_library
+    return FrameLibraryStatus(
+        max_bytes=frame_library.max_bytes,
+        size_bytes=frame_library.size,
+        active=frame_library.active,
+        datasets=frame_library.entries(),
+    )
+
+
+@router.put("/frame_library/{name}/hdf5_master_file")
+def preload_master_file(name: str, hdf5_model: LoadHDF5File) -> FrameLibraryEntry:
+    try:
+        zmq_stream.create_list_of_compressed_frames(
+            hdf5_file_path=hdf5_model.hdf5_file_path,
+            compression=hdf5_model.compression,
+            number_of_datafiles=hdf5_model.number_of_datafiles,
+            name=name,
+            activate=False,
+        )
+    except IndexError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="The number of datafiles specified exceed the number of datafiles available "
+            "in the master file. Reduce number_of_datafiles",
+        ) from ex
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)
+        ) from ex
+    return _get_frame_library_entry(name)
+
+
+@router.put("/frame_library/{name}/synthetic_frames")
+def preload_synthetic_frames(
+    name: str, synthetic_frames: SyntheticFrames
+) -> FrameLibraryEntry:
+    try:
+        zmq_stream.create_synthetic_frames(
+            detector_size=synthetic_frames.detector_size,
+            dtype=synthetic_frames.dtype,
+            number_of_frames=synthetic_frames.number_of_frames,
+            compression=synthetic_frames.compression,
+            name=name,
+            activate=False,
+        )
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    except Exception as ex:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex)
+        ) from ex
+    return _get_frame_library_entry(name)
+
+
+@router.put("/frame_library/{name}/activate")
+async def activate_dataset(name: str) -> FrameLibraryEntry:
+    if zmq_stream.is_streaming or zmq_stream.is_warming_up:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot switch datasets while a series is being streamed or the "
+            "frames are being loaded at startup",
+        )
+    try:
+        zmq_stream.activate_dataset(name)
+    except KeyError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Dataset {name} is not in the frame library",
+        ) from ex
+    zmq_stream.frame_id = 0
+    zmq_stream.image_number = 0
+    return _get_frame_library_entry(name)
+
+
+@router.delete("/frame_library/{name}")
+async def remove_dataset(name: str):
+    try:
+        zmq_stream.frame_library.remove(name)
+    except KeyError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Dataset {name} is not in the frame library",
+        ) from ex
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(ex)
+        ) from ex
+    return {"value": name}
+
+
+@router.get("/stream_progress")
+async def get_stream_progress() -> StreamProgress:
+    return StreamProgress(**zmq_stream.get_progress())
+
+
+@router.get("/codec_benchmark")
+def get_codec_benchmark(
+    number_of_frames: int = Query(default=10, gt=0),
+    bslz4_block_sizes: list[int] = Query(default=[0, 1024, 4096, 16384]),
+) -> list[CodecBenchmark]:
+    try:
+        results = zmq_stream.benchmark_codecs(number_of_frames, bslz4_block_sizes)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    return [CodecBenchmark(**result) for result in results]
+
+
+@router.get("/reencode_progress")
+async def get_reencode_progress() -> ReencodeProgress:
+    return ReencodeProgress(**zmq_stream.get_reencode_progress())
+
+
 @router.get("/delay_between_frames")
 async def get_delay_between_frames_in_seconds() -> SimplonRequestFloat:
     return SimplonRequestFloat(value=zmq_stream.delay_between_frames)
@@ -57,6 +286,40 @@ async def set_delay_between_frames_in_seconds(
     return SimplonRequestFloat(value=zmq_stream.delay_between_frames)
 
 
+@router.get("/frame_pacing")
+async def get_frame_pacing() -> FramePacing:
+    return FramePacing(
+        pace_with_frame_time=zmq_stream.pace_with_frame_time,
+        policy=zmq_stream.pacing_policy,
+        spin_threshold=zmq_stream.spin_threshold,
+    )
+
+
+@router.put("/frame_pacing")
+async def set_frame_pacing(pacing: FramePacing) -> FramePacing:
+    zmq_stream.pace_with_frame_time = pacing.pace_with_frame_time
+    zmq_stream.pacing_policy = pacing.policy
+    zmq_stream.spin_threshold = pacing.spin_threshold
+    return pacing
+
+
+@router.get("/overflow_policy")
+async def get_overflow_policy() -> OverflowPolicy:
+    return OverflowPolicy(value=zmq_stream.overflow_policy)
+
+
+@router.put("/overflow_policy")
+async def set_overflow_policy(policy: OverflowPolicy) -> OverflowPolicy:
+    # Applies to the next series, see ZmqStream.arm
+    zmq_stream.overflow_policy = policy.value
+    return policy
+
+
+@router.get("/pacing_statistics")
+async def get_pacing_statistics() -> PacingStatistics:
+    return PacingStatistics(**asdict(zmq_stream.pacing_statistics))
+
+
 @router.put("/state")
 def set_detector_state(
     state: Literal[
@@ -1,5 +1,10 @@
+import logging
+
 from fastapi import APIRouter
+from fastapi.exceptions import HTTPException
+from starlette import status
 
+from ...schemas.status import detector_state
 from ...simulate_zmq_stream import zmq_stream
 
 router = APIRouter(prefix="/detector/api/1.8.0/command", tags=["Detector Command"])
@@ -7,19 +12,52 @@ router = APIRouter(prefix="/detector/api/1.8.0/command", tags=["Detector Command
 
 @router.put("/trigger")
 def trigger():
-    zmq_stream.stream_frames(zmq_stream.frames)
+    # The series is streamed in the background, the state is "acquire" until
+    # all frames have been sent
+    try:
+        zmq_stream.trigger()
+    except RuntimeError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(ex)
+        ) from ex
 
 
 @router.put("/arm")
 def arm():
-    zmq_stream.sequence_id += 1
-    # Reset the image number every time we arm the detector
-    zmq_stream.image_number = 0
-    zmq_stream.stream_start_message()
-    return {"sequence id": zmq_stream.sequence_id}
+    # The configuration of the series is captured when the detector is armed,
+    # later configuration changes apply to the next series
+    try:
+        sequence_id = zmq_stream.arm()
+    except RuntimeError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(ex)
+        ) from ex
+    detector_state.state = "ready"
+    return {"sequence id": sequence_id}
 
 
 @router.put("/disarm")
 def disarm():
-    zmq_stream.stream_end_message()
-    print("Disarm detector")
+    # Stop the series (if any) before ending it
+    zmq_stream.abort()
+    detector_state.state = "idle"
+    logging.info("Disarm detector")
+
+
+@router.put("/cancel")
+def cancel():
+    # Stops the series after the current image, the detector stays armed
+    if not zmq_stream.cancel():
+        # The streaming thread sets the state to "ready" once it stops
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The series is still being stopped",
+        )
+    detector_state.state = "ready"
+
+
+@router.put("/abort")
+def abort():
+    # Stops the series immediately and ends it
+    zmq_stream.abort()
+    detector_state.state = "idle"
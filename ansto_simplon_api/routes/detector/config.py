@@ -1,5 +1,11 @@
-from fastapi import APIRouter
+import asyncio
+from typing import Literal
 
+from fastapi import APIRouter, Depends
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+from ...config import get_settings
 from ...schemas.configuration import (
     Compression,
     ROIMode,
@@ -8,11 +14,31 @@ from ...schemas.configuration import (
     SimplonRequestFloat,
     SimplonRequestInt,
     SimplonRequestStr,
+    ThresholdMode,
     TriggerMode,
 )
 from ...simulate_zmq_stream import zmq_start_message, zmq_stream
 
-router = APIRouter(prefix="/detector/api/1.8.0/config", tags=["Detector Configuration"])
+config = get_settings()
+
+
+async def wait_for_metadata() -> None:
+    """
+    Waits until the detector configuration has been read from the master file
+    (see ZmqStream.start_warm_up), without blocking the event loop. The frames
+    may still be compressed in the background
+    """
+    if not zmq_stream.metadata_loaded.is_set():
+        await asyncio.to_thread(
+            zmq_stream.metadata_loaded.wait, config.WARM_UP_METADATA_TIMEOUT
+        )
+
+
+router = APIRouter(
+    prefix="/detector/api/1.8.0/config",
+    tags=["Detector Configuration"],
+    dependencies=[Depends(wait_for_metadata)],
+)
 
 
 ### Detector subsystem config
@@ -48,8 +74,12 @@ async def put_beam_center_y(input: SimplonRequestFloat):
 
 @router.put("/bit_depth_image")
 async def put_bit_depth_image(input: SimplonRequestInt):
-    zmq_stream.detector_config.detector_bit_depth_image = input.value
-    # the bit depth image is not the dtype
+    try:
+        zmq_stream.set_bit_depth_image(input.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
     return {"value": zmq_stream.detector_config.detector_bit_depth_image}
 
 
@@ -70,7 +100,12 @@ async def get_bit_depth_readout():
 
 @router.put("/compression")
 async def set_compression(compression: Compression):
-    zmq_stream.compression = compression.value
+    try:
+        zmq_stream.set_compression(compression.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
     return {"value": zmq_stream.compression}
 
 
@@ -277,7 +312,12 @@ async def get_roi_mode():
 
 @router.put("/roi_mode")
 async def put_roi_mode(input: ROIMode):
-    zmq_stream.detector_config.roi_mode = input.value
+    try:
+        zmq_stream.set_roi_mode(input.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
     return {"value": zmq_stream.detector_config.roi_mode}
 
 
@@ -324,10 +364,29 @@ async def put_threshold_energy(input: SimplonRequestDict):
 
 
 # threshold / n / energy
-# threshold / n / mode
 # threshold / difference / upper_threshold
 
 
+@router.get("/threshold/{threshold}/mode")
+async def get_threshold_mode(threshold: Literal["2", "difference"]):
+    if threshold == "2":
+        return {"value": zmq_stream.detector_config.threshold_2_mode}
+    return {"value": zmq_stream.detector_config.threshold_difference_mode}
+
+
+@router.put("/threshold/{threshold}/mode")
+async def put_threshold_mode(
+    threshold: Literal["2", "difference"], input: ThresholdMode
+):
+    try:
+        zmq_stream.set_threshold_mode(threshold, input.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    return {"value": input.value}
+
+
 @router.get("/trigger_mode")
 async def get_trigger_mode():
     return {"value": zmq_stream.detector_config.detector_trigger_mode}
@@ -402,17 +461,6 @@ async def put_y_pixels_in_detector(input: SimplonRequestInt):
     return {"value": zmq_start_message.image_size_y}
 
 
-### Monitor subsystem config
-# buffer_size
-# discard_new
-# mode
-
-### Filewriter subsystem config
-# compression_enabled
-# image_nr_start
-# nimages_per_file
-
-
 ### Other
 # @router.put("/detector_type")
 @router.get("/detector_type")
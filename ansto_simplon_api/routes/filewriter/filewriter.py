@@ -0,0 +1,103 @@
+from fastapi import APIRouter
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+from ...schemas.configuration import (
+    FileWriterMode,
+    SimplonRequestBool,
+    SimplonRequestInt,
+    SimplonRequestStr,
+)
+from ...simulate_zmq_stream import zmq_stream
+
+router = APIRouter(prefix="/filewriter/api/1.8.0", tags=["Filewriter"])
+
+
+### Filewriter subsystem config
+# Settings take effect the next time the detector is armed
+
+
+@router.get("/config/mode")
+async def get_mode() -> FileWriterMode:
+    return FileWriterMode(value=zmq_stream.filewriter.mode)
+
+
+@router.put("/config/mode")
+async def put_mode(input: FileWriterMode) -> FileWriterMode:
+    try:
+        zmq_stream.filewriter.set_mode(input.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    return input
+
+
+@router.get("/config/compression_enabled")
+async def get_compression_enabled():
+    return {"value": zmq_stream.filewriter.compression_enabled}
+
+
+@router.put("/config/compression_enabled")
+async def put_compression_enabled(input: SimplonRequestBool):
+    zmq_stream.filewriter.compression_enabled = input.value
+    return {"value": zmq_stream.filewriter.compression_enabled}
+
+
+@router.get("/config/image_nr_start")
+async def get_image_nr_start():
+    return {"value": zmq_stream.filewriter.image_nr_start}
+
+
+@router.put("/config/image_nr_start")
+async def put_image_nr_start(input: SimplonRequestInt):
+    zmq_stream.filewriter.image_nr_start = input.value
+    return {"value": zmq_stream.filewriter.image_nr_start}
+
+
+@router.get("/config/nimages_per_file")
+async def get_nimages_per_file():
+    return {"value": zmq_stream.filewriter.nimages_per_file}
+
+
+@router.put("/config/nimages_per_file")
+async def put_nimages_per_file(input: SimplonRequestInt):
+    try:
+        zmq_stream.filewriter.set_nimages_per_file(input.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    return {"value": zmq_stream.filewriter.nimages_per_file}
+
+
+@router.get("/config/name_pattern")
+async def get_name_pattern():
+    return {"value": zmq_stream.filewriter.name_pattern}
+
+
+@router.put("/config/name_pattern")
+async def put_name_pattern(input: SimplonRequestStr):
+    try:
+        zmq_stream.filewriter.set_name_pattern(input.value)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(ex)
+        ) from ex
+    return {"value": zmq_stream.filewriter.name_pattern}
+
+
+### Filewriter subsystem status
+@router.get("/status/state")
+def get_state():
+    return {"value": zmq_stream.filewriter.state}
+
+
+@router.get("/status/frames_dropped")
+def get_frames_dropped():
+    return {"value": zmq_stream.filewriter.frames_dropped}
+
+
+@router.get("/files")
+def get_files():
+    return zmq_stream.filewriter.list_files()
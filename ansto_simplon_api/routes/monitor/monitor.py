@@ -0,0 +1,62 @@
+from typing import Literal
+
+from fastapi import APIRouter, Query, Response
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+from ...schemas.configuration import MonitorMode
+from ...simulate_zmq_stream import zmq_stream
+
+router = APIRouter(prefix="/monitor/api/1.8.0", tags=["Monitor"])
+
+
+### Monitor subsystem config
+# buffer_size
+# discard_new
+
+
+@router.get("/config/mode")
+async def get_mode() -> MonitorMode:
+    return MonitorMode(value=zmq_stream.monitor.mode)
+
+
+@router.put("/config/mode")
+async def put_mode(input: MonitorMode) -> MonitorMode:
+    zmq_stream.monitor.mode = input.value
+    return input
+
+
+@router.get("/images/monitor")
+def get_monitor_image(
+    format: Literal["tiff", "raw"] = "tiff",
+    binning: int = Query(default=1, ge=1),
+    downsampling: int = Query(default=1, ge=1),
+) -> Response:
+    latest = zmq_stream.monitor.get_image()
+    if latest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No image has been streamed yet",
+        )
+    # A binning larger than the image would give an empty image
+    frame_shape = latest[2].shape
+    if binning > min(frame_shape):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"The binning ({binning}) exceeds the size of the image "
+                f"({frame_shape[0]} x {frame_shape[1]})"
+            ),
+        )
+    rendered = zmq_stream.monitor.render(format, binning, downsampling)
+    series_id, image_id, dtype, shape, content = rendered
+    return Response(
+        content=content,
+        media_type="image/tiff" if format == "tiff" else "application/octet-stream",
+        headers={
+            "X-Series-Id": str(series_id),
+            "X-Image-Id": str(image_id),
+            "X-Image-Dtype": str(dtype),
+            "X-Image-Shape": f"{shape[0]},{shape[1]}",
+        },
+    )
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from ...schemas.status import detector_state
+from ...simulate_zmq_stream import zmq_stream
 
 router = APIRouter(prefix="/detector/api/1.8.0/status", tags=["Detector Status"])
 
@@ -8,3 +9,8 @@ router = APIRouter(prefix="/detector/api/1.8.0/status", tags=["Detector Status"]
 @router.get("/state")
 def get_detector_state():
     return {"value": detector_state.state}
+
+
+@router.get("/frames_dropped")
+def get_frames_dropped():
+    return {"value": zmq_stream.frames_dropped}
@@ -7,4 +7,109 @@ from pydantic import BaseModel, Field
 class LoadHDF5File(BaseModel):
     hdf5_file_path: str | Path = Field(examples=["/path/to/master_file"])
     number_of_datafiles: int = Field(default=1, examples=[1])
-    compression: Literal["bslz4", "none"] = Field(default="bslz4", examples=["bslz4"])
+    compression: Literal["bslz4", "lz4", "none"] = Field(
+        default="bslz4", examples=["bslz4"]
+    )
+
+
+class SyntheticFrames(BaseModel):
+    detector_size: Literal["1M", "4M", "9M", "16M", "32M"] = Field(
+        default="4M", examples=["16M"]
+    )
+    dtype: Literal["uint16", "uint32"] = Field(default="uint32", examples=["uint32"])
+    number_of_frames: int = Field(default=10, gt=0, examples=[10])
+    compression: Literal["bslz4", "lz4", "none"] = Field(
+        default="bslz4", examples=["bslz4"]
+    )
+
+
+class FrameCacheStatus(BaseModel):
+    enabled: bool = Field(examples=[True])
+    cache_dir: Path | None = Field(default=None, examples=["/path/to/cache"])
+    size_bytes: int = Field(default=0, examples=[0])
+    max_bytes: int | None = Field(default=None, examples=[50_000_000_000])
+    entries: list[dict] = Field(default=[])
+
+
+class FrameLibraryEntry(BaseModel):
+    name: str = Field(examples=["example_1_master"])
+    active: bool = Field(examples=[True])
+    hdf5_file_path: str | Path | None = Field(
+        default=None, examples=["/path/to/master_file"]
+    )
+    number_of_data_files: int | None = Field(default=None, examples=[1])
+    synthetic_detector: str | None = Field(default=None, examples=[None])
+    synthetic_dtype: str | None = Field(default=None, examples=[None])
+    compression: Literal["bslz4", "lz4", "none"] = Field(examples=["bslz4"])
+    number_of_frames: int = Field(examples=[100])
+    size_bytes: int = Field(examples=[150_000_000])
+    last_used: float = Field(examples=[1700000000.0])
+
+
+class FrameLibraryStatus(BaseModel):
+    max_bytes: int = Field(examples=[50_000_000_000])
+    size_bytes: int = Field(examples=[150_000_000])
+    active: str | None = Field(default=None, examples=["example_1_master"])
+    datasets: list[FrameLibraryEntry] = Field(default=[])
+
+
+class StreamProgress(BaseModel):
+    frames_sent: int = Field(examples=[100])
+    frames_dropped: int = Field(default=0, examples=[0])
+    control_messages_dropped: int = Field(default=0, examples=[0])
+    number_of_frames: int = Field(examples=[3600])
+    frame_rate: float | None = Field(default=None, examples=[100.0])
+    eta: float | None = Field(default=None, examples=[35.0])
+    streaming: bool = Field(examples=[True])
+
+
+class ReencodeProgress(BaseModel):
+    dataset: str | None = Field(default=None, examples=["example_1_master"])
+    roi_mode: Literal["disabled", "4M"] | None = Field(
+        default=None, examples=["disabled"]
+    )
+    compression: Literal["bslz4", "lz4", "none"] | None = Field(
+        default=None, examples=["none"]
+    )
+    image_dtype: Literal["uint16", "uint32"] | None = Field(
+        default=None, examples=["uint16"]
+    )
+    channels: list[str] | None = Field(
+        default=None, examples=[["threshold_1", "threshold_2"]]
+    )
+    frames_encoded: int = Field(examples=[100])
+    number_of_frames: int = Field(examples=[3600])
+    in_progress: bool = Field(examples=[True])
+
+
+class CodecBenchmark(BaseModel):
+    compression: Literal["bslz4", "lz4", "none"] = Field(examples=["bslz4"])
+    block_size: int | None = Field(default=None, examples=[0])
+    number_of_frames: int = Field(examples=[10])
+    compression_ratio: float = Field(examples=[8.5])
+    compress_throughput: float = Field(examples=[1500.0])
+    decompress_throughput: float = Field(examples=[2500.0])
+
+
+class OverflowPolicy(BaseModel):
+    value: Literal["block", "drop_newest", "drop_oldest"] = Field(examples=["block"])
+
+
+class FramePacing(BaseModel):
+    pace_with_frame_time: bool = Field(default=False, examples=[False])
+    policy: Literal["catch_up", "skip"] = Field(
+        default="catch_up", examples=["catch_up"]
+    )
+    spin_threshold: float = Field(default=0.002, examples=[0.002])
+
+
+class PacingStatistics(BaseModel):
+    number_of_frames: int = Field(examples=[3600])
+    target_frame_rate: float | None = Field(default=None, examples=[500.0])
+    achieved_frame_rate: float | None = Field(default=None, examples=[499.8])
+    mean_jitter: float = Field(examples=[1e-6])
+    std_jitter: float = Field(examples=[1e-6])
+    p99_jitter: float = Field(examples=[5e-6])
+    max_jitter: float = Field(examples=[2e-5])
+    late_frames: int = Field(examples=[0])
+    skipped_deadlines: int = Field(examples=[0])
@@ -12,8 +12,20 @@ class ROIMode(BaseModel):
     value: Literal["disabled", "4M"]
 
 
+class MonitorMode(BaseModel):
+    value: Literal["enabled", "disabled"]
+
+
+class ThresholdMode(BaseModel):
+    value: Literal["enabled", "disabled"]
+
+
+class FileWriterMode(BaseModel):
+    value: Literal["enabled", "disabled"]
+
+
 class Compression(BaseModel):
-    value: Literal["bslz4", "none"]
+    value: Literal["bslz4", "lz4", "none"]
 
 
 class SimplonRequestInt(BaseModel):
@@ -90,7 +102,7 @@ class DetectorConfiguration(BaseModel):
     detector_readout_time: float = 0.0000001
     detector_bit_depth_image: int = 32
     detector_bit_depth_readout: int = 16
-    detector_compression: Literal["bslz4", "none"] = "bslz4"
+    detector_compression: Literal["bslz4", "lz4", "none"] = "bslz4"
     detector_countrate_correction_cutoff: int = 126634
     detector_ntrigger: int = 1
     detector_number_of_excluded_pixels: int = 1251206
@@ -98,6 +110,8 @@ class DetectorConfiguration(BaseModel):
     software_version: str = "E-32-0130"
     eiger_fw_version: str = "release-2022.1.2rc2"
     roi_mode: Literal["disabled", "4M"] = "disabled"
+    threshold_2_mode: Literal["enabled", "disabled"] = "disabled"
+    threshold_difference_mode: Literal["enabled", "disabled"] = "disabled"
     pixel_mask_applied: bool = True
 
 
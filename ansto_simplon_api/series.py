@@ -0,0 +1,34 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from .frame_arena import FrameArena
+from .frame_source import StreamingFrameSource
+
+
+@dataclass(frozen=True)
+class SeriesSnapshot:
+    """
+    Configuration of a series, captured when the detector is armed (see
+    ZmqStream.arm). The streaming thread only reads the snapshot, so it needs
+    no locks, and configuration requests received while a series is streamed
+    only change the next snapshot. The messages are read-only mappings
+    """
+
+    series_id: int
+    series_unique_id: str | None
+    start_message: Mapping[str, Any]
+    end_message: Mapping[str, Any]
+    detector_configuration: Mapping[str, Any]
+    # The encoded frames matching the start message
+    frames: FrameArena | StreamingFrameSource
+    number_of_frames_per_trigger: int
+    # Pre-encoded static fields of the image message header (see
+    # ZmqStream._create_image_header_template)
+    image_header_template: bytes
+    number_of_static_header_items: int
+    # Time between frames [seconds]
+    frame_period: float
+    pacing_policy: Literal["catch_up", "skip"]
+    spin_threshold: float
+    overflow_policy: Literal["block", "drop_newest", "drop_oldest"]
@@ -1,24 +1,52 @@
 import logging
+import os
 import struct
+import threading
 import time
 import uuid
-from copy import deepcopy
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
-from typing import Literal
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Literal
 
-import bitshuffle
 import cbor2
-import h5py
-import hdf5plugin  # noqa
 import numpy as np
 import numpy.typing as npt
 import zmq
-from tqdm import trange
-
+from tqdm import tqdm, trange
+
+from . import metrics
+from .compression import (
+    BITSHUFFLE_FILTER_ID,
+    BITSHUFFLE_LZ4,
+    benchmark_codec,
+    compress_frame,
+    compression_header,
+    decompress_frame,
+)
 from .config import get_settings
+from .filewriter import FileWriter, FrameData
+from .frame_arena import FrameArena, FrameArenaBuilder
+from .frame_cache import FrameCache
+from .frame_library import FrameLibrary, FrameVariant, PreparedDataset
+from .frame_source import StreamingFrameSource
+from .monitor import FrameMonitor
+from .pacing import FramePacer, PacingStatistics
 from .parse_master_file import Parse
 from .schemas.configuration import DetectorConfiguration, ZMQStartMessage
+from .schemas.status import detector_state
+from .series import SeriesSnapshot
+from .synthetic_frames import DetectorSize, SyntheticFrameGenerator
+
+if TYPE_CHECKING:
+    # h5py and hdf5plugin are imported when a master file is loaded, to keep
+    # the startup of the app fast
+    import h5py
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,6 +57,71 @@ logging.basicConfig(
 config = get_settings()
 zmq_start_message = ZMQStartMessage()
 
+# Image message fields which are pre-encoded once per frame when the frame cache is
+# built. Every other field of the image message is a (small) header field encoded
+# when the frame is sent
+IMAGE_PAYLOAD_KEYS = ("data", "channels")
+IMAGE_HEADER_KEYS = (
+    "series_id",
+    "series_unique_id",
+    "image_id",
+    "series_date",
+    "stop_time",
+)
+
+# Image size (y, x) of each ROI mode, centred on the detector. The 4M ROI of an
+# EIGER2 16M is made of its 4 x 2 central modules
+ROI_SHAPES = {"4M": (2162, 2068)}
+# Maximum number of pixels decoded at once when frames are re-encoded
+_MAX_REENCODE_BATCH_PIXELS = 2**25
+# Interval at which sends blocked by the high-water mark check whether the
+# series was cancelled [milliseconds]
+_SEND_POLL_INTERVAL = 100
+# Time start and end messages wait for a receiver which is not reading if
+# ZMQ_LINGER is -1 [milliseconds]
+_CONTROL_MESSAGE_TIMEOUT = 2000
+# Time we wait for the streaming thread to stop when a series is cancelled
+# [seconds]
+_CANCEL_TIMEOUT = 5.0
+
+
+def _encode_cbor_map_header(number_of_items: int) -> bytes:
+    """
+    Encodes the header of a CBOR map (major type 5) containing
+    `number_of_items` key-value pairs
+
+    Parameters
+    ----------
+    number_of_items : int
+        Number of key-value pairs in the map
+
+    Returns
+    -------
+    bytes
+        The CBOR map header
+    """
+    if number_of_items < 24:
+        return struct.pack(">B", 0xA0 | number_of_items)
+    return struct.pack(">BB", 0xB8, number_of_items)
+
+
+def _encode_cbor_map_items(items: dict) -> bytes:
+    """
+    Encodes the key-value pairs of a dictionary without the CBOR map header, so
+    that the result can be concatenated with other encoded key-value pairs
+
+    Parameters
+    ----------
+    items : dict
+        The dictionary to encode
+
+    Returns
+    -------
+    bytes
+        The CBOR-encoded key-value pairs
+    """
+    return b"".join(cbor2.dumps(key) + cbor2.dumps(val) for key, val in items.items())
+
 
 class ZmqStream:
     """
@@ -39,36 +132,167 @@ class ZmqStream:
 
     def __init__(
         self,
-        address: str,
-        hdf5_file_path: str,
+        address: str | list[str],
+        hdf5_file_path: str | None,
         delay_between_frames: float = 0.1,
         number_of_data_files: int = 1,
+        compression_workers: int = 1,
+        bslz4_block_size: int = 0,
+        direct_chunk_read: bool = True,
+        frame_source: Literal["memory", "streaming"] = "memory",
+        prefetch_size: int = 64,
+        frame_cache: FrameCache | None = None,
+        frame_library: FrameLibrary | None = None,
+        pace_with_frame_time: bool = False,
+        pacing_policy: Literal["catch_up", "skip"] = "catch_up",
+        spin_threshold: float = 0.002,
+        io_threads: int = 1,
+        distribution: Literal["round_robin", "image_id"] = "round_robin",
+        sndhwm: int = 1000,
+        sndbuf: int = -1,
+        linger: int = -1,
+        overflow_policy: Literal["block", "drop_newest", "drop_oldest"] = "block",
+        filewriter_dir: Path | None = None,
+        filewriter_queue_size: int = 64,
+        synthetic_detector: DetectorSize | None = None,
+        synthetic_dtype: Literal["uint16", "uint32"] = "uint32",
+        synthetic_number_of_frames: int = 10,
     ) -> None:
         """
         Parameters
         ----------
-        address : str
-            ZMQ stream address, e.g. tcp://*:5555
-        hdf5_file_path : str
-            Path of the hdf5 file
+        address : str | list[str]
+            ZMQ stream address, e.g. tcp://*:5555. If a list of addresses is
+            given, one PUSH socket is bound to each address and images are
+            distributed across the sockets
+        hdf5_file_path : str | None
+            Path of the hdf5 file. Not used if synthetic_detector is set
         delay_between_frames : float, optional
             Time delay between images sent via the ZeroMQ stream [seconds]
         number_of_data_files : int, optional
             Number of data files loaded in memory
+        compression_workers : int, optional
+            Number of worker processes used to compress frames, and number of
+            compressor threads of the streaming frame source. If
+            compression_workers <= 1, frames are compressed sequentially
+        bslz4_block_size : int, optional
+            Bitshuffle block size [number of elements] of bslz4 compressed
+            frames. Must be a multiple of 8. 0 uses the default block size of
+            bitshuffle (8192 bytes)
+        direct_chunk_read : bool, optional
+            If True, datafiles stored as bslz4 chunks are read with
+            read_direct_chunk and sent without recompressing them
+        frame_source : Literal["memory", "streaming"], optional
+            If "memory", frames are compressed and cached in memory when the
+            master file is loaded. If "streaming", frames are read from all
+            datafiles and compressed while they are being sent
+        prefetch_size : int, optional
+            Number of frames prefetched by the streaming frame source
+        frame_cache : FrameCache | None, optional
+            Persistent on-disk cache of encoded frames. If None, frames are
+            always loaded from the hdf5 file
+        frame_library : FrameLibrary | None, optional
+            In-memory library of prepared datasets. If None, only the active
+            dataset is kept in memory
+        pace_with_frame_time : bool, optional
+            If True, frames are sent every frame_time seconds (see the
+            frame_time detector config). Otherwise, frames are sent every
+            delay_between_frames seconds
+        pacing_policy : Literal["catch_up", "skip"], optional
+            Policy applied when frames are sent after their deadline, see
+            `FramePacer`
+        spin_threshold : float, optional
+            Time before the deadline of a frame from which we busy-wait instead
+            of sleeping [seconds]
+        io_threads : int, optional
+            Number of I/O threads of the zmq context
+        distribution : Literal["round_robin", "image_id"], optional
+            How images are distributed across sockets when several addresses
+            are given: in turn ("round_robin"), or by image_id modulo the
+            number of sockets ("image_id"). Start and end messages are always
+            sent to every socket
+        sndhwm : int, optional
+            High-water mark of each socket, i.e. maximum number of messages
+            queued by ZMQ for a receiver
+        sndbuf : int, optional
+            Kernel send buffer size of each socket [bytes]. -1 uses the OS
+            default
+        linger : int, optional
+            Time pending messages are kept once a socket is closed
+            [milliseconds]. -1 keeps them until they are sent
+        overflow_policy : Literal["block", "drop_newest", "drop_oldest"], optional
+            What happens to an image when the high-water mark is reached (see
+            `_send_image`): wait for the receiver ("block"), drop the image
+            ("drop_newest"), or queue the image and drop the oldest queued
+            image ("drop_oldest")
+        filewriter_dir : Path | None, optional
+            Directory the filewriter writes HDF5 files to (see `FileWriter`).
+            If None, the filewriter cannot be enabled
+        filewriter_queue_size : int, optional
+            Maximum number of images waiting to be written by the filewriter.
+            Images are dropped from the files when the queue is full
+        synthetic_detector : DetectorSize | None, optional
+            If set, frames of the given detector size are generated (see
+            `create_synthetic_frames`) instead of being loaded from the hdf5
+            file
+        synthetic_dtype : Literal["uint16", "uint32"], optional
+            Data type of the synthetic frames
+        synthetic_number_of_frames : int, optional
+            Number of unique synthetic frames
 
         Returns
         -------
         None
         """
 
-        self.address = address
-        self.compression: Literal["bslz4", "none"] = "bslz4"
+        self.addresses = [address] if isinstance(address, str) else list(address)
+        self.address = ", ".join(self.addresses)
+        self.distribution = distribution
+        self.compression: Literal["bslz4", "lz4", "none"] = "bslz4"
         self.delay_between_frames = delay_between_frames
         self.number_of_data_files = number_of_data_files
-
-        self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.PUSH)
-        self.socket.bind(self.address)
+        self.compression_workers = compression_workers
+        self.bslz4_block_size = bslz4_block_size
+        self.direct_chunk_read = direct_chunk_read
+        self.frame_source = frame_source
+        self.prefetch_size = prefetch_size
+        self.frame_cache = frame_cache
+        if self.frame_cache is not None:
+            metrics.DISK_FRAME_CACHE_BYTES.set_function(lambda: frame_cache.size)
+        self.frame_library = (
+            frame_library if frame_library is not None else FrameLibrary(max_bytes=0)
+        )
+        self.pace_with_frame_time = pace_with_frame_time
+        self.pacing_policy = pacing_policy
+        self.spin_threshold = spin_threshold
+        self.pacing_statistics = PacingStatistics()
+        self.frames: FrameArena | StreamingFrameSource | None = None
+
+        self.context = zmq.Context(io_threads=io_threads)
+        self.sockets: list[zmq.Socket] = []
+        for socket_address in self.addresses:
+            socket = self.context.socket(zmq.PUSH)
+            socket.setsockopt(zmq.SNDHWM, sndhwm)
+            socket.setsockopt(zmq.SNDBUF, sndbuf)
+            socket.setsockopt(zmq.LINGER, linger)
+            socket.bind(socket_address)
+            self.sockets.append(socket)
+        self._next_socket = 0
+        self.sndhwm = sndhwm
+        self.linger = linger
+        self.overflow_policy = overflow_policy
+        # Images waiting for the high-water mark of each socket with the
+        # drop_oldest policy. The oldest image is dropped when the queue is full
+        self._pending_images = [deque(maxlen=max(1, sndhwm)) for _ in self.sockets]
+        self.frames_dropped = 0
+        # Start and end messages not sent because a receiver was not reading
+        # (see `_send_to_all_sockets`), since the detector was last armed
+        self.control_messages_dropped = 0
+        # Most recent image for the monitor API
+        self.monitor = FrameMonitor(self._decode_frame)
+        self.filewriter = FileWriter(
+            self._read_channel_data, filewriter_dir, filewriter_queue_size
+        )
 
         self.sequence_id = 0
 
@@ -78,18 +302,141 @@ class ZmqStream:
 
         self.user_data = ""  # an empty string is the real default value
         self.series_unique_id = None
+
+        # Configuration of the series, captured when the detector is armed
+        # (see `arm`). None if the detector is not armed
+        self.series: SeriesSnapshot | None = None
+        # Serialises arming and triggering, so that concurrent requests cannot
+        # start overlapping series
+        self._series_lock = threading.Lock()
+        # Series are streamed on a dedicated thread (see `trigger`)
+        self._streaming_thread: threading.Thread | None = None
+        self._cancel_event = threading.Event()
+        self.frames_sent = 0
+        self.number_of_frames_in_series = 0
+        self._series_start_time: float | None = None
+        self._series_end_time: float | None = None
+        # Time the last start message was sent, used to measure the time
+        # between arm and the first frame of a series
+        self._arm_time: float | None = None
+
         self.hdf5_file_path = hdf5_file_path
+        self.synthetic_detector = synthetic_detector
+        self.synthetic_dtype = synthetic_dtype if synthetic_detector else None
+        self.synthetic_number_of_frames = synthetic_number_of_frames
         self.detector_config = DetectorConfiguration()
 
-        self.create_list_of_compressed_frames(
-            self.hdf5_file_path, self.compression, self.number_of_data_files
-        )
+        # Frames are loaded by `warm_up`, in the background when the app starts
+        # (see `start_warm_up`). The event is set once the start message and
+        # detector configuration have been read, i.e. before the frames are
+        # compressed
+        self._warm_up_thread: threading.Thread | None = None
+        self.metadata_loaded = threading.Event()
+
+        # The frames are swapped (e.g. for the frames cropped to the ROI) only
+        # when the detector is not armed, so that the frames always match the
+        # start message of the series
+        self.is_armed = False
+        # Set while a series is streamed, including series triggered without
+        # arming the detector
+        self._is_streaming_series = False
+        # Set by `abort` if the streaming thread did not stop in time, so that
+        # the streaming thread sends the end message once it has stopped
+        self._end_series_when_stopped = False
+        self._frames_lock = threading.Lock()
+        # Offset (y, x) of the ROI applied to the start message
+        self._roi_offset = (0, 0)
+        # Incremented to cancel re-encodes of frames which are no longer needed
+        self._reencode_generation = 0
+        self.reencode_progress = {
+            "dataset": None,
+            "roi_mode": None,
+            "compression": None,
+            "image_dtype": None,
+            "channels": None,
+            "frames_encoded": 0,
+            "number_of_frames": 0,
+            "in_progress": False,
+        }
 
         logging.info(f"ZMQ Address: {self.address}")
         logging.info(f"Hdf5 file path: {self.hdf5_file_path}")
+        if self.synthetic_detector is not None:
+            logging.info(f"Synthetic detector: {self.synthetic_detector}")
         logging.info(f"Compression type: {self.compression}")
         logging.info(f"Delay between frames (s): {self.delay_between_frames}")
+        logging.info(f"Pace with frame time: {self.pace_with_frame_time}")
+        logging.info(f"Pacing policy: {self.pacing_policy}")
+        logging.info(f"ZMQ high-water mark: {self.sndhwm}")
+        logging.info(f"ZMQ overflow policy: {self.overflow_policy}")
         logging.info(f"Number of data files: {self.number_of_data_files}")
+        logging.info(f"Compression workers: {self.compression_workers}")
+        logging.info(f"Bslz4 block size: {self.bslz4_block_size}")
+        logging.info(f"Direct chunk read: {self.direct_chunk_read}")
+        logging.info(f"Frame source: {self.frame_source}")
+        if self.frame_cache is not None:
+            logging.info(f"Frame cache directory: {self.frame_cache.cache_dir}")
+
+    @property
+    def is_warming_up(self) -> bool:
+        """Whether the frames are being loaded by the warm-up thread"""
+        return self._warm_up_thread is not None and self._warm_up_thread.is_alive()
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether frames are loaded and a series can be streamed"""
+        return self.frames is not None and not self.is_warming_up
+
+    def start_warm_up(self) -> None:
+        """
+        Starts loading the frames on a background thread (see `warm_up`) and
+        returns immediately, so that the API can be served while the frames
+        are loaded
+
+        Returns
+        -------
+        None
+        """
+        detector_state.state = "initialize"
+        self._warm_up_thread = threading.Thread(
+            target=self.warm_up, name="warm-up", daemon=True
+        )
+        self._warm_up_thread.start()
+
+    def warm_up(self) -> None:
+        """
+        Loads the frames of the hdf5 file, or generates the synthetic frames,
+        given at construction. The detector state is "initialize" until the
+        frames are ready, and "error" if they could not be loaded
+
+        Returns
+        -------
+        None
+        """
+        detector_state.state = "initialize"
+        t = time.perf_counter()
+        try:
+            if self.synthetic_detector is not None:
+                self.create_synthetic_frames(
+                    self.synthetic_detector,
+                    self.synthetic_dtype,
+                    self.synthetic_number_of_frames,
+                    self.compression,
+                )
+            else:
+                self.create_list_of_compressed_frames(
+                    self.hdf5_file_path, self.compression, self.number_of_data_files
+                )
+        except Exception:
+            logging.exception("Failed to load the frames")
+            detector_state.state = "error"
+            return
+        finally:
+            # Release the requests waiting for the detector configuration,
+            # even if it could not be loaded
+            self.metadata_loaded.set()
+        logging.info(f"Frames loaded in {time.perf_counter() - t:.2f} s")
+        detector_state.state = "idle"
 
     def _update_zmq_start_message(self) -> None:
         """
@@ -103,7 +450,736 @@ class ZmqStream:
         for key, val in self.start_message.items():
             setattr(zmq_start_message, key, val)
 
-    def _get_hdf5_value(self, hf: h5py.File, path: str) -> npt.NDArray | bytes:
+    def _apply_dataset_header(
+        self,
+        start_message: dict,
+        image_message: dict,
+        end_message: dict,
+        detector_configuration: dict,
+        number_of_frames_per_trigger: int,
+    ) -> None:
+        """
+        Updates the start message, detector configuration and image message
+        template with the values of a dataset. Detector configuration requests
+        waiting for the metadata at startup are released
+
+        Parameters
+        ----------
+        start_message : dict
+            Start message fields of the dataset
+        image_message : dict
+            Image message structure
+        end_message : dict
+            End message structure
+        detector_configuration : dict
+            Detector configuration fields read from the master file
+        number_of_frames_per_trigger : int
+            Number of frames sent per trigger
+
+        Returns
+        -------
+        None
+        """
+        self.start_message = start_message
+        self.image_message = image_message
+        self.end_message = end_message
+        self._update_zmq_start_message()
+        for key, val in detector_configuration.items():
+            setattr(self.detector_config, key, val)
+        self.number_of_frames_per_trigger = number_of_frames_per_trigger
+        self._roi_offset = (0, 0)
+        self._create_image_header_template()
+        self.metadata_loaded.set()
+
+    def activate_dataset(self, name: str) -> None:
+        """
+        Makes a dataset of the frame library the dataset streamed on trigger.
+        The start message and detector configuration are updated with the
+        values of the dataset, as if its master file had been loaded again
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        KeyError
+            If the dataset is not in the frame library
+        RuntimeError
+            If a series is being streamed
+        """
+        if self.is_streaming:
+            raise RuntimeError("Cannot switch datasets while a series is streamed")
+        dataset = self.frame_library.activate(name)
+        self._apply_dataset_header(
+            dataset.start_message,
+            dataset.image_message,
+            dataset.end_message,
+            dataset.detector_configuration,
+            dataset.number_of_frames_per_trigger,
+        )
+        self.frames = dataset.frames
+        self.frame_id = 0
+        self.hdf5_file_path = dataset.hdf5_file_path
+        if dataset.number_of_data_files is not None:
+            self.number_of_data_files = dataset.number_of_data_files
+        self.synthetic_detector = dataset.synthetic_detector
+        self.synthetic_dtype = dataset.synthetic_dtype
+        self.compression = dataset.compression
+        self._update_frame_cache_metrics()
+        logging.info(f"Active dataset: {name}")
+        self._prepare_frames()
+
+    def set_roi_mode(self, roi_mode: Literal["disabled", "4M"]) -> None:
+        """
+        Sets the ROI mode. Frames are centre-cropped to the ROI (see
+        ROI_SHAPES), and the image size and beam center of the start message
+        are updated to match. The cropped frames are created in the background
+        (see `_prepare_frames`)
+
+        Parameters
+        ----------
+        roi_mode : Literal["disabled", "4M"]
+            The ROI mode
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the ROI is enabled while frames are streamed from the datafiles
+        """
+        if roi_mode != "disabled":
+            self._check_frames_can_be_reencoded()
+        self.detector_config.roi_mode = roi_mode
+        self._prepare_frames()
+
+    def set_compression(self, compression: Literal["bslz4", "lz4", "none"]) -> None:
+        """
+        Sets the compression of the streamed frames. The frames of the active
+        dataset are re-encoded in the background (see `_prepare_frames`)
+
+        Parameters
+        ----------
+        compression : Literal["bslz4", "lz4", "none"]
+            Compression type
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the compression is changed while frames are streamed from the
+            datafiles
+        """
+        if compression != self.compression:
+            self._check_frames_can_be_reencoded()
+        self.compression = compression
+        self._prepare_frames()
+
+    def set_bit_depth_image(self, bit_depth_image: int) -> None:
+        """
+        Sets the bit depth of the streamed frames. With a bit depth of 16,
+        frames are converted to uint16, and pixel values which do not fit in
+        16 bits are saturated at 65535, as done by the detector. The converted
+        frames are created in the background (see `_prepare_frames`). Frames
+        are never converted to a larger data type than the data type of the
+        dataset
+
+        Parameters
+        ----------
+        bit_depth_image : int
+            The bit depth, either 16 or 32
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the bit depth is not 16 or 32, or if frames streamed from the
+            datafiles would need to be converted
+        """
+        if bit_depth_image not in (16, 32):
+            raise ValueError(f"The bit depth must be 16 or 32, not {bit_depth_image}")
+        if bit_depth_image == 16:
+            self._check_frames_can_be_reencoded()
+        self.detector_config.detector_bit_depth_image = bit_depth_image
+        self._prepare_frames()
+
+    def set_threshold_mode(
+        self,
+        threshold: Literal["2", "difference"],
+        mode: Literal["enabled", "disabled"],
+    ) -> None:
+        """
+        Enables or disables the second threshold or the difference mode. With
+        the second threshold enabled, image messages carry threshold_1 and
+        threshold_2 data, and the difference mode adds the difference between
+        both thresholds. The frames of the other channels are derived from the
+        threshold_1 frames in the background (see `_create_frame_variant`)
+
+        Parameters
+        ----------
+        threshold : Literal["2", "difference"]
+            The threshold
+        mode : Literal["enabled", "disabled"]
+            The mode
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If the difference mode is enabled without the second threshold, if
+            the second threshold is disabled while the difference mode is
+            enabled, or if frames are streamed from the datafiles
+        """
+        if threshold == "2":
+            if (
+                mode == "disabled"
+                and self.detector_config.threshold_difference_mode == "enabled"
+            ):
+                raise ValueError(
+                    "The difference mode must be disabled before the second "
+                    "threshold"
+                )
+        elif mode == "enabled" and self.detector_config.threshold_2_mode != "enabled":
+            raise ValueError(
+                "The second threshold must be enabled to enable the difference mode"
+            )
+        if mode == "enabled":
+            self._check_frames_can_be_reencoded()
+        if threshold == "2":
+            self.detector_config.threshold_2_mode = mode
+        else:
+            self.detector_config.threshold_difference_mode = mode
+        self._prepare_frames()
+
+    def _check_frames_can_be_reencoded(self) -> None:
+        """
+        Raises
+        ------
+        ValueError
+            If frames are streamed from the datafiles, i.e. not cached in memory
+        """
+        dataset = self.frame_library.active_dataset
+        if dataset is not None and not isinstance(dataset.frames, FrameArena):
+            raise ValueError(
+                "Frames streamed from the datafiles cannot be re-encoded. Set "
+                "AS_FRAME_SOURCE=memory, or load the master file again"
+            )
+
+    def _roi_window(
+        self, roi_mode: Literal["disabled", "4M"], height: int, width: int
+    ) -> tuple[int, int, int, int]:
+        """
+        Gets the window of the ROI, centred on frames of the given size
+
+        Parameters
+        ----------
+        roi_mode : Literal["disabled", "4M"]
+            The ROI mode
+        height : int
+            Height of the full frames
+        width : int
+            Width of the full frames
+
+        Returns
+        -------
+        tuple[int, int, int, int]
+            The offset (y, x) and the size (height, width) of the ROI
+        """
+        if roi_mode == "disabled":
+            return 0, 0, height, width
+        roi_height, roi_width = ROI_SHAPES[roi_mode]
+        roi_height, roi_width = min(roi_height, height), min(roi_width, width)
+        return (
+            (height - roi_height) // 2,
+            (width - roi_width) // 2,
+            roi_height,
+            roi_width,
+        )
+
+    @staticmethod
+    def _base_variant(dataset: PreparedDataset) -> FrameVariant:
+        """ROI mode, compression, data type and channels of the frames of a
+        dataset as they were loaded"""
+        return (
+            "disabled",
+            dataset.compression,
+            dataset.start_message["image_dtype"],
+            ("threshold_1",),
+        )
+
+    def _frame_variant(self, dataset: PreparedDataset) -> FrameVariant:
+        """ROI mode, compression, data type and channels the streamed frames of
+        a dataset should have"""
+        dtype = dataset.start_message["image_dtype"]
+        if self.detector_config.detector_bit_depth_image == 16:
+            dtype = "uint16"
+        channels = ("threshold_1",)
+        if self.detector_config.threshold_2_mode == "enabled":
+            channels += ("threshold_2",)
+        if self.detector_config.threshold_difference_mode == "enabled":
+            channels += ("difference",)
+        return self.detector_config.roi_mode, self.compression, dtype, channels
+
+    @staticmethod
+    def _derive_channel(frames: npt.NDArray, channel: str) -> npt.NDArray:
+        """
+        Simulates a channel from the threshold_1 frames. The second threshold
+        is set at a higher energy, so it counts about half of the photons, and
+        the difference channel counts the photons between both thresholds.
+        Masked pixels (the largest value of the data type) stay masked
+
+        Parameters
+        ----------
+        frames : npt.NDArray
+            The threshold_1 frames
+        channel : str
+            The channel, either "threshold_2" or "difference"
+
+        Returns
+        -------
+        npt.NDArray
+            The frames of the channel
+        """
+        masked = frames == np.iinfo(frames.dtype).max
+        threshold_2 = frames >> 1
+        derived = threshold_2 if channel == "threshold_2" else frames - threshold_2
+        derived[masked] = np.iinfo(frames.dtype).max
+        return derived
+
+    def _prepare_frames(self) -> None:
+        """
+        Makes the frames of the active dataset match the ROI mode, the
+        compression, the bit depth and the threshold modes. Frames which have
+        not been cropped or re-encoded yet are created in the background (see
+        `_create_frame_variant`), and the current frames are streamed until
+        they are ready
+
+        Returns
+        -------
+        None
+        """
+        self._reencode_generation += 1
+        dataset = self.frame_library.active_dataset
+        if dataset is not None and isinstance(dataset.frames, FrameArena):
+            dataset.requested_variant = self._frame_variant(dataset)
+        if (
+            dataset is None
+            or not isinstance(dataset.frames, FrameArena)
+            or self._frame_variant(dataset) == self._base_variant(dataset)
+            or self._frame_variant(dataset) in dataset.variants
+        ):
+            self._select_frames_if_not_armed()
+            return
+        threading.Thread(
+            target=self._create_frame_variant,
+            args=(dataset, self._frame_variant(dataset), self._reencode_generation),
+            name="reencode-frames",
+            daemon=True,
+        ).start()
+
+    def _create_frame_variant(
+        self,
+        dataset: PreparedDataset,
+        variant: FrameVariant,
+        generation: int,
+    ) -> None:
+        """
+        Crops the frames of a dataset to the ROI, converts them to a smaller
+        data type, re-encodes them with another compression and/or adds
+        threshold channels (see `_derive_channel`), in a new frame arena.
+        Frames are decoded from the frame arena of the dataset, so that the
+        master file is not read again, and processed in batches.
+
+        Channels are derived once, when the frames are created. If frames with
+        the same ROI, compression and data type but fewer channels exist, their
+        encoded channels are copied as they are instead of being compressed
+        again, so only the new channels are compressed
+
+        Parameters
+        ----------
+        dataset : PreparedDataset
+            The dataset
+        variant : FrameVariant
+            ROI mode, compression, data type and channels of the new frames
+        generation : int
+            The re-encode is cancelled if `_prepare_frames` is called again in
+            the meantime
+
+        Returns
+        -------
+        None
+        """
+        roi_mode, compression, dtype, channels = variant
+        t = time.perf_counter()
+        height = dataset.start_message["image_size_y"]
+        width = dataset.start_message["image_size_x"]
+        y0, x0, roi_height, roi_width = self._roi_window(roi_mode, height, width)
+        if (roi_height, roi_width, compression, dtype, channels) == (
+            height,
+            width,
+            *self._base_variant(dataset)[1:],
+        ):
+            self.frame_library.add_variant(dataset, variant, dataset.frames)
+            self._select_frames_if_not_armed()
+            return
+        # The frames with the most channels in common, if any
+        variants = {self._base_variant(dataset): dataset.frames, **dataset.variants}
+        shared_channels, shared_frames = max(
+            (
+                (key[3], frames)
+                for key, frames in variants.items()
+                if key[:3] == variant[:3] and key[3] == channels[: len(key[3])]
+            ),
+            key=lambda item: len(item[0]),
+            default=((), None),
+        )
+
+        number_of_frames = len(dataset.frames)
+        # Only the progress of this re-encode is updated, a newer re-encode
+        # replaces self.reencode_progress
+        progress = {
+            "dataset": dataset.name,
+            "roi_mode": roi_mode,
+            "compression": compression,
+            "image_dtype": dtype,
+            "channels": list(channels),
+            "frames_encoded": 0,
+            "number_of_frames": number_of_frames,
+            "in_progress": True,
+        }
+        self.reencode_progress = progress
+        logging.info(
+            f"Re-encoding {number_of_frames} frames of dataset {dataset.name} "
+            f"({roi_width} x {roi_height} {dtype}, compression: {compression}, "
+            f"channels: {', '.join(channels)})..."
+        )
+        header = (
+            compression_header(
+                compression,
+                roi_height * roi_width * np.dtype(dtype).itemsize,
+                np.dtype(dtype).itemsize,
+                self.bslz4_block_size,
+            )
+            if compression.lower() != "none"
+            else b""
+        )
+        encode_payload = partial(
+            self._encode_frame,
+            includes_header=True,
+            dtype=dtype,
+            shape=(roi_height, roi_width),
+            compressed_image=compression.lower() != "none",
+            image_message=dataset.image_message,
+            compression=compression,
+        )
+        batch_size = max(1, _MAX_REENCODE_BATCH_PIXELS // (height * width))
+        frame_arena = FrameArenaBuilder()
+        try:
+            with self._compression_executor() as executor:
+                for first in trange(0, number_of_frames, batch_size):
+                    if generation != self._reencode_generation:
+                        logging.info("Re-encoding frames cancelled")
+                        return
+                    indices = range(first, min(first + batch_size, number_of_frames))
+                    images: dict[str, list[bytes]] = {}
+                    if shared_frames is not None:
+                        shared_data = [
+                            self._read_channel_data(shared_frames.payload(index))
+                            for index in indices
+                        ]
+                        for channel in shared_channels:
+                            images[channel] = [data[channel][3] for data in shared_data]
+                        # The shared frames are already cropped and converted
+                        converted = np.stack(
+                            [
+                                decompress_frame(
+                                    images["threshold_1"][ii],
+                                    compression,
+                                    dtype,
+                                    (roi_height, roi_width),
+                                )
+                                for ii in range(len(indices))
+                            ]
+                        )
+                    else:
+                        batch = np.stack(
+                            [
+                                self._decode_frame(dataset.frames.payload(index))
+                                for index in indices
+                            ]
+                        )
+                        cropped = batch[:, y0 : y0 + roi_height, x0 : x0 + roi_width]
+                        # Saturating conversion, e.g. of uint32 frames to uint16
+                        converted = np.empty(cropped.shape, dtype=dtype)
+                        np.minimum(
+                            cropped,
+                            np.iinfo(dtype).max,
+                            out=converted,
+                            casting="unsafe",
+                        )
+                    for channel in channels:
+                        if channel in images:
+                            continue
+                        channel_frames = (
+                            converted
+                            if channel == "threshold_1"
+                            else self._derive_channel(converted, channel)
+                        )
+                        images[channel] = [
+                            header + image
+                            for image in self._compress_frames(
+                                channel_frames, compression, executor
+                            )
+                        ]
+                    for ii in range(len(indices)):
+                        frame_arena.append(
+                            encode_payload(
+                                {channel: images[channel][ii] for channel in channels}
+                            )
+                        )
+                    progress["frames_encoded"] = len(frame_arena)
+        except Exception:
+            logging.exception("Failed to re-encode the frames")
+            return
+        finally:
+            progress["in_progress"] = False
+
+        frames = frame_arena.build()
+        logging.info(
+            f"Frames re-encoded in {time.perf_counter() - t:.2f} s "
+            f"({frames.footprint / 1e6:.1f} MB)"
+        )
+        self.frame_library.add_variant(dataset, variant, frames)
+        if generation == self._reencode_generation:
+            self._select_frames_if_not_armed()
+        self._update_frame_cache_metrics()
+
+    def get_reencode_progress(self) -> dict:
+        """
+        Gets the progress of the last re-encode of the frames (see
+        `_create_frame_variant`)
+
+        Returns
+        -------
+        dict
+            The dataset, target ROI mode, compression and data type, number of
+            frames encoded and whether the re-encode is in progress
+        """
+        return dict(self.reencode_progress)
+
+    def benchmark_codecs(
+        self, number_of_frames: int, bslz4_block_sizes: list[int]
+    ) -> list[dict]:
+        """
+        Measures the compression ratio and the compression and decompression
+        throughput of each codec on the frames which are currently streamed
+        (see `benchmark_codec`)
+
+        Parameters
+        ----------
+        number_of_frames : int
+            Number of frames of the dataset the codecs are benchmarked on
+        bslz4_block_sizes : list[int]
+            Bitshuffle block sizes [number of elements] benchmarked for bslz4
+
+        Returns
+        -------
+        list[dict]
+            The results of each codec
+
+        Raises
+        ------
+        ValueError
+            If frames are streamed from the datafiles, or if a block size is
+            not a multiple of 8
+        """
+        frame_arena = self.frames
+        if not isinstance(frame_arena, FrameArena):
+            raise ValueError(
+                "Codecs can only be benchmarked on frames cached in memory. Set "
+                "AS_FRAME_SOURCE=memory"
+            )
+        frames = [
+            self._decode_frame(frame_arena.payload(index))
+            for index in range(min(number_of_frames, len(frame_arena)))
+        ]
+        results = [
+            benchmark_codec(frames, "none"),
+            benchmark_codec(frames, "lz4"),
+        ]
+        for block_size in bslz4_block_sizes:
+            results.append(benchmark_codec(frames, "bslz4", block_size))
+        return results
+
+    @staticmethod
+    def _read_channel_data(payload: memoryview) -> dict[str, FrameData]:
+        """
+        Reads the frame of each channel of a pre-encoded image message payload
+        (see `_encode_image_payload`) without decompressing them
+
+        Parameters
+        ----------
+        payload : memoryview
+            The CBOR-encoded payload of an image message
+
+        Returns
+        -------
+        dict[str, FrameData]
+            The compression, data type and shape of the frame of each channel,
+            and the compressed frame including its bytes-header (or the raw
+            bytes of the frame if compression="none")
+        """
+        payload_items = cbor2.loads(
+            _encode_cbor_map_header(len(IMAGE_PAYLOAD_KEYS)) + bytes(payload)
+        )
+        channel_data = {}
+        for channel, data in payload_items["data"].items():
+            shape, image_contents = data.value
+            dtype = np.dtype({69: np.uint16, 70: np.uint32}[image_contents.tag])
+            if isinstance(image_contents.value, bytes):
+                channel_data[channel] = (
+                    "none",
+                    dtype,
+                    tuple(shape),
+                    image_contents.value,
+                )
+            else:
+                compression, _, image = image_contents.value.value
+                channel_data[channel] = compression, dtype, tuple(shape), image
+        return channel_data
+
+    @staticmethod
+    def _read_frame_data(payload: memoryview) -> FrameData:
+        """
+        Reads the threshold_1 frame of a pre-encoded image message payload
+        without decompressing it (see `_read_channel_data`)
+
+        Parameters
+        ----------
+        payload : memoryview
+            The CBOR-encoded payload of an image message
+
+        Returns
+        -------
+        FrameData
+            The compression, data type and shape of the frame, and the
+            compressed frame including its bytes-header (or the raw bytes of
+            the frame if compression="none")
+        """
+        return ZmqStream._read_channel_data(payload)["threshold_1"]
+
+    @staticmethod
+    def _decode_frame(payload: memoryview) -> npt.NDArray:
+        """
+        Decodes the frame of a pre-encoded image message payload (see
+        `_encode_image_payload`)
+
+        Parameters
+        ----------
+        payload : memoryview
+            The CBOR-encoded payload of an image message
+
+        Returns
+        -------
+        npt.NDArray
+            The uncompressed frame
+        """
+        compression, dtype, shape, data = ZmqStream._read_frame_data(payload)
+        return decompress_frame(data, compression, dtype, shape)
+
+    def _select_frames_if_not_armed(self) -> None:
+        """
+        Selects the frames matching the ROI mode, compression, bit depth and
+        threshold modes (see `_select_frames`), unless the detector is armed or
+        a series is streamed. Otherwise the frames are selected when the series
+        ends
+
+        Returns
+        -------
+        None
+        """
+        with self._frames_lock:
+            if not self.is_armed and not self._is_streaming_series:
+                self._select_frames()
+
+    def _select_frames(self) -> None:
+        """
+        Streams the frames of the active dataset matching the ROI mode,
+        compression, bit depth and threshold modes if they are ready. Otherwise
+        the current frames of the dataset keep being streamed. The image size,
+        beam center, data type, saturation value and channels of the start
+        message are updated to match the streamed frames
+
+        Returns
+        -------
+        None
+        """
+        dataset = self.frame_library.active_dataset
+        if dataset is None or not isinstance(dataset.frames, FrameArena):
+            return
+        variants = {self._base_variant(dataset): dataset.frames}
+        variants.update(dataset.variants)
+        variant = self._frame_variant(dataset)
+        if variant not in variants:
+            # Keep the frames of the dataset which are currently streamed
+            variant = next(
+                (key for key, frames in variants.items() if frames is self.frames),
+                self._base_variant(dataset),
+            )
+        frames = variants[variant]
+        self.frame_library.select_variant(dataset, variant)
+        y0, x0, height, width = self._roi_window(
+            variant[0],
+            dataset.start_message["image_size_y"],
+            dataset.start_message["image_size_x"],
+        )
+        if frames is self.frames and (y0, x0) == self._roi_offset:
+            return
+
+        zmq_start_message.image_size_x = width
+        zmq_start_message.image_size_y = height
+        zmq_start_message.image_dtype = variant[2]
+        channels = variant[3]
+        zmq_start_message.channels = (
+            [channel.removeprefix("threshold_") for channel in channels]
+            if len(channels) > 1
+            else dataset.start_message["channels"]
+        )
+        saturation_value = dataset.start_message.get("saturation_value")
+        if saturation_value is not None:
+            # The largest value is reserved for masked pixels
+            saturation_value = min(saturation_value, np.iinfo(variant[2]).max - 1)
+        zmq_start_message.saturation_value = saturation_value
+        # The beam center is kept in the coordinates of the streamed frames
+        zmq_start_message.beam_center_x += self._roi_offset[1] - x0
+        zmq_start_message.beam_center_y += self._roi_offset[0] - y0
+        self._roi_offset = (y0, x0)
+        self.frames = frames
+        self.frame_id = 0
+        logging.info(
+            f"Streaming {width} x {height} {variant[2]} frames (ROI mode: "
+            f"{variant[0]}, compression: {variant[1]}, channels: "
+            f"{', '.join(channels)})"
+        )
+
+    def _get_hdf5_value(self, hf: "h5py.File", path: str) -> npt.NDArray | bytes:
         """
         Gets a value from a hdf5 file
 
@@ -124,6 +1200,8 @@ class ZmqStream:
         KeyError
             If the path does not exist or is not a dataset
         """
+        import h5py
+
         obj = hf.get(path)
         if obj is None:
             raise KeyError(path)
@@ -131,7 +1209,7 @@ class ZmqStream:
             return obj[()]
         raise KeyError(f"Path is not a dataset: {path}")
 
-    def _get_hdf5_group(self, hf: h5py.File, path: str) -> h5py.Group:
+    def _get_hdf5_group(self, hf: "h5py.File", path: str) -> "h5py.Group":
         """
         Gets a group from a hdf5 file
 
@@ -152,6 +1230,8 @@ class ZmqStream:
         KeyError
             If the path does not exist or is not a group
         """
+        import h5py
+
         obj = hf.get(path)
         if obj is None:
             raise KeyError(path)
@@ -159,10 +1239,9 @@ class ZmqStream:
             return obj
         raise KeyError(f"Path is not a group: {path}")
 
-    def _update_detector_configuration(self, hf: h5py.File) -> None:
+    def _read_detector_configuration(self, hf: "h5py.File") -> dict:
         """
-        Updates the detector configuration by reading the detector
-        config from a hdf5 file
+        Reads the detector config from a hdf5 file
 
         Parameters
         ----------
@@ -171,64 +1250,81 @@ class ZmqStream:
 
         Returns
         -------
-        None
+        dict
+            The detector configuration fields found in the hdf5 file. The
+            other fields keep their current values
         """
+        detector_configuration = {}
         try:
             readout_time = self._get_hdf5_value(
                 hf, "/entry/instrument/detector/detector_readout_time"
             )
-            self.detector_config.detector_readout_time = float(readout_time)
+            detector_configuration["detector_readout_time"] = float(readout_time)
 
             bit_depth_image = self._get_hdf5_value(
                 hf, "/entry/instrument/detector/bit_depth_image"
             )
-            self.detector_config.detector_bit_depth_image = int(bit_depth_image)
+            detector_configuration["detector_bit_depth_image"] = int(bit_depth_image)
 
             bit_depth_readout = self._get_hdf5_value(
                 hf, "/entry/instrument/detector/bit_depth_readout"
             )
-            self.detector_config.detector_bit_depth_readout = int(bit_depth_readout)
+            detector_configuration["detector_bit_depth_readout"] = int(
+                bit_depth_readout
+            )
 
             compression = self._get_hdf5_value(
                 hf, "/entry/instrument/detector/detectorSpecific/compression"
             )
             if isinstance(compression, bytes):
                 compression_str = compression.decode()
-                if compression_str in ("bslz4", "none"):
-                    self.detector_config.detector_compression = compression_str
+                if compression_str in ("bslz4", "lz4", "none"):
+                    detector_configuration["detector_compression"] = compression_str
 
             cutoff = self._get_hdf5_value(
                 hf,
                 "/entry/instrument/detector/detectorSpecific/countrate_correction_count_cutoff",
             )
-            self.detector_config.detector_countrate_correction_cutoff = int(cutoff)
+            detector_configuration["detector_countrate_correction_cutoff"] = int(cutoff)
 
             software_version = self._get_hdf5_value(
                 hf, "/entry/instrument/detector/detectorSpecific/software_version"
             )
             if isinstance(software_version, bytes):
-                self.detector_config.software_version = str(software_version.decode())
+                detector_configuration["software_version"] = str(
+                    software_version.decode()
+                )
 
             eiger_fw_version = self._get_hdf5_value(
                 hf, "/entry/instrument/detector/detectorSpecific/eiger_fw_version"
             )
             if isinstance(eiger_fw_version, bytes):
-                self.detector_config.eiger_fw_version = str(eiger_fw_version.decode())
+                detector_configuration["eiger_fw_version"] = str(
+                    eiger_fw_version.decode()
+                )
 
         except KeyError:
             logging.warning(
                 "Detector configuration could not be loaded. Using detector "
                 "configuration defaults"
             )
+        return detector_configuration
 
     def create_list_of_compressed_frames(
         self,
         hdf5_file_path: str | Path,
-        compression: Literal["bslz4", "none"],
+        compression: Literal["bslz4", "lz4", "none"],
         number_of_datafiles: int,
+        name: str | None = None,
+        activate: bool = True,
+        reuse: bool = False,
     ) -> None:
         """
-        Creates a list of compressed frames from a hdf5 file
+        Creates a list of compressed frames from a hdf5 file. Each frame is stored
+        as the CBOR-encoded payload of an image message (see
+        `_encode_image_payload`) in a contiguous frame arena, so that the
+        compressed data is serialised only once and sent without copying it.
+        The dataset is added to the frame library (see `FrameLibrary`)
 
         Parameters
         ----------
@@ -240,87 +1336,683 @@ class ZmqStream:
         number_of_datafiles: int | None = None
             The number of datafiles loaded in memory. If number_of_datafiles=None,
             we load all datafiles specified in the master file
+        name : str | None, optional
+            Name of the dataset in the frame library. Defaults to the name of
+            the master file
+        activate : bool, optional
+            If True, the dataset becomes the dataset streamed on trigger.
+            Otherwise it is only added to the frame library (preloaded), and
+            the frames are always cached in memory
+        reuse : bool, optional
+            If True and a dataset loaded from the same (unmodified) master file
+            with the same compression and number of datafiles is in the frame
+            library, this dataset is used instead of loading the master file
+            again
 
         Raises
         ------
         NotImplementedError
             If the compression algorithm is not bslz4, lz4, or no_compression
+        ValueError
+            If a preloaded dataset does not fit in the frame library
 
         Returns
         -------
         None
         """
-        self.hdf5_file_path = hdf5_file_path
-        self.compression = compression
-        self.number_of_data_files = number_of_datafiles
+        name = name if name is not None else Path(hdf5_file_path).stem
+        if reuse and self._reuse_dataset(
+            activate,
+            hdf5_file_path=str(hdf5_file_path),
+            master_file_mtime_ns=os.stat(hdf5_file_path).st_mtime_ns,
+            compression=compression,
+            number_of_data_files=number_of_datafiles,
+        ):
+            return
+        load_start_time = time.perf_counter()
+
+        import h5py
+        import hdf5plugin  # noqa
 
         with h5py.File(hdf5_file_path, mode="r") as hdf5_file:
             raw_data_group = self._get_hdf5_group(hdf5_file, "/entry/data")
             keys = list(raw_data_group.keys())
 
-            datafile_list: list[npt.NDArray] = [
-                np.array(raw_data_group[keys[i]])
-                for i in range(self.number_of_data_files)
+            datasets: list[h5py.Dataset] = [
+                raw_data_group[keys[i]] for i in range(number_of_datafiles)
             ]
 
             # Would make more sense in the __init__ section
             # but then we'd need to read the file twice
-            self.start_message, self.image_message, self.end_message = Parse(
-                hdf5_file
-            ).header()
-            self._update_zmq_start_message()
-            self._update_detector_configuration(hdf5_file)
+            start_message, image_message, end_message = Parse(hdf5_file).header()
+            detector_configuration = self._read_detector_configuration(hdf5_file)
 
-        self.number_of_frames_per_trigger = zmq_start_message.number_of_images
+            number_of_frames_per_data_file = [dataset.shape[0] for dataset in datasets]
+            uncompressed_nbytes = sum(
+                dataset.size * dataset.dtype.itemsize for dataset in datasets
+            )
+            array_shape = datasets[0].shape[1:]
+            dtype = datasets[0].dtype
+            start_message["image_size_x"] = array_shape[1]
+            start_message["image_size_y"] = array_shape[0]
+            start_message["image_dtype"] = str(dtype)
+
+            number_of_frames_per_trigger = start_message["number_of_images"]
+            # The dataset is created once the frames are loaded
+            prepared_dataset = partial(
+                PreparedDataset,
+                name=name,
+                start_message=start_message,
+                image_message=image_message,
+                end_message=end_message,
+                detector_configuration=detector_configuration,
+                number_of_frames_per_trigger=number_of_frames_per_trigger,
+                compression=compression,
+                uncompressed_nbytes=uncompressed_nbytes,
+                hdf5_file_path=str(hdf5_file_path),
+                master_file_mtime_ns=os.stat(hdf5_file_path).st_mtime_ns,
+                number_of_data_files=number_of_datafiles,
+            )
+            if activate:
+                # The detector configuration is available before the frames
+                # are compressed
+                self._apply_dataset_header(
+                    start_message,
+                    image_message,
+                    end_message,
+                    detector_configuration,
+                    number_of_frames_per_trigger,
+                )
 
-        number_of_frames_per_data_file = [
-            datafile.shape[0] for datafile in datafile_list
-        ]
-        array_shape = datafile_list[0].shape[1:]
-
-        zmq_start_message.image_size_x = array_shape[1]
-        zmq_start_message.image_size_y = array_shape[0]
-
-        dtype = datafile_list[0].dtype
-        zmq_start_message.image_dtype = str(dtype)
-
-        frame_list = []
-
-        for jj in range(self.number_of_data_files):
-            logging.info(f"Loading data file {jj}:")
-            logging.info(f"Compression type: {self.compression}. Compressing data...")
-            for ii in trange(number_of_frames_per_data_file[jj]):
-                image_message = deepcopy(self.image_message)
-                # if compression == "lz4":
-                #    image = lz4.frame.compress(datafile_list[jj][ii])
-                #    # image_message["data"]["threshold_1"]["compression"] = "lz4"
-                if compression.lower() == "bslz4":
-                    image = bitshuffle.compress_lz4(datafile_list[jj][ii]).tobytes()
-                    image_contents = self.create_image_cbor_object(
-                        image, str(dtype), array_shape
-                    )
+            compressed_image = compression.lower() != "none"
+            encode_payload = partial(
+                self._encode_frame,
+                dtype=str(dtype),
+                shape=array_shape,
+                compressed_image=compressed_image,
+                image_message=image_message,
+                compression=compression,
+            )
 
-                elif compression.lower() == "none":
-                    image = datafile_list[jj][ii].tobytes()
-                    image_contents = self.create_image_cbor_object(
-                        image, str(dtype), array_shape, compressed_image=False
+            if activate and self.frame_source == "streaming":
+                frames = StreamingFrameSource(
+                    hdf5_file_path,
+                    compression,
+                    encode_payload,
+                    prefetch_size=self.prefetch_size,
+                    block_size=self.bslz4_block_size,
+                    direct_chunk_read=self.direct_chunk_read,
+                    is_bslz4_chunked=self._is_bslz4_chunked,
+                    number_of_compressors=self.compression_workers,
+                )
+                logging.info(
+                    "Frames are streamed from "
+                    f"{frames.number_of_data_files} data files "
+                    f"({len(frames)} frames)"
+                )
+                self._add_dataset(prepared_dataset(frames=frames), activate)
+                metrics.DATASET_LOAD_SECONDS.labels(source="streaming").observe(
+                    time.perf_counter() - load_start_time
+                )
+                return
+
+            if self.frame_cache is not None:
+                cache_key = self.frame_cache.key(
+                    hdf5_file_path,
+                    self._get_data_file_paths(
+                        hdf5_file_path,
+                        raw_data_group,
+                        keys[:number_of_datafiles],
+                    ),
+                    compression,
+                    number_of_datafiles,
+                    self.bslz4_block_size,
+                    self.direct_chunk_read,
+                )
+                frames = self.frame_cache.load(cache_key)
+                if frames is not None:
+                    self._add_dataset(prepared_dataset(frames=frames), activate)
+                    metrics.DATASET_LOAD_SECONDS.labels(source="disk_cache").observe(
+                        time.perf_counter() - load_start_time
                     )
-                else:
-                    raise NotImplementedError(
-                        "The allowed compression types are lz4, bslz4 and "
-                        f"no_compression, not {compression}"
+                    return
+
+            # Payloads are appended to the frame arena as they are encoded
+            frame_arena = FrameArenaBuilder()
+
+            with self._compression_executor() as executor:
+                for jj, dataset in enumerate(datasets):
+                    logging.info(f"Loading data file {jj}:")
+                    t = time.perf_counter()
+                    direct_chunk_read = (
+                        self.direct_chunk_read
+                        and compression.lower() == "bslz4"
+                        and self._is_bslz4_chunked(dataset)
                     )
+                    if direct_chunk_read:
+                        logging.info(
+                            "Data file is stored as bslz4 chunks. Reading compressed "
+                            "frames directly..."
+                        )
+                        images = self._read_bslz4_chunks(dataset)
+                    else:
+                        logging.info(
+                            f"Compression type: {compression}. Compressing data..."
+                        )
+                        images = self._compress_frames(
+                            np.array(dataset), compression, executor
+                        )
+
+                    for image in tqdm(images, total=number_of_frames_per_data_file[jj]):
+                        frame_arena.append(encode_payload(image, direct_chunk_read))
+
+                    elapsed_time = time.perf_counter() - t
+                    metrics.DATA_FILE_LOAD_SECONDS.labels(
+                        method="direct_chunk_read" if direct_chunk_read else "compress"
+                    ).observe(elapsed_time)
+                    number_of_frames = number_of_frames_per_data_file[jj]
+                    size_mb = dataset.size * dataset.dtype.itemsize / 1e6
+                    logging.info(
+                        f"Data file {jj}: loaded {number_of_frames} frames "
+                        f"({size_mb:.1f} MB uncompressed) in {elapsed_time:.2f} s "
+                        f"({number_of_frames / elapsed_time:.1f} frames / s, "
+                        f"{size_mb / elapsed_time:.1f} MB / s)"
+                    )
+
+        logging.info(f"Number of unique frames: {len(frame_arena)}")
+        frames = frame_arena.build()
+        logging.info(f"Frame arena size: {frames.footprint / 1e6:.1f} MB")
+        self._add_dataset(prepared_dataset(frames=frames), activate)
+        metrics.DATASET_LOAD_SECONDS.labels(source="hdf5").observe(
+            time.perf_counter() - load_start_time
+        )
+
+        if self.frame_cache is not None:
+            self.frame_cache.store(
+                cache_key,
+                frames,
+                metadata={
+                    "hdf5_file_path": str(hdf5_file_path),
+                    "compression": compression,
+                    "number_of_data_files": number_of_datafiles,
+                    "number_of_frames": len(frames),
+                },
+            )
+
+    def create_synthetic_frames(
+        self,
+        detector_size: DetectorSize,
+        dtype: Literal["uint16", "uint32"],
+        number_of_frames: int,
+        compression: Literal["bslz4", "lz4", "none"],
+        name: str | None = None,
+        activate: bool = True,
+        reuse: bool = False,
+    ) -> None:
+        """
+        Generates synthetic frames (see `SyntheticFrameGenerator`) and caches
+        them in the frame arena, as `create_list_of_compressed_frames` does for
+        frames loaded from a hdf5 file. The start message is updated to match
+        the synthetic frames; the fields which do not depend on the frames
+        (e.g. count_time or incident_energy) keep their current values
+
+        Parameters
+        ----------
+        detector_size : DetectorSize
+            Detector size, e.g. "16M"
+        dtype : Literal["uint16", "uint32"]
+            Data type of the frames
+        number_of_frames : int
+            Number of unique frames
+        compression : Literal["bslz4", "lz4", "none"]
+            Compression type
+        name : str | None, optional
+            Name of the dataset in the frame library. Defaults to
+            "synthetic_<detector_size>_<dtype>"
+        activate : bool, optional
+            If True, the dataset becomes the dataset streamed on trigger.
+            Otherwise it is only added to the frame library (preloaded)
+        reuse : bool, optional
+            If True and synthetic frames with the same parameters are in the
+            frame library, they are used instead of generating new frames
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If a preloaded dataset does not fit in the frame library
+        """
+        name = name if name is not None else f"synthetic_{detector_size}_{dtype}"
+        if reuse and self._reuse_dataset(
+            activate,
+            synthetic_detector=detector_size,
+            synthetic_dtype=dtype,
+            number_of_frames_per_trigger=number_of_frames,
+            compression=compression,
+        ):
+            return
+        load_start_time = time.perf_counter()
+        generator = SyntheticFrameGenerator(detector_size, dtype)
+
+        start_message, image_message, end_message = generator.header(number_of_frames)
+        detector_configuration = {
+            "detector_bit_depth_image": generator.dtype.itemsize * 8,
+            "detector_compression": compression,
+        }
+        uncompressed_nbytes = number_of_frames * generator.frame_nbytes
+        prepared_dataset = partial(
+            PreparedDataset,
+            name=name,
+            start_message=start_message,
+            image_message=image_message,
+            end_message=end_message,
+            detector_configuration=detector_configuration,
+            number_of_frames_per_trigger=number_of_frames,
+            compression=compression,
+            uncompressed_nbytes=uncompressed_nbytes,
+            synthetic_detector=detector_size,
+            synthetic_dtype=dtype,
+        )
+        if activate:
+            self._apply_dataset_header(
+                start_message,
+                image_message,
+                end_message,
+                detector_configuration,
+                number_of_frames,
+            )
+        encode_payload = partial(
+            self._encode_frame,
+            includes_header=False,
+            dtype=dtype,
+            shape=generator.shape,
+            compressed_image=compression.lower() != "none",
+            image_message=image_message,
+            compression=compression,
+        )
+
+        if self.frame_source == "streaming":
+            logging.info("Synthetic frames are always cached in memory")
+
+        logging.info(
+            f"Generating {number_of_frames} synthetic {detector_size} frames "
+            f"({generator.shape[1]} x {generator.shape[0]}, {dtype}). "
+            f"Compression type: {compression}"
+        )
+        frame_arena = FrameArenaBuilder()
+        with self._compression_executor() as executor:
+            with tqdm(total=number_of_frames) as progress_bar:
+                for batch in generator.generate(number_of_frames):
+                    for image in self._compress_frames(batch, compression, executor):
+                        frame_arena.append(encode_payload(image))
+                        progress_bar.update()
+
+        elapsed_time = time.perf_counter() - load_start_time
+        logging.info(
+            f"Generated {number_of_frames} frames "
+            f"({uncompressed_nbytes / 1e6:.1f} MB uncompressed) in "
+            f"{elapsed_time:.2f} s ({number_of_frames / elapsed_time:.1f} frames / s)"
+        )
+        frames = frame_arena.build()
+        logging.info(f"Frame arena size: {frames.footprint / 1e6:.1f} MB")
+        self._add_dataset(prepared_dataset(frames=frames), activate)
+        metrics.DATASET_LOAD_SECONDS.labels(source="synthetic").observe(elapsed_time)
+
+    def _reuse_dataset(self, activate: bool, **source) -> bool:
+        """
+        Looks up a dataset prepared from the given source in the frame library
+        and, if `activate` is True, makes it the active dataset
+
+        Parameters
+        ----------
+        activate : bool
+            Whether the dataset becomes the active dataset
+        **source
+            Values of the PreparedDataset fields which describe the source of
+            the dataset (see `FrameLibrary.find`)
+
+        Returns
+        -------
+        bool
+            Whether a matching dataset was found
+        """
+        dataset = self.frame_library.find(**source)
+        if dataset is None:
+            return False
+        logging.info(f"Using dataset {dataset.name} of the frame library")
+        if activate:
+            self.activate_dataset(dataset.name)
+        return True
+
+    def _add_dataset(self, dataset: PreparedDataset, activate: bool) -> None:
+        """
+        Adds a prepared dataset to the frame library and, if `activate` is
+        True, makes it the dataset streamed on trigger
+
+        Parameters
+        ----------
+        dataset : PreparedDataset
+            The dataset
+        activate : bool
+            Whether the dataset becomes the active dataset
 
-                data = cbor2.CBORTag(40, [array_shape, image_contents])
-                image_message["data"]["threshold_1"] = data
+        Returns
+        -------
+        None
+        """
+        if not activate:
+            self.frame_library.add(dataset, activate=False)
+            logging.info(f"Dataset {dataset.name} added to the frame library")
+            self._update_frame_cache_metrics()
+            return
+        self.frame_library.add(dataset, activate=True)
+        self.activate_dataset(dataset.name)
+
+    def _update_frame_cache_metrics(self) -> None:
+        """
+        Updates the size of the frame library and the compression ratio of the
+        active dataset reported by the /metrics endpoint
 
-                frame_list.append(image_message)
+        Returns
+        -------
+        None
+        """
+        metrics.FRAME_CACHE_BYTES.set(self.frame_library.size)
+        metrics.FRAME_CACHE_FRAMES.set(self.frame_library.number_of_frames)
+        metrics.FRAME_LIBRARY_DATASETS.set(len(self.frame_library))
+        dataset = self.frame_library.active_dataset
+        if dataset is None or not isinstance(dataset.frames, FrameArena):
+            return
+        encoded_nbytes = int(dataset.frames.payload_lengths.sum())
+        if encoded_nbytes > 0:
+            metrics.FRAME_CACHE_COMPRESSION_RATIO.set(
+                dataset.uncompressed_nbytes / encoded_nbytes
+            )
 
-                del image_message
+    @staticmethod
+    def _get_data_file_paths(
+        hdf5_file_path: str | Path, raw_data_group: "h5py.Group", keys: list[str]
+    ) -> list[Path]:
+        """
+        Gets the paths of the datafiles linked from the master file
 
-        logging.info(f"Number of unique frames: {len(frame_list)}")
-        del datafile_list
-        self.frames = frame_list
+        Parameters
+        ----------
+        hdf5_file_path : str | Path
+            Path of the hdf5 master file
+        raw_data_group : h5py.Group
+            The /entry/data group of the master file
+        keys : list[str]
+            Names of the datasets in the /entry/data group
+
+        Returns
+        -------
+        list[Path]
+            Paths of the datafiles. Datasets stored in the master file itself
+            are not included
+        """
+        import h5py
+
+        paths = []
+        for key in keys:
+            link = raw_data_group.get(key, getlink=True)
+            if isinstance(link, h5py.ExternalLink):
+                # External links are relative to the directory of the master file
+                paths.append(Path(hdf5_file_path).parent / link.filename)
+        return paths
+
+    @staticmethod
+    def _is_bslz4_chunked(dataset: "h5py.Dataset") -> bool:
+        """
+        Checks whether a dataset is stored as one bitshuffle/lz4 compressed
+        chunk per frame, in which case the chunks can be sent through the
+        ZeroMQ stream without decompressing and recompressing them
+
+        Parameters
+        ----------
+        dataset : h5py.Dataset
+            A 3D dataset containing frames
+
+        Returns
+        -------
+        bool
+            True if every chunk of the dataset is a bslz4 compressed frame
+        """
+        if dataset.chunks != (1, *dataset.shape[1:]):
+            return False
+        plist = dataset.id.get_create_plist()
+        if plist.get_nfilters() != 1:
+            return False
+        filter_id, _, filter_values, _ = plist.get_filter(0)
+        # The fifth filter option of the bitshuffle filter is the compression
+        # applied after shuffling the bits (2: lz4, 3: zstd)
+        return (
+            filter_id == BITSHUFFLE_FILTER_ID
+            and len(filter_values) > 4
+            and filter_values[4] == BITSHUFFLE_LZ4
+        )
+
+    def _read_bslz4_chunks(self, dataset: "h5py.Dataset") -> Iterator[bytes]:
+        """
+        Reads the bslz4 compressed frames of a dataset with `read_direct_chunk`.
+        The chunks are returned as they are stored in the hdf5 file, i.e.
+        including the bitshuffle header (number of bytes and block size)
+
+        Parameters
+        ----------
+        dataset : h5py.Dataset
+            A 3D dataset stored as one bslz4 compressed chunk per frame (see
+            `_is_bslz4_chunked`)
+
+        Returns
+        -------
+        Iterator[bytes]
+            The compressed frames
+        """
+        for ii in range(dataset.shape[0]):
+            filter_mask, chunk = dataset.id.read_direct_chunk((ii, 0, 0))
+            if filter_mask:
+                # The bitshuffle filter was not applied to this chunk
+                frame = np.frombuffer(chunk, dtype=dataset.dtype)
+                chunk = compression_header(
+                    "bslz4", frame.nbytes, frame.itemsize, self.bslz4_block_size
+                ) + compress_frame(frame, "bslz4", self.bslz4_block_size)
+            yield chunk
+
+    def _compression_executor(self) -> ProcessPoolExecutor | nullcontext[None]:
+        """
+        Creates the process pool used to compress frames. If
+        compression_workers <= 1, frames are compressed in the current process
+
+        Returns
+        -------
+        ProcessPoolExecutor | nullcontext[None]
+            A process pool, or a null context if frames are compressed
+            sequentially
+        """
+        if self.compression_workers <= 1:
+            return nullcontext()
+        return ProcessPoolExecutor(max_workers=self.compression_workers)
+
+    def _compress_frames(
+        self,
+        datafile: npt.NDArray,
+        compression: Literal["bslz4", "lz4", "none"],
+        executor: ProcessPoolExecutor | None,
+    ) -> Iterator[bytes]:
+        """
+        Compresses all frames of a datafile. The compressed frames are returned
+        in the same order as the frames of the datafile
+
+        Parameters
+        ----------
+        datafile : npt.NDArray
+            A 3D array containing the frames of a datafile
+        compression : Literal["bslz4", "lz4", "none"]
+            Compression type
+        executor : ProcessPoolExecutor | None
+            Process pool used to compress the frames in parallel. If None,
+            frames are compressed sequentially
+
+        Returns
+        -------
+        Iterator[bytes]
+            The compressed frames
+        """
+        compress = partial(
+            compress_frame, compression=compression, block_size=self.bslz4_block_size
+        )
+        if executor is None:
+            return map(compress, datafile)
+        chunksize = max(1, len(datafile) // (4 * self.compression_workers))
+        return executor.map(compress, datafile, chunksize=chunksize)
+
+    def _create_image_header_template(self) -> None:
+        """
+        Pre-encodes the image message header fields which do not change
+        between frames. The fields updated by `stream_frames` for every frame
+        (series_id, series_unique_id, image_id, series_date and stop_time) are
+        left out of the template
+
+        Returns
+        -------
+        None
+        """
+        static_header = {
+            key: val
+            for key, val in self.image_message.items()
+            if key not in IMAGE_PAYLOAD_KEYS + IMAGE_HEADER_KEYS
+        }
+        self._number_of_static_header_items = len(static_header)
+        self._image_header_template = _encode_cbor_map_items(static_header)
+
+    def _encode_frame(
+        self,
+        image: bytes | dict[str, bytes],
+        includes_header: bool,
+        dtype: str,
+        shape: tuple[int, int],
+        compressed_image: bool,
+        image_message: dict | None = None,
+        compression: str = "bslz4",
+    ) -> bytes:
+        """
+        Encodes a compressed image into the payload of an image message
+
+        Parameters
+        ----------
+        image : bytes | dict[str, bytes]
+            A compressed or uncompressed image in bytes format, or the images
+            of each channel of the message, e.g. {"threshold_1": ...,
+            "threshold_2": ...}
+        includes_header : bool
+            Whether the compressed images already start with the bytes-header
+        dtype : str
+            Data type, e.g. 'uint32'
+        shape : tuple[int, int]
+            Shape of the array
+        compressed_image : bool
+            Whether the image is compressed
+        image_message : dict | None, optional
+            Image message structure of the dataset. Defaults to the image
+            message of the active dataset
+        compression : str, optional
+            Compression type of a compressed image
+
+        Returns
+        -------
+        bytes
+            The CBOR-encoded payload of the image message
+        """
+        images = image if isinstance(image, dict) else {"threshold_1": image}
+        data = {
+            channel: cbor2.CBORTag(
+                40,
+                [
+                    shape,
+                    self.create_image_cbor_object(
+                        channel_image,
+                        dtype,
+                        shape,
+                        compressed_image=compressed_image,
+                        includes_header=includes_header,
+                        compression=compression,
+                    ),
+                ],
+            )
+            for channel, channel_image in images.items()
+        }
+        return self._encode_image_payload(data, image_message)
+
+    def _encode_image_payload(
+        self, data: dict[str, cbor2.CBORTag], image_message: dict | None = None
+    ) -> bytes:
+        """
+        Encodes the payload fields of an image message, i.e. the image data and
+        the (deprecated) channels list
+
+        Parameters
+        ----------
+        data : dict[str, cbor2.CBORTag]
+            A cbor2.CBORTag (tag 40) containing the shape and the image contents
+            of each channel, e.g. {"threshold_1": ...}
+        image_message : dict | None, optional
+            Image message structure of the dataset. Defaults to the image
+            message of the active dataset
+
+        Returns
+        -------
+        bytes
+            The CBOR-encoded key-value pairs of the payload fields
+        """
+        if image_message is None:
+            image_message = self.image_message
+        payload = {
+            "data": {**image_message["data"], **data},
+            # One entry per channel
+            "channels": image_message["channels"][:1] * len(data),
+        }
+        return _encode_cbor_map_items(payload)
+
+    def _encode_image_header(self, series: SeriesSnapshot) -> bytes:
+        """
+        Encodes the header of the next image message, i.e. the CBOR map header
+        and every field of the image message except for the payload fields.
+        The header is written in front of a pre-encoded payload of the frame
+        arena (see `FrameArena.write_message`)
+
+        Parameters
+        ----------
+        series : SeriesSnapshot
+            The series the image belongs to
+
+        Returns
+        -------
+        bytes
+            The CBOR-encoded image message header
+        """
+        header = {
+            "series_id": series.series_id,
+            "series_unique_id": series.series_unique_id,
+            "image_id": self.image_number,
+            "series_date": datetime.now(tz=timezone.utc),
+            "stop_time": [50000000, 50000000],
+        }
+        number_of_items = (
+            series.number_of_static_header_items
+            + len(IMAGE_HEADER_KEYS)
+            + len(IMAGE_PAYLOAD_KEYS)
+        )
+        return b"".join(
+            (
+                _encode_cbor_map_header(number_of_items),
+                series.image_header_template,
+                _encode_cbor_map_items(header),
+            )
+        )
 
     def create_image_cbor_object(
         self,
@@ -328,6 +2020,8 @@ class ZmqStream:
         dtype: str,
         shape: tuple[int, int],
         compressed_image: bool = True,
+        includes_header: bool = False,
+        compression: str = "bslz4",
     ) -> cbor2.CBORTag | bytes:
         """
         Creates a cbor object containing a compressed frame and frame metadata.
@@ -343,6 +2037,13 @@ class ZmqStream:
             Data type, e.g. 'uint32'
         shape : tuple[int, int]
             Shape of the array
+        compressed_image : bool, optional
+            Whether the image is compressed
+        includes_header : bool, optional
+            Whether the compressed image already starts with the bytes-header,
+            e.g. a bslz4 chunk read directly from a hdf5 file
+        compression : str, optional
+            Compression type of a compressed image
 
         Returns
         -------
@@ -370,71 +2071,410 @@ class ZmqStream:
         if not compressed_image:
             return cbor2.CBORTag(tag, image)
 
-        bytes_number_of_elements = struct.pack(
-            ">q", (shape[0] * shape[1] * element_size)
-        )
-        # TODO: There's probably a way to write the bytes_block_size with
-        # the struct library
-        bytes_block_size = b"\x00\x00 \x00"
-
-        byte_array = bytes_number_of_elements + bytes_block_size + image
+        if includes_header:
+            byte_array = image
+        else:
+            byte_array = (
+                compression_header(
+                    compression,
+                    shape[0] * shape[1] * element_size,
+                    element_size,
+                    self.bslz4_block_size,
+                )
+                + image
+            )
 
-        image_obj = cbor2.CBORTag(56500, [self.compression, element_size, byte_array])
+        image_obj = cbor2.CBORTag(56500, [compression, element_size, byte_array])
 
         image_contents = cbor2.CBORTag(tag, image_obj)
 
         return image_contents
 
-    def stream_frames(self, compressed_image_list: list[dict]) -> None:
-        """Send images through a ZeroMQ stream
+    @property
+    def frame_period(self) -> float:
+        """Time between frames [seconds]"""
+        if self.pace_with_frame_time:
+            return zmq_start_message.frame_time
+        return self.delay_between_frames
+
+    def _prefetch_frames(self, series: SeriesSnapshot) -> None:
+        """
+        Starts reading and compressing the frames of the next series if frames
+        are streamed from the datafiles. No-op if frames are cached in memory
 
         Parameters
         ----------
-        compressed_image_list : list[dict]
-            A list of dictionaries containing compressed frames and metadata
+        series : SeriesSnapshot
+            The series
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(series.frames, StreamingFrameSource):
+            if self.frame_id >= len(series.frames):
+                self.frame_id = 0
+            series.frames.prefetch(self.frame_id, series.number_of_frames_per_trigger)
+
+    def stream_frames(self, series: SeriesSnapshot) -> None:
+        """Send images through a ZeroMQ stream. Frames are sent without copying
+        them from the frame arena (zero-copy). Only the snapshot of the series
+        is read, so configuration changes made while the frames are sent apply
+        to the next series
+
+        Parameters
+        ----------
+        series : SeriesSnapshot
+            The series, see `arm`. Its frames are an arena of CBOR-encoded
+            image message payloads created by
+            `create_list_of_compressed_frames`, or a streaming frame source
 
         Returns
         -------
         None
         """
         logging.info(f"Sending frames to {self.address}")
+        compressed_image_list = series.frames
+        self._prefetch_frames(series)
+        # The frame index is only written back at the end of the series, and
+        # only if the frames were not swapped in the meantime
+        frame_id = self.frame_id
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.number_of_frames_in_series = series.number_of_frames_per_trigger
+        self._series_start_time = time.time()
+        self._series_end_time = None
+        pacer = FramePacer(
+            series.frame_period, series.pacing_policy, series.spin_threshold
+        )
+        pacer.start(series.number_of_frames_per_trigger)
         t = time.time()
-        for _ in trange(self.number_of_frames_per_trigger):
-            time.sleep(self.delay_between_frames)
+        for _ in trange(series.number_of_frames_per_trigger):
+            if not pacer.wait(self._cancel_event) or self._cancel_event.is_set():
+                logging.info(
+                    f"Series cancelled after {self.frames_sent} of "
+                    f"{series.number_of_frames_per_trigger} frames"
+                )
+                if isinstance(compressed_image_list, StreamingFrameSource):
+                    compressed_image_list.stop()
+                break
+            if frame_id >= len(compressed_image_list):
+                frame_id = 0
+
+            t_encode = time.perf_counter()
+            header = self._encode_image_header(series)
+            zero_copy = not (
+                series.overflow_policy != "block"
+                and compressed_image_list.is_in_flight(frame_id)
+            )
+            if zero_copy:
+                message = compressed_image_list.write_message(
+                    frame_id, header, self._cancel_event
+                )
+                if message is None:
+                    # Cancelled while waiting for the receiver
+                    continue
+            else:
+                # ZMQ still holds the last send of this frame, i.e. the receiver
+                # is behind. Writing the header in the frame arena would wait
+                # for the receiver, so the overflow policy is applied to a copy
+                message = compressed_image_list.copy_message(frame_id, header)
+            # The monitor and the filewriter receive every image, independently
+            # of the stream
+            payload = memoryview(message)[len(header) :]
+            self.monitor.update(series.series_id, self.image_number, payload)
+            self.filewriter.write(payload)
+            t_send = time.perf_counter()
+            tracker = self._send_image(message, series.overflow_policy)
+            t_sent = time.perf_counter()
+            if tracker is None and self._cancel_event.is_set():
+                continue
+            if zero_copy:
+                compressed_image_list.set_tracker(frame_id, tracker)
+
+            metrics.FRAME_ENCODE_SECONDS.observe(t_send - t_encode)
+            metrics.FRAME_SEND_SECONDS.observe(t_sent - t_send)
+            if self._arm_time is not None:
+                metrics.ARM_TO_FIRST_FRAME_SECONDS.observe(t_sent - self._arm_time)
+                self._arm_time = None
+            frame_id += 1
+            self.image_number += 1
+
+        self._flush_pending_images(discard=self._cancel_event.is_set())
+        with self._frames_lock:
+            if self.frames is compressed_image_list:
+                self.frame_id = frame_id
+        self._series_end_time = time.time()
+        metrics.SERIES_STREAMED.inc()
+        frame_rate = self.frames_sent / (self._series_end_time - t)
+        logging.info(f"Frame rate: {frame_rate} frames / s")
+        if self.frames_dropped:
+            logging.warning(
+                f"{self.frames_dropped} of {self.frames_sent + self.frames_dropped} "
+                "frames were dropped because the receiver could not keep up "
+                f"(overflow policy: {series.overflow_policy})"
+            )
+
+        self.pacing_statistics = pacer.statistics()
+        if self.pacing_statistics.target_frame_rate is not None:
+            logging.info(
+                f"Frame jitter (s): mean={self.pacing_statistics.mean_jitter:.2e}, "
+                f"p99={self.pacing_statistics.p99_jitter:.2e}, "
+                f"max={self.pacing_statistics.max_jitter:.2e}. "
+                f"Late frames: {self.pacing_statistics.late_frames}"
+            )
+
+        if isinstance(compressed_image_list, StreamingFrameSource):
+            statistics = compressed_image_list.statistics
+            if statistics.kept_up:
+                logging.info("The streaming frame source kept up with the frame rate")
+            else:
+                logging.warning(
+                    "The streaming frame source could not keep up with the frame "
+                    f"rate: {statistics.number_of_stalls} of "
+                    f"{statistics.number_of_frames} frames were not ready in time "
+                    f"(total wait time: {statistics.wait_time:.3f} s)"
+                )
+
+    def _get_image_socket(self) -> zmq.Socket:
+        """
+        Gets the socket the next image is sent to
+
+        Returns
+        -------
+        zmq.Socket
+            The socket
+        """
+        if len(self.sockets) == 1:
+            return self.sockets[0]
+        if self.distribution == "image_id":
+            return self.sockets[self.image_number % len(self.sockets)]
+        socket = self.sockets[self._next_socket]
+        self._next_socket = (self._next_socket + 1) % len(self.sockets)
+        return socket
+
+    def _send_image(
+        self,
+        message: memoryview | bytearray,
+        overflow_policy: Literal["block", "drop_newest", "drop_oldest"],
+    ) -> zmq.MessageTracker | None:
+        """
+        Sends an image message without copying it. The message is first sent
+        without blocking. If the high-water mark of the socket is reached,
+        i.e. the receiver cannot keep up, the overflow policy decides whether
+        we block until the message can be sent (the time spent blocked is
+        measured), drop the message, or queue it (see `_queue_image`). A
+        blocked send stops waiting when the series is cancelled
+
+        Parameters
+        ----------
+        message : memoryview | bytearray
+            The encoded image message
+        overflow_policy : Literal["block", "drop_newest", "drop_oldest"]
+            The overflow policy of the series
+
+        Returns
+        -------
+        zmq.MessageTracker | None
+            Tracker of the send, done once libzmq has released the message.
+            None if the message was dropped or queued, or if the series was
+            cancelled while we waited for the receiver
+        """
+        socket = self._get_image_socket()
+        pending_images = self._pending_images[self.sockets.index(socket)]
+        if pending_images:
+            # Images are sent in order
+            self._send_pending_images(socket, pending_images)
+        if not pending_images:
             try:
-                # Add series number
-                compressed_image_list[self.frame_id]["series_id"] = self.sequence_id
-                compressed_image_list[self.frame_id]["image_id"] = self.image_number
-                compressed_image_list[self.frame_id]["series_date"] = datetime.now(
-                    tz=timezone.utc
+                tracker = socket.send(
+                    message, flags=zmq.NOBLOCK, copy=False, track=True
                 )
-                compressed_image_list[self.frame_id]["stop_time"] = [50000000, 50000000]
-                compressed_image_list[self.frame_id][
-                    "series_unique_id"
-                ] = self.series_unique_id
-
-                self.socket.send(cbor2.dumps(compressed_image_list[self.frame_id]))
-                self.frame_id += 1
-                self.image_number += 1
-            except IndexError:
-                self.frame_id = 0
-                compressed_image_list[self.frame_id]["series_id"] = self.sequence_id
-                compressed_image_list[self.frame_id]["image_id"] = self.image_number
-                compressed_image_list[self.frame_id]["series_date"] = datetime.now(
-                    tz=timezone.utc
+                self._count_sent_image(message)
+                return tracker
+            except zmq.Again:
+                pass
+        metrics.ZMQ_BLOCKED_SENDS.inc()
+        if overflow_policy == "drop_newest":
+            self._drop_image()
+            return None
+        if overflow_policy == "drop_oldest":
+            self._queue_image(pending_images, message)
+            return None
+        t = time.perf_counter()
+        tracker = None
+        while tracker is None and self._wait_until_writable(socket):
+            try:
+                tracker = socket.send(
+                    message, flags=zmq.NOBLOCK, copy=False, track=True
                 )
-                compressed_image_list[self.frame_id]["stop_time"] = [50000000, 50000000]
-                compressed_image_list[self.frame_id][
-                    "series_unique_id"
-                ] = self.series_unique_id
+            except zmq.Again:
+                continue
+        metrics.ZMQ_BLOCKED_SECONDS.inc(time.perf_counter() - t)
+        if tracker is not None:
+            self._count_sent_image(message)
+        return tracker
+
+    def _count_sent_image(self, message: memoryview | bytearray | bytes) -> None:
+        """
+        Counts an image message handed to ZMQ. Images dropped by the overflow
+        policy are counted by `_drop_image` instead
 
-                self.socket.send(cbor2.dumps(compressed_image_list[self.frame_id]))
+        Parameters
+        ----------
+        message : memoryview | bytearray | bytes
+            The encoded image message
 
-                self.frame_id += 1
-                self.image_number += 1
+        Returns
+        -------
+        None
+        """
+        self.frames_sent += 1
+        metrics.FRAMES_SENT.inc()
+        metrics.BYTES_SENT.inc(len(message))
 
-        frame_rate = self.number_of_frames_per_trigger / (time.time() - t)
-        logging.info(f"Frame rate: {frame_rate} frames / s")
+    def _wait_until_writable(self, socket: zmq.Socket) -> bool:
+        """
+        Waits until a message can be sent through a socket without blocking,
+        i.e. until the receiver has read enough messages. The socket is polled
+        in short steps, so that the wait stops when the series is cancelled,
+        even if the receiver never reads again
+
+        Parameters
+        ----------
+        socket : zmq.Socket
+            The socket
+
+        Returns
+        -------
+        bool
+            False if the series was cancelled
+        """
+        while not socket.poll(_SEND_POLL_INTERVAL, zmq.POLLOUT):
+            if self._cancel_event.is_set():
+                return False
+        return True
+
+    def _queue_image(
+        self, pending_images: deque, message: memoryview | bytearray
+    ) -> None:
+        """
+        Queues an image message until the socket can send it, dropping the
+        oldest queued message if the queue is full. The message is copied,
+        since the frame arena may write the header of the same frame again
+        before the message is sent
+
+        Parameters
+        ----------
+        pending_images : deque
+            The queue of the socket
+        message : memoryview | bytearray
+            The encoded image message
+
+        Returns
+        -------
+        None
+        """
+        if len(pending_images) == pending_images.maxlen:
+            self._drop_image()
+        pending_images.append(bytes(message))
+
+    def _send_pending_images(self, socket: zmq.Socket, pending_images: deque) -> None:
+        """
+        Sends the queued image messages of a socket until its high-water mark
+        is reached
+
+        Parameters
+        ----------
+        socket : zmq.Socket
+            The socket
+        pending_images : deque
+            The queue of the socket
+
+        Returns
+        -------
+        None
+        """
+        while pending_images:
+            try:
+                socket.send(pending_images[0], flags=zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                return
+            self._count_sent_image(pending_images.popleft())
+
+    def _flush_pending_images(self, discard: bool = False) -> None:
+        """
+        Sends the image messages still queued at the end of a series, so that
+        they are received before the end message
+
+        Parameters
+        ----------
+        discard : bool, optional
+            If True, e.g. if the series was cancelled, the queued messages are
+            dropped instead
+
+        Returns
+        -------
+        None
+        """
+        for socket, pending_images in zip(self.sockets, self._pending_images):
+            while pending_images:
+                if discard or not self._wait_until_writable(socket):
+                    pending_images.popleft()
+                    self._drop_image()
+                    continue
+                try:
+                    socket.send(pending_images[0], flags=zmq.NOBLOCK, copy=False)
+                except zmq.Again:
+                    continue
+                self._count_sent_image(pending_images.popleft())
+
+    def _drop_image(self) -> None:
+        """
+        Counts an image message dropped by the overflow policy
+
+        Returns
+        -------
+        None
+        """
+        self.frames_dropped += 1
+        metrics.FRAMES_DROPPED.inc()
+
+    def _send_to_all_sockets(self, message: bytes, message_type: str) -> None:
+        """
+        Sends a message (e.g. a start or end message) to every socket. If a
+        receiver is not reading, we wait at most ZMQ_LINGER milliseconds
+        (_CONTROL_MESSAGE_TIMEOUT if ZMQ_LINGER is -1) and the message is not
+        sent to that socket, so that arm and abort cannot block forever. Such
+        messages are logged as errors and counted in
+        `control_messages_dropped`, since the receiver then misses the start
+        or the end of a series
+
+        Parameters
+        ----------
+        message : bytes
+            The message
+        message_type : str
+            Type of the message, e.g. "start", used in the logs
+
+        Returns
+        -------
+        None
+        """
+        timeout = self.linger if self.linger >= 0 else _CONTROL_MESSAGE_TIMEOUT
+        for socket, address in zip(self.sockets, self.addresses):
+            if socket.poll(timeout, zmq.POLLOUT):
+                try:
+                    socket.send(message, flags=zmq.NOBLOCK)
+                    continue
+                except zmq.Again:
+                    pass
+            self.control_messages_dropped += 1
+            metrics.CONTROL_MESSAGES_DROPPED.labels(type=message_type).inc()
+            logging.error(
+                f"The receiver of {address} is not reading, the {message_type} "
+                f"message was not sent after {timeout} ms"
+            )
 
     def stream_start_message(self) -> None:
         """
@@ -447,13 +2487,83 @@ class ZmqStream:
         self.series_unique_id = str(uuid.uuid4())
 
         logging.info(f"Sending start message to {self.address}")
-        zmq_start_message.series_id = self.sequence_id
-        zmq_start_message.number_of_images = self.number_of_frames_per_trigger
-        zmq_start_message.user_data = self.user_data
-        zmq_start_message.series_unique_id = self.series_unique_id
+        with self._frames_lock:
+            # Frames prepared while the detector was armed are used from now
+            self._select_frames()
+            self.is_armed = True
+            zmq_start_message.series_id = self.sequence_id
+            zmq_start_message.number_of_images = self.number_of_frames_per_trigger
+            zmq_start_message.user_data = self.user_data
+            zmq_start_message.series_unique_id = self.series_unique_id
+            self.series = self._capture_series()
+
+        message = cbor2.dumps(dict(self.series.start_message))
+        self.control_messages_dropped = 0
+        self._send_to_all_sockets(message, "start")
+        self._arm_time = time.perf_counter()
+        self.filewriter.start_series(
+            self.series.series_id,
+            self.series.start_message,
+            self.series.detector_configuration,
+        )
 
-        message = cbor2.dumps(zmq_start_message.model_dump())
-        self.socket.send(message)
+        self._prefetch_frames(self.series)
+
+    def _capture_series(self) -> SeriesSnapshot:
+        """
+        Captures the configuration of the next series from the start message,
+        the detector configuration and the stream settings
+
+        Returns
+        -------
+        SeriesSnapshot
+            The snapshot of the series
+        """
+        return SeriesSnapshot(
+            series_id=self.sequence_id,
+            series_unique_id=self.series_unique_id,
+            start_message=MappingProxyType(zmq_start_message.model_dump()),
+            end_message=MappingProxyType(dict(self.end_message)),
+            detector_configuration=MappingProxyType(self.detector_config.model_dump()),
+            frames=self.frames,
+            number_of_frames_per_trigger=self.number_of_frames_per_trigger,
+            image_header_template=self._image_header_template,
+            number_of_static_header_items=self._number_of_static_header_items,
+            frame_period=self.frame_period,
+            pacing_policy=self.pacing_policy,
+            spin_threshold=self.spin_threshold,
+            overflow_policy=self.overflow_policy,
+        )
+
+    def arm(self) -> int:
+        """
+        Arms the detector: starts a new series, captures its configuration (see
+        `SeriesSnapshot`) and sends the start message
+
+        Returns
+        -------
+        int
+            The series id
+
+        Raises
+        ------
+        RuntimeError
+            If a series is being streamed, or if the frames are not loaded
+        """
+        with self._series_lock:
+            if self.is_streaming:
+                raise RuntimeError(
+                    "Cannot arm the detector while a series is being streamed"
+                )
+            if not self.is_ready:
+                raise RuntimeError(
+                    "Cannot arm the detector while the frames are being loaded"
+                )
+            self.sequence_id += 1
+            # Reset the image number every time we arm the detector
+            self.image_number = 0
+            self.stream_start_message()
+            return self.sequence_id
 
     def stream_end_message(self) -> None:
         """
@@ -465,10 +2575,174 @@ class ZmqStream:
         """
 
         logging.info(f"Sending end message to {self.address}")
-        self.end_message["series_id"] = self.sequence_id
-        self.end_message["series_unique_id"] = self.series_unique_id
-        message = cbor2.dumps(self.end_message)
-        self.socket.send(message)
+        series = self.series if self.series is not None else self._capture_series()
+        end_message = {
+            **series.end_message,
+            "series_id": series.series_id,
+            "series_unique_id": series.series_unique_id,
+        }
+        if series.overflow_policy != "block":
+            end_message["frames_dropped"] = self.frames_dropped
+        message = cbor2.dumps(end_message)
+        self._send_to_all_sockets(message, "end")
+        self.filewriter.end_series()
+        with self._frames_lock:
+            self.is_armed = False
+            self.series = None
+            self._select_frames()
+
+    @property
+    def is_streaming(self) -> bool:
+        """Whether a series is being streamed on the streaming thread"""
+        return self._streaming_thread is not None and self._streaming_thread.is_alive()
+
+    def trigger(self) -> None:
+        """
+        Starts sending the frames of a series on a dedicated streaming thread
+        and returns immediately. The detector state is "acquire" while frames
+        are being sent. The series is the one captured when the detector was
+        armed or, if the detector is not armed, is captured now
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        RuntimeError
+            If a series is already being streamed, or if the frames are not
+            loaded
+        """
+        with self._series_lock:
+            if self.is_streaming:
+                raise RuntimeError("A series is already being streamed")
+            if not self.is_ready:
+                raise RuntimeError("The frames are not loaded yet")
+            # Frames are not swapped until the series has been streamed (see
+            # `_select_frames_if_not_armed`)
+            with self._frames_lock:
+                series = (
+                    self.series if self.series is not None else self._capture_series()
+                )
+                self._is_streaming_series = True
+            self._cancel_event.clear()
+            detector_state.state = "acquire"
+            self._streaming_thread = threading.Thread(
+                target=self._stream_series,
+                args=(series,),
+                name="zmq-stream",
+                daemon=True,
+            )
+            self._streaming_thread.start()
+
+    def _stream_series(self, series: SeriesSnapshot) -> None:
+        """
+        Sends the frames of a series. Runs on the streaming thread
+
+        Parameters
+        ----------
+        series : SeriesSnapshot
+            The series
+
+        Returns
+        -------
+        None
+        """
+        try:
+            self.stream_frames(series)
+        except Exception:
+            logging.exception("Failed to stream frames")
+            detector_state.state = "error"
+        else:
+            if detector_state.state == "acquire":
+                detector_state.state = "ready"
+        finally:
+            with self._frames_lock:
+                self._is_streaming_series = False
+                end_series = self._end_series_when_stopped
+                self._end_series_when_stopped = False
+        if end_series:
+            self.stream_end_message()
+        elif detector_state.state != "error":
+            # Frames prepared while the series was streamed are used from now
+            self._select_frames_if_not_armed()
+
+    def cancel(self) -> bool:
+        """
+        Stops the series being streamed after the current image, and waits
+        until the streaming thread has finished. Sends blocked by a receiver
+        which is not reading are interrupted as well (see
+        `_wait_until_writable`)
+
+        Returns
+        -------
+        bool
+            False if the streaming thread did not stop within _CANCEL_TIMEOUT
+            seconds. It stops as soon as its current send returns
+        """
+        self._cancel_event.set()
+        if self._streaming_thread is not None:
+            self._streaming_thread.join(_CANCEL_TIMEOUT)
+            if self._streaming_thread.is_alive():
+                logging.warning(
+                    f"The streaming thread did not stop within {_CANCEL_TIMEOUT} s"
+                )
+                return False
+        return True
+
+    def abort(self) -> None:
+        """
+        Stops the series being streamed and ends the series. The end message
+        is sent once no more images can be sent, i.e. immediately if the
+        streaming thread has stopped, otherwise by the streaming thread when
+        it stops
+
+        Returns
+        -------
+        None
+        """
+        with self._series_lock:
+            if not self.cancel():
+                with self._frames_lock:
+                    if self._is_streaming_series:
+                        self._end_series_when_stopped = True
+                        return
+            self.stream_end_message()
+
+    def get_progress(self) -> dict:
+        """
+        Gets the progress of the last series
+
+        Returns
+        -------
+        dict
+            Number of frames sent, number of frames dropped by the overflow
+            policy, number of start and end messages which were not sent,
+            number of frames in the series, average frame rate [frames / s]
+            and estimated time remaining [s]
+        """
+        frame_rate = None
+        eta = None
+        # Dropped frames are not sent, but they are no longer remaining
+        frames_done = self.frames_sent + self.frames_dropped
+        if self._series_start_time is not None and frames_done > 0:
+            end_time = self._series_end_time or time.time()
+            elapsed_time = end_time - self._series_start_time
+            frame_rate = self.frames_sent / elapsed_time
+            if self._series_end_time is None:
+                remaining_frames = self.number_of_frames_in_series - frames_done
+                eta = remaining_frames * elapsed_time / frames_done
+            else:
+                eta = 0.0
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "control_messages_dropped": self.control_messages_dropped,
+            "number_of_frames": self.number_of_frames_in_series,
+            "frame_rate": frame_rate,
+            "eta": eta,
+            "streaming": self.is_streaming,
+        }
 
     def start_stream(self) -> None:
         """
@@ -480,13 +2754,38 @@ class ZmqStream:
         """
 
         self.stream_start_message()
-        self.stream_frames(self.frames)
+        self.stream_frames(self.series)
         self.stream_end_message()
 
 
 zmq_stream = ZmqStream(
-    address=config.ZMQ_ADDRESS,
+    address=config.ZMQ_ADDRESSES or config.ZMQ_ADDRESS,
     hdf5_file_path=config.HDF5_MASTER_FILE,
     delay_between_frames=config.DELAY_BETWEEN_FRAMES,
     number_of_data_files=config.NUMBER_OF_DATA_FILES,
+    compression_workers=config.COMPRESSION_WORKERS,
+    bslz4_block_size=config.BSLZ4_BLOCK_SIZE,
+    direct_chunk_read=config.DIRECT_CHUNK_READ,
+    frame_source=config.FRAME_SOURCE,
+    prefetch_size=config.STREAMING_PREFETCH_SIZE,
+    frame_cache=(
+        FrameCache(config.DISK_CACHE_DIR, config.DISK_CACHE_MAX_BYTES)
+        if config.DISK_CACHE_DIR is not None
+        else None
+    ),
+    frame_library=FrameLibrary(config.FRAME_CACHE_MAX_BYTES),
+    pace_with_frame_time=config.PACE_WITH_FRAME_TIME,
+    pacing_policy=config.PACING_POLICY,
+    spin_threshold=config.PACING_SPIN_THRESHOLD,
+    io_threads=config.ZMQ_IO_THREADS,
+    distribution=config.ZMQ_DISTRIBUTION,
+    sndhwm=config.ZMQ_SNDHWM,
+    sndbuf=config.ZMQ_SNDBUF,
+    linger=config.ZMQ_LINGER,
+    overflow_policy=config.ZMQ_OVERFLOW_POLICY,
+    filewriter_dir=config.FILEWRITER_DIR,
+    filewriter_queue_size=config.FILEWRITER_QUEUE_SIZE,
+    synthetic_detector=config.SYNTHETIC_DETECTOR,
+    synthetic_dtype=config.SYNTHETIC_DTYPE,
+    synthetic_number_of_frames=config.SYNTHETIC_NUMBER_OF_FRAMES,
 )
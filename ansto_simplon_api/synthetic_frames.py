@@ -0,0 +1,272 @@
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+
+from .parse_master_file import Parse
+
+# Geometry of an EIGER2 module (y, x) and of the gaps between modules [pixels]
+MODULE_SHAPE = (512, 1028)
+MODULE_GAP = (38, 12)
+# Number of modules (rows, columns) of each simulated detector size
+DETECTOR_MODULE_GRIDS = {
+    "1M": (2, 1),
+    "4M": (4, 2),
+    "9M": (6, 3),
+    "16M": (8, 4),
+    "32M": (8, 8),
+}
+DetectorSize = Literal["1M", "4M", "9M", "16M", "32M"]
+
+# Maximum number of pixels generated at once. A batch uses up to 6 bytes per
+# pixel of temporary memory
+_MAX_BATCH_PIXELS = 2**25
+# Resolution of the inverse cumulative distribution function used to sample
+# the background (see `_create_background_table`)
+_BACKGROUND_TABLE_BITS = 16
+
+
+class SyntheticFrameGenerator:
+    """
+    Generates detector-sized frames with NumPy, so that receivers can be
+    tested at arbitrary detector geometries without real datasets.
+
+    Every frame is made of a Poisson-distributed background and Bragg-like
+    spots (2D gaussian profiles at random positions with exponentially
+    distributed intensities), clipped at the saturation value. Pixels in the
+    gaps between modules are set to the maximum value of the data type, the
+    value used by the detector to flag masked pixels. Frames are generated in
+    batches, and every step is vectorised over the whole batch. The background
+    is sampled by looking up 16-bit random integers in a table of the inverse
+    cumulative distribution function, which is an order of magnitude faster
+    than numpy's Poisson sampler on detector-sized frames.
+    """
+
+    def __init__(
+        self,
+        detector_size: DetectorSize = "4M",
+        dtype: Literal["uint16", "uint32"] = "uint32",
+        background: float = 0.5,
+        number_of_spots: int = 200,
+        spot_intensity: float = 2000.0,
+        spot_sigma: float = 1.0,
+        saturation_value: int | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        detector_size : DetectorSize, optional
+            Detector size, which sets the number of modules
+            (see DETECTOR_MODULE_GRIDS)
+        dtype : Literal["uint16", "uint32"], optional
+            Data type of the frames
+        background : float, optional
+            Mean number of background counts per pixel
+        number_of_spots : int, optional
+            Number of spots per frame
+        spot_intensity : float, optional
+            Mean integrated intensity of a spot [counts]
+        spot_sigma : float, optional
+            Standard deviation of the profile of a spot [pixels]
+        saturation_value : int | None, optional
+            Counts are clipped at this value. If None, the maximum value of
+            the data type minus one is used
+        seed : int | None, optional
+            Seed of the random number generator
+
+        Returns
+        -------
+        None
+        """
+        self.detector_size = detector_size
+        self.dtype = np.dtype(dtype)
+        self.background = background
+        self.number_of_spots = number_of_spots
+        self.spot_intensity = spot_intensity
+        self.spot_sigma = spot_sigma
+        self.masked_value = int(np.iinfo(self.dtype).max)
+        self.saturation_value = (
+            saturation_value if saturation_value is not None else self.masked_value - 1
+        )
+        self.rng = np.random.default_rng(seed)
+
+        rows, columns = DETECTOR_MODULE_GRIDS[detector_size]
+        self.shape = (
+            rows * MODULE_SHAPE[0] + (rows - 1) * MODULE_GAP[0],
+            columns * MODULE_SHAPE[1] + (columns - 1) * MODULE_GAP[1],
+        )
+        self.gap_mask = self._create_gap_mask(rows, columns)
+        self._background_table = self._create_background_table(background)
+
+        # Spot profile, normalised so that the integrated intensity of a spot
+        # is its sampled intensity
+        radius = max(1, int(np.ceil(3 * spot_sigma)))
+        dy, dx = np.mgrid[-radius : radius + 1, -radius : radius + 1]
+        profile = np.exp(-(dy**2 + dx**2) / (2 * spot_sigma**2))
+        self._spot_profile = (profile / profile.sum()).ravel()
+        self._spot_dy = dy.ravel()
+        self._spot_dx = dx.ravel()
+
+    @property
+    def frame_nbytes(self) -> int:
+        """Size of an uncompressed frame in bytes"""
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    @staticmethod
+    def _create_background_table(mean: float) -> npt.NDArray[np.uint32]:
+        """
+        Tabulates the inverse cumulative distribution function of a Poisson
+        distribution, so that table[u] follows the distribution when u is
+        uniformly distributed in [0, 2**_BACKGROUND_TABLE_BITS)
+
+        Parameters
+        ----------
+        mean : float
+            Mean of the Poisson distribution
+
+        Returns
+        -------
+        npt.NDArray[np.uint32]
+            The table
+        """
+        table_size = 2**_BACKGROUND_TABLE_BITS
+        max_counts = int(mean + 20 * np.sqrt(mean) + 20)
+        pmf = np.empty(max_counts + 1)
+        pmf[0] = np.exp(-mean)
+        for k in range(1, max_counts + 1):
+            pmf[k] = pmf[k - 1] * mean / k
+        cdf = np.cumsum(pmf)
+        quantiles = (np.arange(table_size) + 0.5) / table_size
+        return np.minimum(np.searchsorted(cdf, quantiles), max_counts).astype(np.uint32)
+
+    def _create_gap_mask(self, rows: int, columns: int) -> npt.NDArray[np.bool_]:
+        """
+        Creates the mask of the pixels in the gaps between modules
+
+        Parameters
+        ----------
+        rows : int
+            Number of rows of modules
+        columns : int
+            Number of columns of modules
+
+        Returns
+        -------
+        npt.NDArray[np.bool_]
+            A boolean array which is True in the gaps between modules
+        """
+        gap_mask = np.zeros(self.shape, dtype=bool)
+        for row in range(1, rows):
+            start = row * (MODULE_SHAPE[0] + MODULE_GAP[0]) - MODULE_GAP[0]
+            gap_mask[start : start + MODULE_GAP[0], :] = True
+        for column in range(1, columns):
+            start = column * (MODULE_SHAPE[1] + MODULE_GAP[1]) - MODULE_GAP[1]
+            gap_mask[:, start : start + MODULE_GAP[1]] = True
+        return gap_mask
+
+    def generate_batch(self, batch_size: int) -> npt.NDArray:
+        """
+        Generates a batch of frames
+
+        Parameters
+        ----------
+        batch_size : int
+            Number of frames
+
+        Returns
+        -------
+        npt.NDArray
+            A (batch_size, y, x) array of frames
+        """
+        height, width = self.shape
+        uniform = self.rng.integers(
+            0,
+            2**_BACKGROUND_TABLE_BITS,
+            size=(batch_size, height, width),
+            dtype=np.uint16,
+        )
+        counts = self._background_table[uniform]
+        del uniform
+
+        # Spots: every pixel of the profile of every spot of every frame is
+        # added in a single scatter-add
+        spot_y = self.rng.integers(0, height, size=(batch_size, self.number_of_spots))
+        spot_x = self.rng.integers(0, width, size=(batch_size, self.number_of_spots))
+        intensities = self.rng.exponential(
+            self.spot_intensity, size=(batch_size, self.number_of_spots)
+        )
+        y = np.clip(spot_y[..., None] + self._spot_dy, 0, height - 1)
+        x = np.clip(spot_x[..., None] + self._spot_dx, 0, width - 1)
+        values = np.rint(intensities[..., None] * self._spot_profile).astype(np.uint32)
+        frame_index = np.arange(batch_size)[:, None, None]
+        np.add.at(counts.reshape(batch_size, -1), (frame_index, y * width + x), values)
+
+        np.minimum(counts, self.saturation_value, out=counts)
+        frames = counts.astype(self.dtype, copy=False)
+        frames[:, self.gap_mask] = self.masked_value
+        return frames
+
+    def generate(
+        self, number_of_frames: int, batch_size: int | None = None
+    ) -> Iterator[npt.NDArray]:
+        """
+        Generates frames in batches
+
+        Parameters
+        ----------
+        number_of_frames : int
+            Total number of frames
+        batch_size : int | None, optional
+            Number of frames per batch. If None, the batch size is chosen to
+            bound the temporary memory used to generate a batch
+
+        Returns
+        -------
+        Iterator[npt.NDArray]
+            Batches of frames, each a (batch_size, y, x) array
+        """
+        if batch_size is None:
+            batch_size = max(1, _MAX_BATCH_PIXELS // (self.shape[0] * self.shape[1]))
+        for first_frame in range(0, number_of_frames, batch_size):
+            yield self.generate_batch(min(batch_size, number_of_frames - first_frame))
+
+    def header(self, number_of_images: int) -> tuple[dict, dict, dict]:
+        """
+        Generates the Dectris stream2 message structure matching the
+        synthetic frames, without a master file (see `Parse.header`)
+
+        Parameters
+        ----------
+        number_of_images : int
+            Number of images in a series
+
+        Returns
+        -------
+        start_message, image_message, end_message : tuple[dict, dict, dict]
+            Three dictionaries corresponding to the stream2
+            message structure.
+        """
+        start_message = {
+            "type": "start",
+            "arm_date": datetime.now(tz=timezone.utc).isoformat(),
+            "beam_center_x": self.shape[1] / 2,
+            "beam_center_y": self.shape[0] / 2,
+            "channels": ["1"],
+            "countrate_correction_lookup_table": None,
+            "detector_description": f"Simulated EIGER2 {self.detector_size}",
+            "detector_serial_number": "SIMULATED",
+            "flatfield": None,
+            "image_dtype": str(self.dtype),
+            "image_size_x": self.shape[1],
+            "image_size_y": self.shape[0],
+            "number_of_images": number_of_images,
+            "pixel_mask": None,
+            "saturation_value": self.saturation_value,
+            "series_id": None,  # int
+            "series_unique_id": None,  # str
+            "user_data": {"pi": float(np.pi)},
+        }
+        return start_message, Parse.image_message(), Parse.end_message()
@@ -0,0 +1,506 @@
+"""
+Benchmarks of the load, compress, encode and send stages of the simulated
+SIMPLON API.
+
+Frames are generated with the synthetic frame generator, so the benchmarks run
+offline without any dataset. Results are written to a JSON file, and can be
+compared with the results of a previous run:
+
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --output new.json --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timezone
+from importlib.metadata import version
+
+# The simulator creates a ZmqStream when it is imported. Configure it so that
+# it does not need a master file and does not bind a TCP port
+os.environ.setdefault("AS_ZMQ_ADDRESS", "inproc://benchmark-default")
+os.environ.setdefault("AS_SYNTHETIC_DETECTOR", "1M")
+os.environ.setdefault("AS_SYNTHETIC_NUMBER_OF_FRAMES", "1")
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import zmq  # noqa: E402
+
+from ansto_simplon_api import __version__  # noqa: E402
+from ansto_simplon_api.compression import (  # noqa: E402
+    compress_frame,
+    compression_header,
+    decompress_frame,
+)
+from ansto_simplon_api.simulate_zmq_stream import ZmqStream  # noqa: E402
+from ansto_simplon_api.synthetic_frames import SyntheticFrameGenerator  # noqa: E402
+
+TRANSPORTS = {
+    "inproc": "inproc://benchmark",
+    "tcp": "tcp://127.0.0.1:*",
+}
+
+
+def time_repeats(function: Callable[[], object], repeat: int) -> list[float]:
+    """
+    Times a function
+
+    Parameters
+    ----------
+    function : Callable[[], object]
+        The function
+    repeat : int
+        Number of times the function is called
+
+    Returns
+    -------
+    list[float]
+        The duration of each call [seconds]
+    """
+    durations = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - t)
+    return durations
+
+
+def summarise(
+    durations: list[float], number_of_frames: int, frame_nbytes: int | None
+) -> dict:
+    """
+    Summarises the durations of the repeats of a benchmark which processes
+    `number_of_frames` frames per repeat
+
+    Parameters
+    ----------
+    durations : list[float]
+        The duration of each repeat [seconds]
+    number_of_frames : int
+        Number of frames processed per repeat
+    frame_nbytes : int | None
+        Uncompressed size of a frame, used to compute the throughput in MB/s
+
+    Returns
+    -------
+    dict
+        The median and best time per frame, and the corresponding throughput
+    """
+    median_time = statistics.median(durations) / number_of_frames
+    result = {
+        "repeats": len(durations),
+        "frames_per_repeat": number_of_frames,
+        "median_seconds_per_frame": median_time,
+        "min_seconds_per_frame": min(durations) / number_of_frames,
+        "frames_per_second": 1 / median_time,
+    }
+    if frame_nbytes is not None:
+        result["megabytes_per_second"] = frame_nbytes / median_time / 1e6
+    return result
+
+
+def benchmark_stages(
+    stream: ZmqStream,
+    detector_size: str,
+    dtype: str,
+    compression: str,
+    number_of_frames: int,
+    repeat: int,
+) -> list[dict]:
+    """
+    Benchmarks frame generation, compression, CBOR encoding and loading into
+    the frame arena for one frame geometry
+
+    Parameters
+    ----------
+    stream : ZmqStream
+        The stream used to encode and load frames
+    detector_size : str
+        Detector size of the synthetic frames
+    dtype : str
+        Data type of the frames
+    compression : str
+        Compression type
+    number_of_frames : int
+        Number of frames per repeat
+    repeat : int
+        Number of repeats
+
+    Returns
+    -------
+    list[dict]
+        The results
+    """
+    params = {
+        "detector_size": detector_size,
+        "dtype": dtype,
+        "compression": compression,
+    }
+    generator = SyntheticFrameGenerator(detector_size, dtype, seed=0)
+    frames = generator.generate_batch(number_of_frames)
+    results = []
+
+    durations = time_repeats(lambda: generator.generate_batch(number_of_frames), repeat)
+    results.append(
+        {
+            "benchmark": "generate",
+            "params": params,
+            **summarise(durations, number_of_frames, generator.frame_nbytes),
+        }
+    )
+
+    compressed_frames = [compress_frame(frame, compression) for frame in frames]
+    durations = time_repeats(
+        lambda: [compress_frame(frame, compression) for frame in frames], repeat
+    )
+    compressed_nbytes = sum(len(frame) for frame in compressed_frames)
+    results.append(
+        {
+            "benchmark": "compress",
+            "params": params,
+            "compression_ratio": frames.nbytes / compressed_nbytes,
+            **summarise(durations, number_of_frames, generator.frame_nbytes),
+        }
+    )
+
+    # Compressed frames are decompressed as received, i.e. with the bytes-header
+    received_frames = compressed_frames
+    if compression != "none":
+        received_frames = [
+            compression_header(compression, frame.nbytes, frame.itemsize) + compressed
+            for frame, compressed in zip(frames, compressed_frames)
+        ]
+    durations = time_repeats(
+        lambda: [
+            decompress_frame(received, compression, dtype, generator.shape)
+            for received in received_frames
+        ],
+        repeat,
+    )
+    results.append(
+        {
+            "benchmark": "decompress",
+            "params": params,
+            **summarise(durations, number_of_frames, generator.frame_nbytes),
+        }
+    )
+
+    def load() -> None:
+        stream.create_synthetic_frames(
+            detector_size, dtype, number_of_frames, compression
+        )
+
+    durations = time_repeats(load, repeat)
+    # tracemalloc slows down allocations, so the peak memory is measured
+    # separately from the duration
+    stream.frames = None
+    tracemalloc.start()
+    load()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append(
+        {
+            "benchmark": "load",
+            "params": params,
+            "frame_arena_bytes": stream.frames.footprint,
+            "peak_traced_memory_bytes": peak_memory,
+            **summarise(durations, number_of_frames, generator.frame_nbytes),
+        }
+    )
+
+    # Encoding the payload uses the image message of the loaded dataset
+    durations = time_repeats(
+        lambda: [
+            stream._encode_frame(
+                frame,
+                includes_header=False,
+                dtype=dtype,
+                shape=generator.shape,
+                compressed_image=compression != "none",
+            )
+            for frame in compressed_frames
+        ],
+        repeat,
+    )
+    results.append(
+        {
+            "benchmark": "encode_payload",
+            "params": params,
+            **summarise(durations, number_of_frames, generator.frame_nbytes),
+        }
+    )
+    return results
+
+
+def benchmark_send(
+    stream: ZmqStream,
+    transport: str,
+    detector_size: str,
+    dtype: str,
+    compression: str,
+    number_of_frames: int,
+    series_length: int,
+    repeat: int,
+) -> dict:
+    """
+    Benchmarks sending a series (start message, images and end message) into
+    a PULL socket received on a separate thread of the same process. The
+    unique frames are sent cyclically, and a first series is sent to
+    establish the connection before the series are timed
+
+    Parameters
+    ----------
+    stream : ZmqStream
+        The stream, bound to a single address
+    transport : str
+        Name of the transport, e.g. "inproc"
+    detector_size : str
+        Detector size of the synthetic frames
+    dtype : str
+        Data type of the frames
+    compression : str
+        Compression type
+    number_of_frames : int
+        Number of unique frames
+    series_length : int
+        Number of frames per series
+    repeat : int
+        Number of series sent
+
+    Returns
+    -------
+    dict
+        The result
+    """
+    stream.create_synthetic_frames(detector_size, dtype, number_of_frames, compression)
+    stream.number_of_frames_per_trigger = series_length
+    stream.delay_between_frames = 0
+    stream.pace_with_frame_time = False
+    socket = stream.context.socket(zmq.PULL)
+    socket.connect(stream.sockets[0].getsockopt_string(zmq.LAST_ENDPOINT))
+
+    received_nbytes = 0
+
+    def receive() -> None:
+        nonlocal received_nbytes
+        for _ in range(series_length + 2):
+            received_nbytes += len(socket.recv(copy=False))
+
+    def send_series() -> None:
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        stream.start_stream()
+        receiver.join()
+
+    try:
+        send_series()
+        received_nbytes = 0
+        durations = time_repeats(send_series, repeat)
+    finally:
+        socket.close(linger=0)
+    frame_nbytes = received_nbytes / (repeat * (series_length + 2))
+    return {
+        "benchmark": "send",
+        "params": {
+            "transport": transport,
+            "detector_size": detector_size,
+            "dtype": dtype,
+            "compression": compression,
+        },
+        "message_bytes": frame_nbytes,
+        **summarise(durations, series_length, int(frame_nbytes)),
+    }
+
+
+def benchmark_encode_header(stream: ZmqStream, repeat: int) -> dict:
+    """
+    Benchmarks the encoding of the per-frame image message header
+
+    Parameters
+    ----------
+    stream : ZmqStream
+        The stream
+    repeat : int
+        Number of repeats
+
+    Returns
+    -------
+    dict
+        The result
+    """
+    number_of_frames = 10_000
+    series = stream._capture_series()
+    durations = time_repeats(
+        lambda: [stream._encode_image_header(series) for _ in range(number_of_frames)],
+        repeat,
+    )
+    return {
+        "benchmark": "encode_header",
+        "params": {},
+        **summarise(durations, number_of_frames, None),
+    }
+
+
+def get_metadata() -> dict:
+    """
+    Describes the machine and software versions the benchmarks ran on
+
+    Returns
+    -------
+    dict
+        The metadata
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now(tz=timezone.utc).isoformat(),
+        "ansto_simplon_api": __version__,
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "packages": {
+            package: version(package)
+            for package in ("numpy", "pyzmq", "cbor2", "bitshuffle", "h5py")
+        },
+    }
+
+
+def result_key(result: dict) -> str:
+    params = ", ".join(f"{key}={val}" for key, val in sorted(result["params"].items()))
+    return f"{result['benchmark']}({params})"
+
+
+def compare(results: list[dict], baseline_results: list[dict]) -> None:
+    """
+    Prints the speedup of every benchmark relative to a previous run
+
+    Parameters
+    ----------
+    results : list[dict]
+        Results of this run
+    baseline_results : list[dict]
+        Results of the previous run
+
+    Returns
+    -------
+    None
+    """
+    baseline = {result_key(result): result for result in baseline_results}
+    print(f"{'benchmark':<80} {'baseline':>12} {'new':>12} {'speedup':>8}")
+    for result in results:
+        key = result_key(result)
+        if key not in baseline:
+            continue
+        old = baseline[key]["frames_per_second"]
+        new = result["frames_per_second"]
+        print(f"{key:<80} {old:>12.1f} {new:>12.1f} {new / old:>7.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--detector-sizes", nargs="+", default=["1M", "4M"], help="Frame geometries"
+    )
+    parser.add_argument(
+        "--dtypes",
+        nargs="+",
+        default=["uint16", "uint32"],
+        choices=["uint16", "uint32"],
+    )
+    parser.add_argument(
+        "--compressions",
+        nargs="+",
+        default=["bslz4", "lz4", "none"],
+        choices=["bslz4", "lz4", "none"],
+    )
+    parser.add_argument(
+        "--transports", nargs="+", default=list(TRANSPORTS), choices=list(TRANSPORTS)
+    )
+    parser.add_argument(
+        "--number-of-frames", type=int, default=10, help="Frames per repeat"
+    )
+    parser.add_argument(
+        "--series-length", type=int, default=200, help="Frames per sent series"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats per benchmark")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Results of a previous run")
+    args = parser.parse_args()
+
+    streams = {
+        transport: ZmqStream(
+            address=address,
+            hdf5_file_path=None,
+            delay_between_frames=0,
+            synthetic_detector="1M",
+            synthetic_number_of_frames=1,
+        )
+        for transport, address in TRANSPORTS.items()
+        if transport in args.transports
+    }
+    load_stream = ZmqStream(
+        address="inproc://benchmark-load",
+        hdf5_file_path=None,
+        synthetic_detector="1M",
+        synthetic_number_of_frames=1,
+    )
+
+    for stream in [load_stream, *streams.values()]:
+        stream.warm_up()
+
+    results = [benchmark_encode_header(load_stream, args.repeat)]
+    for detector_size in args.detector_sizes:
+        for dtype in args.dtypes:
+            for compression in args.compressions:
+                print(f"Benchmarking {detector_size} {dtype} {compression}...")
+                results += benchmark_stages(
+                    load_stream,
+                    detector_size,
+                    dtype,
+                    compression,
+                    args.number_of_frames,
+                    args.repeat,
+                )
+                for transport, stream in streams.items():
+                    results.append(
+                        benchmark_send(
+                            stream,
+                            transport,
+                            detector_size,
+                            dtype,
+                            compression,
+                            args.number_of_frames,
+                            args.series_length,
+                            args.repeat,
+                        )
+                    )
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for result in results:
+        print(f"{result_key(result):<80} {result['frames_per_second']:>12.1f} frames/s")
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
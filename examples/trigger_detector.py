@@ -1,3 +1,5 @@
+import time
+
 import requests
 
 REST = "http://0.0.0.0:8000"
@@ -24,6 +26,14 @@ print(f"{'-' * 20} Trigger detector {'-' * 20}")
 r = requests.put(f"{REST}/detector/api/1.8.0/command/trigger")
 print(r)
 
+# The trigger command returns immediately, frames are sent in the background
+while (
+    requests.get(f"{REST}/detector/api/1.8.0/status/state").json()["value"] == "acquire"
+):
+    r = requests.get(f"{REST}/ansto_endpoints/stream_progress")
+    print(r.json())
+    time.sleep(0.5)
+
 
 print(f"{'-' * 20} Disarm detector {'-' * 20}")
 r = requests.put(f"{REST}/detector/api/1.8.0/command/disarm")
@@ -0,0 +1,53 @@
+import os
+import socket
+import time
+
+import pytest
+import zmq
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def zmq_address() -> str:
+    return f"tcp://127.0.0.1:{_free_port()}"
+
+
+@pytest.fixture(scope="session")
+def client(zmq_address, tmp_path_factory):
+    """
+    Client of the app streaming small synthetic frames. The app reads its
+    settings when it is imported, so the environment is set up first
+    """
+    os.environ.update(
+        AS_ZMQ_ADDRESS=zmq_address,
+        AS_DELAY_BETWEEN_FRAMES="0",
+        AS_SYNTHETIC_DETECTOR="1M",
+        AS_SYNTHETIC_DTYPE="uint16",
+        AS_SYNTHETIC_NUMBER_OF_FRAMES="3",
+        AS_FILEWRITER_DIR=str(tmp_path_factory.mktemp("filewriter")),
+    )
+    from fastapi.testclient import TestClient
+
+    from ansto_simplon_api.main import app
+
+    with TestClient(app) as client:
+        for _ in range(600):
+            state = client.get("/detector/api/1.8.0/status/state").json()["value"]
+            if state != "initialize":
+                break
+            time.sleep(0.1)
+        yield client
+
+
+@pytest.fixture
+def receiver(zmq_address):
+    context = zmq.Context.instance()
+    socket = context.socket(zmq.PULL)
+    socket.connect(zmq_address)
+    yield socket
+    socket.close(linger=0)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from ansto_simplon_api.compression import (
+    compress_frame,
+    compression_header,
+    decompress_frame,
+)
+
+
+def _frame(dtype: str) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    frame = rng.poisson(2, size=(64, 96)).astype(dtype)
+    # Masked pixels
+    frame[10, :] = np.iinfo(dtype).max
+    return frame
+
+
+def _encode(frame: np.ndarray, compression: str, block_size: int = 0) -> bytes:
+    data = compress_frame(frame, compression, block_size)
+    if compression == "none":
+        return data
+    header = compression_header(
+        compression, frame.nbytes, frame.dtype.itemsize, block_size
+    )
+    return header + data
+
+
+@pytest.mark.parametrize("compression", ["bslz4", "lz4", "none"])
+@pytest.mark.parametrize("dtype", ["uint16", "uint32"])
+def test_round_trip(compression, dtype):
+    frame = _frame(dtype)
+    decoded = decompress_frame(
+        _encode(frame, compression), compression, frame.dtype, frame.shape
+    )
+    assert decoded.dtype == frame.dtype
+    np.testing.assert_array_equal(decoded, frame)
+
+
+@pytest.mark.parametrize("block_size", [0, 256, 4096])
+def test_bslz4_block_size(block_size):
+    frame = _frame("uint32")
+    data = _encode(frame, "bslz4", block_size)
+    np.testing.assert_array_equal(
+        decompress_frame(data, "bslz4", frame.dtype, frame.shape), frame
+    )
+
+
+def test_lz4_incompressible_frame():
+    # Blocks which do not compress are stored uncompressed
+    frame = np.random.default_rng(0).integers(0, 2**32, (32, 32), dtype=np.uint32)
+    data = _encode(frame, "lz4")
+    np.testing.assert_array_equal(
+        decompress_frame(data, "lz4", frame.dtype, frame.shape), frame
+    )
+
+
+def test_compression_is_case_insensitive():
+    frame = _frame("uint16")
+    assert compress_frame(frame, "BSLZ4") == compress_frame(frame, "bslz4")
+
+
+def test_invalid_compression():
+    with pytest.raises(NotImplementedError):
+        compress_frame(_frame("uint16"), "zstd")
+
+
+def test_invalid_block_size():
+    with pytest.raises(ValueError):
+        compress_frame(_frame("uint16"), "bslz4", block_size=12)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from ansto_simplon_api.frame_arena import FrameArena, FrameArenaBuilder
+
+PAYLOADS = [bytes([ii + 1]) * (100 + 37 * ii) for ii in range(5)]
+
+
+def test_builder_round_trip():
+    # A small initial capacity, so that the buffer grows while appending
+    builder = FrameArenaBuilder(header_slot_size=32, capacity=16)
+    for payload in PAYLOADS:
+        builder.append(payload)
+    assert len(builder) == len(PAYLOADS)
+    arena = builder.build()
+    assert len(arena) == len(PAYLOADS)
+    assert arena.nbytes == sum(32 + len(payload) for payload in PAYLOADS)
+    assert [bytes(arena.payload(ii)) for ii in range(len(arena))] == PAYLOADS
+
+
+def test_payload_is_read_only():
+    arena = FrameArena.from_payloads(PAYLOADS, header_slot_size=32)
+    with pytest.raises(TypeError):
+        arena.payload(0)[0] = 0
+
+
+def test_write_message():
+    arena = FrameArena.from_payloads(PAYLOADS, header_slot_size=32)
+    message = arena.write_message(2, b"header")
+    assert bytes(message) == b"header" + PAYLOADS[2]
+    # A shorter header is right-aligned against the payload
+    assert bytes(arena.write_message(2, b"hdr")) == b"hdr" + PAYLOADS[2]
+    assert bytes(arena.payload(2)) == PAYLOADS[2]
+
+
+def test_write_message_header_too_large():
+    arena = FrameArena.from_payloads(PAYLOADS, header_slot_size=4)
+    with pytest.raises(ValueError):
+        arena.write_message(0, b"header")
+
+
+def test_copy_message_does_not_modify_the_arena():
+    arena = FrameArena.from_payloads(PAYLOADS, header_slot_size=32)
+    buffer = arena.buffer.copy()
+    message = arena.copy_message(1, b"header")
+    assert bytes(message) == b"header" + PAYLOADS[1]
+    np.testing.assert_array_equal(arena.buffer, buffer)
+
+
+def test_wait_without_sends():
+    arena = FrameArena.from_payloads(PAYLOADS)
+    assert not arena.is_in_flight(0)
+    assert arena.wait()
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from ansto_simplon_api.frame_arena import FrameArena, FrameArenaBuilder
+from ansto_simplon_api.frame_cache import FrameCache
+
+PAYLOADS = [bytes([ii + 1]) * (1000 + 37 * ii) for ii in range(4)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FrameCache(tmp_path / "cache", max_bytes=10**6)
+
+
+@pytest.fixture
+def master_file(tmp_path):
+    path = tmp_path / "series_master.h5"
+    path.write_bytes(b"master")
+    return path
+
+
+def test_store_and_load(cache):
+    arena = FrameArena.from_payloads(PAYLOADS, header_slot_size=32)
+    cache.store("key", arena, {"name": "series"})
+    loaded = cache.load("key")
+    assert loaded.header_slot_size == 32
+    assert [bytes(loaded.payload(ii)) for ii in range(len(loaded))] == PAYLOADS
+    # Headers are written to a private copy of the cache file
+    assert bytes(loaded.write_message(0, b"header")) == b"header" + PAYLOADS[0]
+    assert bytes(cache.load("key").payload(0)) == PAYLOADS[0]
+    [entry] = cache.entries()
+    assert entry["key"] == "key"
+    assert entry["name"] == "series"
+
+
+def test_load_missing(cache):
+    assert cache.load("missing") is None
+
+
+def test_cache_files_are_deterministic(cache):
+    # The header slots hold the last headers written, or uninitialised bytes
+    builder = FrameArenaBuilder(header_slot_size=32)
+    builder._buffer[:] = 0xFF
+    for payload in PAYLOADS:
+        builder.append(payload)
+    arena = builder.build()
+    arena.write_message(1, b"header")
+    cache.store("a", arena, {})
+    cache.store("b", FrameArena.from_payloads(PAYLOADS, header_slot_size=32), {})
+    assert (cache.cache_dir / "a.frames").read_bytes() == (
+        cache.cache_dir / "b.frames"
+    ).read_bytes()
+
+
+def test_corrupted_file(cache):
+    cache.store("key", FrameArena.from_payloads(PAYLOADS), {})
+    path = next(cache.cache_dir.iterdir())
+    path.write_bytes(path.read_bytes()[:-4])
+    assert cache.entries() == []
+    assert cache.load("key") is None
+    assert not path.exists()
+
+
+def test_eviction(tmp_path):
+    arena = FrameArena.from_payloads(PAYLOADS)
+    cache = FrameCache(tmp_path / "cache", max_bytes=10**6)
+    cache.store("old", arena, {})
+    file_size = cache.size
+    os.utime(cache.cache_dir / "old.frames", (0, 0))
+    cache.max_bytes = 2 * file_size
+    cache.store("new", arena, {})
+    cache.store("newest", arena, {})
+    assert cache.load("old") is None
+    assert cache.load("new") is not None
+    assert cache.size <= cache.max_bytes
+
+
+def test_dataset_larger_than_the_cache(tmp_path):
+    cache = FrameCache(tmp_path / "cache", max_bytes=100)
+    cache.store("key", FrameArena.from_payloads(PAYLOADS), {})
+    assert cache.load("key") is None
+
+
+def test_key(master_file, tmp_path):
+    data_file = tmp_path / "series_data_000001.h5"
+    data_file.write_bytes(b"data")
+    key = FrameCache.key(master_file, [data_file], "bslz4", 1)
+    assert key == FrameCache.key(master_file, [data_file], "bslz4", 1)
+    assert key != FrameCache.key(master_file, [data_file], "lz4", 1)
+    assert key != FrameCache.key(master_file, [data_file], "bslz4", 1, block_size=8)
+    assert key != FrameCache.key(
+        master_file, [data_file], "bslz4", 1, direct_chunk_read=False
+    )
+    data_file.write_bytes(b"modified data")
+    assert key != FrameCache.key(master_file, [data_file], "bslz4", 1)
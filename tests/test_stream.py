@@ -0,0 +1,85 @@
+import cbor2
+import h5py
+import hdf5plugin  # noqa
+import numpy as np
+import zmq
+
+from ansto_simplon_api.compression import decompress_frame
+
+NUMBER_OF_IMAGES = 5
+
+
+def _receive(
+    socket: zmq.Socket, number_of_messages: int, timeout: int = 5000
+) -> list[dict]:
+    messages = []
+    while len(messages) < number_of_messages and socket.poll(timeout):
+        messages.append(cbor2.loads(socket.recv()))
+    return messages
+
+
+def _decode(image_message: dict, channel: str = "threshold_1") -> np.ndarray:
+    shape, contents = image_message["data"][channel].value
+    dtype = {69: np.uint16, 70: np.uint32}[contents.tag]
+    if isinstance(contents.value, bytes):
+        return decompress_frame(contents.value, "none", dtype, shape)
+    compression, _, data = contents.value.value
+    return decompress_frame(data, compression, dtype, shape)
+
+
+def _stream_series(client, receiver) -> list[dict]:
+    client.put("/detector/api/1.8.0/config/nimages", json={"value": NUMBER_OF_IMAGES})
+    assert client.put("/detector/api/1.8.0/command/arm").status_code == 200
+    assert client.put("/detector/api/1.8.0/command/trigger").status_code == 200
+    messages = _receive(receiver, 1 + NUMBER_OF_IMAGES)
+    # The end message is sent when the detector is disarmed
+    assert client.put("/detector/api/1.8.0/command/disarm").status_code == 200
+    return messages + _receive(receiver, 1)
+
+
+def test_stream(client, receiver):
+    messages = _stream_series(client, receiver)
+    assert [message["type"] for message in messages] == (
+        ["start"] + ["image"] * NUMBER_OF_IMAGES + ["end"]
+    )
+    start, *images, end = messages
+    assert [image["image_id"] for image in images] == list(range(NUMBER_OF_IMAGES))
+    assert {image["series_id"] for image in images} == {start["series_id"]}
+    assert end["series_id"] == start["series_id"]
+
+    frames = [_decode(image) for image in images]
+    assert frames[0].shape == (start["image_size_y"], start["image_size_x"])
+    assert frames[0].dtype == np.uint16
+    # The 3 synthetic frames are streamed cyclically
+    np.testing.assert_array_equal(frames[3], frames[0])
+    assert not np.array_equal(frames[1], frames[0])
+
+    progress = client.get("/ansto_endpoints/stream_progress").json()
+    assert progress["frames_sent"] == NUMBER_OF_IMAGES
+
+
+def test_filewriter(client, receiver):
+    client.put("/filewriter/api/1.8.0/config/mode", json={"value": "enabled"})
+    client.put("/filewriter/api/1.8.0/config/nimages_per_file", json={"value": 2})
+    try:
+        messages = _stream_series(client, receiver)
+    finally:
+        client.put("/filewriter/api/1.8.0/config/mode", json={"value": "disabled"})
+    from ansto_simplon_api.simulate_zmq_stream import zmq_stream
+
+    zmq_stream.filewriter.wait()
+    assert client.get("/filewriter/api/1.8.0/status/state").json()["value"] != "error"
+    start, *images, _ = messages
+    master_file_path = zmq_stream.filewriter.directory / (
+        f"series_{start['series_id']}_master.h5"
+    )
+    with h5py.File(master_file_path) as master_file:
+        data = master_file["entry/data"]
+        datasets = [data[key] for key in sorted(data)]
+        assert [dataset.shape[0] for dataset in datasets] == [2, 2, 1]
+        assert [dataset.attrs["image_nr_low"] for dataset in datasets] == [1, 3, 5]
+        assert [dataset.attrs["image_nr_high"] for dataset in datasets] == [2, 4, 5]
+        written = np.concatenate([dataset[()] for dataset in datasets])
+    np.testing.assert_array_equal(
+        written, np.stack([_decode(image) for image in images])
+    )